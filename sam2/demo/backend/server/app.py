@@ -3,8 +3,9 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import contextlib
 import logging
-from typing import Any, Generator
+from typing import Any, Callable, Generator, List
 
 from app_conf import (
     GALLERY_PATH,
@@ -14,12 +15,18 @@ from app_conf import (
     UPLOADS_PATH,
     UPLOADS_PREFIX,
 )
-from data.loader import preload_data
+from data.loader import ensure_poster, preload_data
 from data.schema import schema
 from data.store import set_videos
 from flask import Flask, make_response, Request, request, Response, send_from_directory
 from flask_cors import CORS
 from inference.data_types import PropagateDataResponse, PropagateInVideoRequest
+from inference.mask_stream import (
+    batch_frames,
+    DEFAULT_FRAMES_PER_PART,
+    get_stream_encoder,
+    get_stream_headers,
+)
 from inference.multipart import MultipartResponseBuilder
 from inference.predictor import InferenceAPI
 from strawberry.flask.views import GraphQLView
@@ -53,6 +60,8 @@ def send_gallery_video(path: str) -> Response:
 
 @app.route(f"/{POSTERS_PREFIX}/<path:path>", methods=["GET"])
 def send_poster_image(path: str) -> Response:
+    # posters of new gallery videos are generated in the background
+    ensure_poster(path)
     try:
         return send_from_directory(
             POSTERS_PATH,
@@ -80,10 +89,19 @@ def propagate_in_video() -> Response:
     args = {
         "session_id": data["session_id"],
         "start_frame_index": data.get("start_frame_index", 0),
+        # the client can negotiate a binary stream format (see `STREAM_FORMATS`),
+        # batching several frames into one part
+        "format": data.get("format", "json"),
+        "frames_per_part": data.get("frames_per_part", DEFAULT_FRAMES_PER_PART),
     }
 
+    try:
+        encoder = get_stream_encoder(args["format"])
+    except ValueError as e:
+        return make_response(str(e), 400)
+
     boundary = "frame"
-    frame = gen_track_with_mask_stream(boundary, **args)
+    frame = gen_track_with_mask_stream(boundary, encoder=encoder, **args)
     return Response(frame, mimetype="multipart/x-savi-stream; boundary=" + boundary)
 
 
@@ -91,25 +109,32 @@ def gen_track_with_mask_stream(
     boundary: str,
     session_id: str,
     start_frame_index: int,
+    format: str,
+    frames_per_part: int,
+    encoder: Callable[[List[PropagateDataResponse]], bytes],
 ) -> Generator[bytes, None, None]:
-    with inference_api.autocast_context():
-        request = PropagateInVideoRequest(
-            type="propagate_in_video",
-            session_id=session_id,
-            start_frame_index=start_frame_index,
-        )
-
-        for chunk in inference_api.propagate_in_video(request=request):
+    request = PropagateInVideoRequest(
+        type="propagate_in_video",
+        session_id=session_id,
+        start_frame_index=start_frame_index,
+    )
+    num_frames_total = inference_api.get_num_propagated_frames(request)
+    if format == "json":
+        # existing clients expect one frame per JSON part
+        frames_per_part = 1
+
+    num_frames_sent = 0
+    # close the propagation as soon as the response is closed (e.g. when the server
+    # fails to write to a disconnected client), which stops its computation
+    frames = inference_api.propagate_in_video(request=request)
+    batches = batch_frames(frames, frames_per_part=max(frames_per_part, 1))
+    with contextlib.closing(batches):
+        for batch in batches:
+            num_frames_sent += len(batch)
             yield MultipartResponseBuilder.build(
                 boundary=boundary,
-                headers={
-                    "Content-Type": "application/json; charset=utf-8",
-                    "Frame-Current": "-1",
-                    # Total frames minus the reference frame
-                    "Frame-Total": "-1",
-                    "Mask-Type": "RLE[]",
-                },
-                body=chunk.to_json().encode("UTF-8"),
+                headers=get_stream_headers(format, num_frames_sent, num_frames_total),
+                body=encoder(batch),
             ).get_message()
 
 
@@ -36,18 +36,70 @@ GALLERY_PREFIX = "gallery"
 # Path where all gallery videos are stored
 GALLERY_PATH = DATA_PATH / GALLERY_PREFIX
 
+# Index of the gallery videos' metadata, to avoid probing them on each start
+GALLERY_INDEX_PATH = DATA_PATH / "gallery_index.json"
+
 # Prefix for uploaded videos
 UPLOADS_PREFIX = "uploads"
 
 # Path where all uploaded videos are stored
 UPLOADS_PATH = DATA_PATH / UPLOADS_PREFIX
 
+# Number of uploaded videos transcoded in parallel (each by an ffmpeg process)
+TRANSCODE_NUM_WORKERS = int(os.getenv("TRANSCODE_NUM_WORKERS", "2"))
+
+# Maximum number of uploaded videos queued or being transcoded; further uploads are
+# rejected until some of them finish
+TRANSCODE_MAX_PENDING_JOBS = int(os.getenv("TRANSCODE_MAX_PENDING_JOBS", "8"))
+
 # Prefix for video posters (1st frame of video)
 POSTERS_PREFIX = "posters"
 
 # Path where all posters are stored
 POSTERS_PATH = DATA_PATH / POSTERS_PREFIX
 
+# Number of seconds without any request after which an inference session expires
+# and is removed (e.g. when its browser tab was closed without closing it). The
+# default is 1 hour.
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+
+# If set, the maximum number of seconds an inference session can live (even if it's
+# kept alive by requests)
+SESSION_MAX_LIFETIME_SECONDS = (
+    float(os.environ["SESSION_MAX_LIFETIME_SECONDS"])
+    if os.getenv("SESSION_MAX_LIFETIME_SECONDS")
+    else None
+)
+
+# If set, the memory budget (in MiB) of all the live inference sessions; the least
+# recently used sessions are evicted when it's exceeded
+SESSION_MEMORY_BUDGET_MB = (
+    float(os.environ["SESSION_MEMORY_BUDGET_MB"])
+    if os.getenv("SESSION_MEMORY_BUDGET_MB")
+    else None
+)
+
+# What to do with the sessions evicted to fit the memory budget: "none" removes
+# them, "host" and "disk" save them into host memory or into files under
+# SESSION_SPILL_PATH respectively, and restore them on their next request
+SESSION_SPILL_MODE = os.getenv("SESSION_SPILL_MODE", "none")
+
+# Number of frames a propagation can compute ahead of the client reading its stream
+# (the propagation pauses when its buffer is full, so a slow client doesn't hold
+# the GPU, and the GPU never waits for the client while the buffer has room)
+PROPAGATION_BUFFER_FRAMES = int(os.getenv("PROPAGATION_BUFFER_FRAMES", "16"))
+
+# Number of frames around the one a user is viewing whose image features are
+# computed in the background (when no other request is running), so that clicks on
+# them don't wait for the image encoder; 0 disables the prefetching
+FEATURE_PREFETCH_FRAMES = int(os.getenv("FEATURE_PREFETCH_FRAMES", "4"))
+
+# Prefix for spilled inference sessions
+SESSIONS_PREFIX = "sessions"
+
+# Path where the spilled inference sessions are stored
+SESSION_SPILL_PATH = DATA_PATH / SESSIONS_PREFIX
+
 # Make sure any of those paths exist
 os.makedirs(DATA_PATH, exist_ok=True)
 os.makedirs(GALLERY_PATH, exist_ok=True)
@@ -42,6 +42,20 @@ class Video(relay.Node):
         return resolve_videos(node_ids, required)
 
 
+@strawberry.type
+class UploadJob:
+    """Status of a video upload processed in the background."""
+
+    job_id: str
+    # "queued", "running", "done" or "failed"
+    status: str
+    # fraction of the video transcoded so far (between 0 and 1)
+    progress: float
+    error: Optional[str]
+    # the uploaded video, once the job is done
+    video: Optional[Video]
+
+
 @strawberry.type
 class RLEMask:
     """Core type for Onevision GraphQL RLE mask."""
@@ -97,6 +111,13 @@ class CloseSession:
     success: bool
 
 
+@strawberry.input
+class RenewSessionInput:
+    session_id: str
+    # the frame the client is viewing, around which the video is prepared first
+    frame_index: Optional[int] = None
+
+
 @strawberry.input
 class AddPointsInput:
     session_id: str
@@ -150,5 +171,5 @@ class CancelPropagateInVideo:
 class SessionExpiration:
     session_id: str
     expiration_time: int
-    max_expiration_time: int
+    max_expiration_time: Optional[int]
     ttl: int
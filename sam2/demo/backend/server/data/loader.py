@@ -3,22 +3,40 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import json
+import logging
 import os
 import shutil
 import subprocess
 from glob import glob
 from pathlib import Path
-from typing import Dict, Optional
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
 
 import imagesize
-from app_conf import GALLERY_PATH, POSTERS_PATH, POSTERS_PREFIX
+from app_conf import GALLERY_INDEX_PATH, GALLERY_PATH, POSTERS_PATH, POSTERS_PREFIX
 from data.data_types import Video
-from tqdm import tqdm
+from data.transcoder import get_video_metadata
+
+logger = logging.getLogger(__name__)
+
+
+# guards the gallery index and the poster generation (from the background thread
+# and the poster requests)
+_POSTERS_LOCK = Lock()
+# poster filename -> video path of the gallery videos, to generate posters lazily
+_POSTER_SOURCES: Dict[str, str] = {}
 
 
 def preload_data() -> Dict[str, Video]:
     """
     Preload data including gallery videos and their posters.
+
+    The size of each video is read from the gallery index (see `GALLERY_INDEX_PATH`)
+    if the video is unchanged since it was indexed (i.e. same mtime and size), and
+    probed otherwise. The posters of new or changed videos are generated in a
+    background thread (or on demand when they're requested first, see
+    `ensure_poster`), so this doesn't depend on the number of videos to index.
     """
     # Dictionaries for videos and datasets on the backend.
     # Note that since Python 3.7, dictionaries preserve their insert order, so
@@ -29,13 +47,125 @@ def preload_data() -> Dict[str, Video]:
     video_path_pattern = os.path.join(GALLERY_PATH, "**/*.mp4")
     video_paths = glob(video_path_pattern, recursive=True)
 
-    for p in tqdm(video_paths):
-        video = get_video(p, GALLERY_PATH)
-        all_videos[video.code] = video
+    index = _load_gallery_index()
+    new_index = {}
+    missing_posters = []
+    for p in video_paths:
+        video_path = os.path.relpath(p, GALLERY_PATH.parent)
+        poster_filename, poster_path = _get_poster_filename_and_path(p)
+        stat = os.stat(p)
+        entry = index.get(video_path, None)
+        if (
+            entry is None
+            or entry["mtime"] != stat.st_mtime
+            or entry["size"] != stat.st_size
+        ):
+            # new or changed video
+            metadata = get_video_metadata(p)
+            entry = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "width": metadata.width,
+                "height": metadata.height,
+            }
+            missing_posters.append(p)
+        elif not os.path.exists(os.path.join(POSTERS_PATH, poster_filename)):
+            missing_posters.append(p)
+        new_index[video_path] = entry
+        _POSTER_SOURCES[poster_filename] = p
+        all_videos[video_path] = Video(
+            code=video_path,
+            path=video_path,
+            poster_path=poster_path,
+            width=entry["width"],
+            height=entry["height"],
+        )
+
+    if new_index != index:
+        _save_gallery_index(new_index)
+    if len(missing_posters) > 0:
+        logger.info(f"generating {len(missing_posters)} posters in the background")
+        Thread(
+            target=_generate_posters,
+            args=(missing_posters,),
+            name="poster-generation",
+            daemon=True,
+        ).start()
 
     return all_videos
 
 
+def ensure_poster(poster_filename: str) -> None:
+    """
+    Generate the poster of a gallery video if it doesn't exist yet (e.g. if it's
+    requested before the background generation reached it).
+    """
+    video_path = _POSTER_SOURCES.get(poster_filename, None)
+    poster_output_path = os.path.join(POSTERS_PATH, poster_filename)
+    if video_path is None or os.path.exists(poster_output_path):
+        return
+    _generate_posters([video_path], overwrite=False)
+
+
+def _generate_posters(video_paths: List[str], overwrite: bool = True) -> None:
+    for video_path in video_paths:
+        poster_filename, _ = _get_poster_filename_and_path(video_path)
+        poster_output_path = os.path.join(POSTERS_PATH, poster_filename)
+        with _POSTERS_LOCK:
+            if overwrite or not os.path.exists(poster_output_path):
+                generate_poster(video_path, poster_output_path)
+        # the poster only needs to be generated once
+        overwrite = False
+
+
+def _get_poster_filename_and_path(filepath: os.PathLike) -> Tuple[str, str]:
+    poster_id = os.path.splitext(os.path.basename(filepath))[0]
+    poster_filename = f"{str(poster_id)}.jpg"
+    return poster_filename, f"{POSTERS_PREFIX}/{poster_filename}"
+
+
+def _load_gallery_index() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(GALLERY_INDEX_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_gallery_index(index: Dict[str, Dict[str, Any]]) -> None:
+    # write the index atomically (so that it's never read half-written)
+    tmp_path = f"{GALLERY_INDEX_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, GALLERY_INDEX_PATH)
+
+
+def generate_poster(
+    filepath: os.PathLike, poster_output_path: str, verbose: Optional[bool] = False
+) -> None:
+    """Extract the first frame of a video as its poster."""
+    ffmpeg = shutil.which("ffmpeg")
+    subprocess.call(
+        [
+            ffmpeg,
+            "-y",
+            "-i",
+            str(filepath),
+            "-pix_fmt",
+            "yuv420p",
+            "-frames:v",
+            "1",
+            "-update",
+            "1",
+            "-strict",
+            "unofficial",
+            str(poster_output_path),
+        ],
+        stdout=None if verbose else subprocess.DEVNULL,
+        stderr=None if verbose else subprocess.DEVNULL,
+    )
+
+
 def get_video(
     filepath: os.PathLike,
     absolute_path: Path,
@@ -52,32 +182,11 @@ def get_video(
     video_path = os.path.relpath(filepath, absolute_path.parent)
     poster_path = None
     if generate_poster:
-        poster_id = os.path.splitext(os.path.basename(filepath))[0]
-        poster_filename = f"{str(poster_id)}.jpg"
-        poster_path = f"{POSTERS_PREFIX}/{poster_filename}"
+        poster_filename, poster_path = _get_poster_filename_and_path(filepath)
 
         # Extract the first frame from video
         poster_output_path = os.path.join(POSTERS_PATH, poster_filename)
-        ffmpeg = shutil.which("ffmpeg")
-        subprocess.call(
-            [
-                ffmpeg,
-                "-y",
-                "-i",
-                str(filepath),
-                "-pix_fmt",
-                "yuv420p",
-                "-frames:v",
-                "1",
-                "-update",
-                "1",
-                "-strict",
-                "unofficial",
-                str(poster_output_path),
-            ],
-            stdout=None if verbose else subprocess.DEVNULL,
-            stderr=None if verbose else subprocess.DEVNULL,
-        )
+        generate_poster(filepath, poster_output_path, verbose=verbose)
 
         # Extract video width and height from poster. This is important to optimize
         # rendering previews in the mosaic video preview.
@@ -4,11 +4,12 @@
 # LICENSE file in the root directory of this source tree.
 
 import hashlib
+import json
 import os
 import shutil
 import tempfile
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple, Union
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 
 import av
 import strawberry
@@ -16,6 +17,8 @@ from app_conf import (
     DATA_PATH,
     DEFAULT_VIDEO_PATH,
     MAX_UPLOAD_VIDEO_DURATION,
+    TRANSCODE_MAX_PENDING_JOBS,
+    TRANSCODE_NUM_WORKERS,
     UPLOADS_PATH,
     UPLOADS_PREFIX,
 )
@@ -29,16 +32,25 @@ from data.data_types import (
     CloseSession,
     CloseSessionInput,
     RemoveObjectInput,
+    RenewSessionInput,
     RLEMask,
     RLEMaskForObject,
     RLEMaskListOnFrame,
+    SessionExpiration,
     StartSession,
     StartSessionInput,
+    UploadJob,
     Video,
 )
 from data.loader import get_video
 from data.store import get_videos
-from data.transcoder import get_video_metadata, transcode, VideoMetadata
+from data.transcode_pool import TranscodeJob, TranscodePool
+from data.transcoder import (
+    get_transcode_params,
+    get_video_metadata,
+    transcode,
+    VideoMetadata,
+)
 from inference.data_types import (
     AddPointsRequest,
     CancelPropagateInVideoRequest,
@@ -47,12 +59,18 @@ from inference.data_types import (
     ClearPointsInVideoRequest,
     CloseSessionRequest,
     RemoveObjectRequest,
+    RenewSessionRequest,
     StartSessionRequest,
 )
 from inference.predictor import InferenceAPI
 from strawberry import relay
 from strawberry.file_uploads import Upload
 
+# transcodes the uploaded videos in the background (see `submit_video`)
+transcode_pool = TranscodePool(
+    num_workers=TRANSCODE_NUM_WORKERS, max_pending_jobs=TRANSCODE_MAX_PENDING_JOBS
+)
+
 
 @strawberry.type
 class Query:
@@ -87,6 +105,17 @@ class Query:
         all_videos = get_videos()
         return all_videos.values()
 
+    @strawberry.field
+    def upload_job(self, job_id: str) -> Optional[UploadJob]:
+        """
+        Return the status of a video upload started with `start_upload_video`, or
+        None if the job doesn't exist (anymore).
+        """
+        job = transcode_pool.get_job(job_id)
+        if job is None:
+            return None
+        return _get_upload_job(job)
+
 
 @strawberry.type
 class Mutation:
@@ -109,15 +138,26 @@ class Mutation:
             duration_time_sec=duration_time_sec,
         )
 
-        video = get_video(
-            filepath,
-            UPLOADS_PATH,
-            file_key=file_key,
-            width=vm.width,
-            height=vm.height,
-            generate_poster=False,
+        return _get_uploaded_video(filepath, file_key, vm)
+
+    @strawberry.mutation
+    def start_upload_video(
+        self,
+        file: Upload,
+        start_time_sec: Optional[float] = None,
+        duration_time_sec: Optional[float] = None,
+    ) -> UploadJob:
+        """
+        Receive a video file and process it in the background. The returned job
+        can be polled with the `upload_job` query until its video is available.
+        """
+        job = submit_video(
+            file,
+            max_time=MAX_UPLOAD_VIDEO_DURATION,
+            start_time_sec=start_time_sec,
+            duration_time_sec=duration_time_sec,
         )
-        return video
+        return _get_upload_job(job)
 
     @strawberry.mutation
     def start_session(
@@ -147,6 +187,25 @@ class Mutation:
         response = inference_api.close_session(request)
         return CloseSession(success=response.success)
 
+    @strawberry.mutation
+    def renew_session(
+        self, input: RenewSessionInput, info: strawberry.Info
+    ) -> SessionExpiration:
+        inference_api: InferenceAPI = info.context["inference_api"]
+
+        request = RenewSessionRequest(
+            type="renew_session",
+            session_id=input.session_id,
+            frame_index=input.frame_index,
+        )
+        response = inference_api.renew_session(request)
+        return SessionExpiration(
+            session_id=response.session_id,
+            expiration_time=response.expiration_time,
+            max_expiration_time=response.max_expiration_time,
+            ttl=response.ttl,
+        )
+
     @strawberry.mutation
     def add_points(
         self, input: AddPointsInput, info: strawberry.Info
@@ -256,14 +315,63 @@ class Mutation:
         return CancelPropagateInVideo(success=response.success)
 
 
-def get_file_hash(video_path_or_file) -> str:
-    if isinstance(video_path_or_file, str):
-        with open(video_path_or_file, "rb") as in_f:
-            result = hashlib.sha256(in_f.read()).hexdigest()
-    else:
-        video_path_or_file.seek(0)
-        result = hashlib.sha256(video_path_or_file.read()).hexdigest()
-    return result
+def _get_uploaded_video(
+    filepath: str, file_key: str, video_metadata: VideoMetadata
+) -> Video:
+    return get_video(
+        filepath,
+        UPLOADS_PATH,
+        file_key=file_key,
+        width=video_metadata.width,
+        height=video_metadata.height,
+        generate_poster=False,
+    )
+
+
+def _get_upload_job(job: TranscodeJob) -> UploadJob:
+    video = None
+    if job.status == "done":
+        video = _get_uploaded_video(*job.result())
+    return UploadJob(
+        job_id=job.job_id,
+        status=job.status,
+        progress=job.progress,
+        error=job.error,
+        video=video,
+    )
+
+
+# size of the chunks in which uploads are written to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def write_upload(file: Upload, out_path: str) -> str:
+    """
+    Write an uploaded file to `out_path` in chunks (so that memory stays flat for
+    large uploads) and return the SHA-256 of its content, computed as it's written.
+    """
+    sha256 = hashlib.sha256()
+    with open(out_path, "wb") as out_f:
+        while True:
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            out_f.write(chunk)
+    return sha256.hexdigest()
+
+
+def get_upload_key(
+    source_hash: str, start_time_sec: float, duration_time_sec: float
+) -> str:
+    """
+    Get the name of the transcoded upload, which identifies the source video, the
+    trimming applied to it and the transcoding parameters (so that the same source
+    is never transcoded twice with the same settings).
+    """
+    transcode_params = json.dumps(get_transcode_params(), sort_keys=True)
+    key = f"{source_hash}:{start_time_sec}:{duration_time_sec}:{transcode_params}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 
 def _get_start_sec_duration_sec(
@@ -293,62 +401,135 @@ def process_video(
 
     Returns the filepath, s3_file_key, hash & video metaedata as a tuple.
     """
-    with tempfile.TemporaryDirectory() as tempdir:
-        in_path = f"{tempdir}/in.mp4"
-        out_path = f"{tempdir}/out.mp4"
-        with open(in_path, "wb") as in_f:
-            in_f.write(file.read())
-
-        try:
-            video_metadata = get_video_metadata(in_path)
-        except av.InvalidDataError:
-            raise Exception("not valid video file")
+    job = submit_video(
+        file,
+        max_time=max_time,
+        start_time_sec=start_time_sec,
+        duration_time_sec=duration_time_sec,
+    )
+    return job.result()
 
-        if video_metadata.num_video_streams == 0:
-            raise Exception("video container does not contain a video stream")
-        if video_metadata.width is None or video_metadata.height is None:
-            raise Exception("video container does not contain width or height metadata")
 
-        if video_metadata.duration_sec in (None, 0):
-            raise Exception("video container does time duration metadata")
+def submit_video(
+    file: Upload,
+    max_time: float,
+    start_time_sec: Optional[float] = None,
+    duration_time_sec: Optional[float] = None,
+) -> TranscodeJob:
+    """
+    Write a file upload to disk and queue its processing (see `process_video`) on
+    the transcoding pool. The job id identifies the processed video, so an upload
+    that was already processed (or is being processed) is not transcoded again.
+    """
+    tempdir = tempfile.mkdtemp()
+    try:
+        in_path = f"{tempdir}/in.mp4"
+        source_hash = write_upload(file, in_path)
 
         start_time_sec, duration_time_sec = _get_start_sec_duration_sec(
             max_time=max_time,
             start_time_sec=start_time_sec,
             duration_time_sec=duration_time_sec,
         )
-
-        # Transcode video to make sure videos returned to the app are all in
-        # the same format, duration, resolution, fps.
-        transcode(
-            in_path,
-            out_path,
-            video_metadata,
-            seek_t=start_time_sec,
-            duration_time_sec=duration_time_sec,
+        file_hash = get_upload_key(source_hash, start_time_sec, duration_time_sec)
+        file_key = UPLOADS_PREFIX + "/" + f"{file_hash}.mp4"
+        filepath = os.path.join(UPLOADS_PATH, f"{file_hash}.mp4")
+        job = transcode_pool.get_job(file_hash)
+        if job is not None and job.status != "failed":
+            # the same upload is already being processed (or was processed)
+            shutil.rmtree(tempdir)
+            return job
+        if os.path.exists(filepath):
+            # the same video was already uploaded (with the same trimming and
+            # transcoding parameters), so we can skip transcoding it again (the
+            # uploads are only published once they're complete, see
+            # `_transcode_upload`)
+            result = (filepath, file_key, get_video_metadata(filepath))
+            shutil.rmtree(tempdir)
+            return transcode_pool.put_result(file_hash, result)
+
+        def _process_upload(job: TranscodeJob):
+            def _set_progress(progress: float) -> None:
+                job.progress = progress
+
+            try:
+                out_video_metadata = _transcode_upload(
+                    in_path,
+                    f"{tempdir}/out.mp4",
+                    filepath,
+                    start_time_sec=start_time_sec,
+                    duration_time_sec=duration_time_sec,
+                    progress_callback=_set_progress,
+                )
+            finally:
+                shutil.rmtree(tempdir, ignore_errors=True)
+            return filepath, file_key, out_video_metadata
+
+        job, is_new_job = transcode_pool.submit(file_hash, _process_upload)
+    except BaseException:
+        shutil.rmtree(tempdir, ignore_errors=True)
+        raise
+    if not is_new_job:
+        # the same upload is already being processed
+        shutil.rmtree(tempdir, ignore_errors=True)
+    return job
+
+
+def _transcode_upload(
+    in_path: str,
+    out_path: str,
+    filepath: str,
+    start_time_sec: float,
+    duration_time_sec: float,
+    progress_callback: Optional[Callable[[float], None]] = None,
+) -> VideoMetadata:
+    try:
+        video_metadata = get_video_metadata(in_path)
+    except av.InvalidDataError:
+        raise Exception("not valid video file")
+
+    if video_metadata.num_video_streams == 0:
+        raise Exception("video container does not contain a video stream")
+    if video_metadata.width is None or video_metadata.height is None:
+        raise Exception("video container does not contain width or height metadata")
+
+    if video_metadata.duration_sec in (None, 0):
+        raise Exception("video container does time duration metadata")
+
+    # Transcode video to make sure videos returned to the app are all in
+    # the same format, duration, resolution, fps.
+    transcode(
+        in_path,
+        out_path,
+        video_metadata,
+        seek_t=start_time_sec,
+        duration_time_sec=duration_time_sec,
+        progress_callback=progress_callback,
+    )
+
+    os.remove(in_path)  # don't need original video now
+
+    out_video_metadata = get_video_metadata(out_path)
+    if out_video_metadata.num_video_frames == 0:
+        raise Exception(
+            "transcode produced empty video; check seek time or your input video"
         )
 
-        os.remove(in_path)  # don't need original video now
-
-        out_video_metadata = get_video_metadata(out_path)
-        if out_video_metadata.num_video_frames == 0:
-            raise Exception(
-                "transcode produced empty video; check seek time or your input video"
-            )
-
-        filepath = None
-        file_key = None
-        with open(out_path, "rb") as file_data:
-            file_hash = get_file_hash(file_data)
-            file_data.seek(0)
-
-            file_key = UPLOADS_PREFIX + "/" + f"{file_hash}.mp4"
-            filepath = os.path.join(UPLOADS_PATH, f"{file_hash}.mp4")
-
-        assert filepath is not None and file_key is not None
-        shutil.move(out_path, filepath)
-
-        return filepath, file_key, out_video_metadata
+    # the output is copied next to `filepath` (`out_path` can be on another file
+    # system) and then renamed, so that a video at `filepath` is always complete
+    fd, tmp_filepath = tempfile.mkstemp(
+        dir=os.path.dirname(filepath), suffix=".mp4.tmp"
+    )
+    os.close(fd)
+    try:
+        shutil.move(out_path, tmp_filepath)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+    return out_video_metadata
 
 
 schema = strawberry.Schema(
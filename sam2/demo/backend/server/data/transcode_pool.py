@@ -0,0 +1,124 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# number of finished jobs whose status is kept for polling
+MAX_FINISHED_JOBS = 1024
+
+
+@dataclass
+class TranscodeJob:
+    job_id: str
+    # "queued", "running", "done" or "failed"
+    status: str = "queued"
+    # fraction of the video transcoded so far (between 0 and 1)
+    progress: float = 0.0
+    error: Optional[str] = None
+    future: Future = field(default_factory=Future, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def result(self) -> Any:
+        """Wait for the job to finish and return its result (or raise its error)."""
+        return self.future.result()
+
+
+class TranscodePool:
+    """
+    Run the transcoding jobs of the uploads on a pool of worker threads (each job
+    runs an ffmpeg process), so that the request threads don't have to wait for
+    them. At most `max_pending_jobs` jobs can be queued or running; submitting more
+    raises an error for the client to retry later.
+
+    Jobs are identified by a key of their output (e.g. the hash of the source video
+    and the transcoding parameters), so a job submitted while an identical one is
+    pending (or after it finished) is not run again. Clients poll the status of a
+    job with `get_job`.
+    """
+
+    def __init__(self, num_workers: int, max_pending_jobs: int) -> None:
+        self.max_pending_jobs = max_pending_jobs
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="transcode"
+        )
+        self._jobs: "OrderedDict[str, TranscodeJob]" = OrderedDict()
+        self._lock = Lock()
+
+    def submit(
+        self, job_id: str, fn: Callable[[TranscodeJob], Any]
+    ) -> Tuple[TranscodeJob, bool]:
+        """
+        Queue `fn(job)` under `job_id`, unless there's already a job with this id
+        that is pending or succeeded. Return the job, and whether it was queued by
+        this call. `fn` can report its progress on the job.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id, None)
+            if job is not None and job.status != "failed":
+                return job, False
+            num_pending_jobs = sum(not j.finished for j in self._jobs.values())
+            if num_pending_jobs >= self.max_pending_jobs:
+                raise Exception(
+                    "too many videos are being processed; please try again later"
+                )
+            job = TranscodeJob(job_id=job_id)
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            self._evict_finished_jobs()
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def put_result(self, job_id: str, result: Any) -> TranscodeJob:
+        """
+        Record a job whose result is already available (e.g. from a cache), unless
+        there's already a job with this id that is pending or succeeded. Return the
+        job with this id.
+        """
+        job = TranscodeJob(job_id=job_id, status="done", progress=1.0)
+        job.future.set_result(result)
+        with self._lock:
+            current_job = self._jobs.get(job_id, None)
+            if current_job is not None and current_job.status != "failed":
+                return current_job
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            self._evict_finished_jobs()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[TranscodeJob]:
+        with self._lock:
+            return self._jobs.get(job_id, None)
+
+    def _run(self, job: TranscodeJob, fn: Callable[[TranscodeJob], Any]) -> None:
+        job.status = "running"
+        try:
+            result = fn(job)
+        except Exception as e:
+            logger.exception(f"transcoding job {job.job_id} failed")
+            job.error = str(e)
+            job.status = "failed"
+            job.future.set_exception(e)
+        else:
+            job.progress = 1.0
+            job.status = "done"
+            job.future.set_result(result)
+
+    def _evict_finished_jobs(self) -> None:
+        finished_job_ids = [
+            job_id for job_id, job in self._jobs.items() if job.finished
+        ]
+        num_evicted_jobs = max(len(finished_job_ids) - MAX_FINISHED_JOBS, 0)
+        for job_id in finished_job_ids[:num_evicted_jobs]:
+            del self._jobs[job_id]
@@ -9,7 +9,7 @@ import os
 import shutil
 import subprocess
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Callable, Dict, Optional
 
 import av
 from app_conf import FFMPEG_NUM_THREADS
@@ -32,32 +32,45 @@ class VideoMetadata:
     video_start_time: float
 
 
+def get_transcode_params() -> Dict[str, Any]:
+    """
+    Get the parameters of `transcode` that determine its output (besides the input
+    video and trimming), e.g. to identify transcoded videos.
+    """
+    return {
+        "version": TRANSCODE_VERSION,
+        "codec": os.environ.get("VIDEO_ENCODE_CODEC", "libx264"),
+        "crf": int(os.environ.get("VIDEO_ENCODE_CRF", "23")),
+        "fps": int(os.environ.get("VIDEO_ENCODE_FPS", "24")),
+        "max_w": int(os.environ.get("VIDEO_ENCODE_MAX_WIDTH", "1280")),
+        "max_h": int(os.environ.get("VIDEO_ENCODE_MAX_HEIGHT", "720")),
+    }
+
+
 def transcode(
     in_path: str,
     out_path: str,
     in_metadata: Optional[VideoMetadata],
     seek_t: float,
     duration_time_sec: float,
+    progress_callback: Optional[Callable[[float], None]] = None,
 ):
-    codec = os.environ.get("VIDEO_ENCODE_CODEC", "libx264")
-    crf = int(os.environ.get("VIDEO_ENCODE_CRF", "23"))
-    fps = int(os.environ.get("VIDEO_ENCODE_FPS", "24"))
-    max_w = int(os.environ.get("VIDEO_ENCODE_MAX_WIDTH", "1280"))
-    max_h = int(os.environ.get("VIDEO_ENCODE_MAX_HEIGHT", "720"))
+    params = get_transcode_params()
     verbose = ast.literal_eval(os.environ.get("VIDEO_ENCODE_VERBOSE", "False"))
 
     normalize_video(
         in_path=in_path,
         out_path=out_path,
-        max_w=max_w,
-        max_h=max_h,
+        max_w=params["max_w"],
+        max_h=params["max_h"],
         seek_t=seek_t,
         max_time=duration_time_sec,
         in_metadata=in_metadata,
-        codec=codec,
-        crf=crf,
-        fps=fps,
+        codec=params["codec"],
+        crf=params["crf"],
+        fps=params["fps"],
         verbose=verbose,
+        progress_callback=progress_callback,
     )
 
 
@@ -123,7 +136,12 @@ def normalize_video(
     crf: int = 23,
     fps: int = 24,
     verbose: bool = False,
+    progress_callback: Optional[Callable[[float], None]] = None,
 ):
+    """
+    Transcode a video with ffmpeg. If `progress_callback` is set, it's called with
+    the fraction (between 0 and 1) of the output encoded so far while ffmpeg runs.
+    """
     if in_metadata is None:
         in_metadata = get_video_metadata(in_path)
 
@@ -176,11 +194,29 @@ def normalize_video(
         out_path,
         "-y",
     ]
+    if progress_callback is not None:
+        # report the encoding progress as "key=value" lines on stdout
+        cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
     if verbose:
         print(" ".join(cmd))
 
-    subprocess.call(
+    if progress_callback is None:
+        subprocess.call(
+            cmd,
+            stdout=None if verbose else subprocess.DEVNULL,
+            stderr=None if verbose else subprocess.DEVNULL,
+        )
+        return
+
+    with subprocess.Popen(
         cmd,
-        stdout=None if verbose else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
         stderr=None if verbose else subprocess.DEVNULL,
-    )
+        text=True,
+    ) as process:
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            # the output timestamp, in microseconds despite its name
+            if key == "out_time_ms" and value.isdigit() and max_time > 0:
+                progress_callback(min(int(value) / 1e6 / max_time, 1.0))
+    progress_callback(1.0)
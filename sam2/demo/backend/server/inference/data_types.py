@@ -50,6 +50,8 @@ class LoadSessionRequest(BaseRequest):
 class RenewSessionRequest(BaseRequest):
     type: str
     session_id: str
+    # the frame the client is viewing, around which the video is prepared first
+    frame_index: Optional[int] = None
 
 
 @dataclass_json
@@ -111,6 +113,8 @@ class PropagateInVideoRequest(BaseRequest):
     type: str
     session_id: str
     start_frame_index: int
+    propagation_direction: str = "both"
+    max_frame_num_to_track: Optional[int] = None
 
 
 @dataclass_json
@@ -142,6 +146,12 @@ class LoadSessionResponse:
 @dataclass
 class RenewSessionResponse:
     session_id: str
+    # unix timestamps (in seconds) at which the session expires if it's not renewed,
+    # and at which it expires anyway (None if the session lifetime isn't limited)
+    expiration_time: int
+    max_expiration_time: Optional[int]
+    # number of idle seconds after which a session expires
+    ttl: int
 
 
 @dataclass_json
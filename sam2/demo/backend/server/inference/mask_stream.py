@@ -0,0 +1,192 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import queue
+import time
+from threading import Event, Thread
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional
+
+from inference.data_types import PropagateDataResponse
+
+# Content types of the parts of a propagation stream in each format. In the "json"
+# format, each part holds one frame as a JSON-encoded `PropagateDataResponse` (as
+# expected by existing clients). In the binary formats, each part holds a batch of
+# frames as a msgpack or CBOR map
+#
+#     {"size": [H, W], "frames": [[frame_index, [[object_id, counts], ...]], ...]}
+#
+# where `counts` is the COCO compressed RLE string of the mask as a (length-prefixed)
+# byte string, and `size` is shared by all masks of the video.
+STREAM_FORMATS = {
+    "json": "application/json; charset=utf-8",
+    "msgpack": "application/msgpack",
+    "cbor": "application/cbor",
+}
+
+# default number of frames batched into one part in the binary formats
+DEFAULT_FRAMES_PER_PART = 8
+# a batch is sent when it's full, or when its first frame has waited that many
+# seconds (so that a slow propagation still streams its results progressively)
+MAX_BATCH_DELAY_SECONDS = 0.2
+
+# marks the end of the frames read by a `_FrameReader`
+_END_OF_FRAMES = object()
+
+
+def _get_binary_dumps(format: str) -> Callable[[object], bytes]:
+    if format == "msgpack":
+        try:
+            import msgpack
+        except ImportError:
+            raise ValueError(
+                "the msgpack stream format requires the msgpack package"
+            ) from None
+        return msgpack.packb
+    try:
+        import cbor2
+    except ImportError:
+        raise ValueError("the cbor stream format requires the cbor2 package") from None
+    return cbor2.dumps
+
+
+def get_stream_encoder(
+    format: str,
+) -> Callable[[List[PropagateDataResponse]], bytes]:
+    """
+    Get the function encoding a batch of frames into the body of a stream part in
+    the given format. Raise a ValueError if the format is not supported.
+    """
+    if format not in STREAM_FORMATS:
+        raise ValueError(
+            f"invalid stream format: {format} (must be one of {list(STREAM_FORMATS)})"
+        )
+    if format == "json":
+
+        def _encode_json(frames: List[PropagateDataResponse]) -> bytes:
+            assert len(frames) == 1, "the json format holds one frame per part"
+            return frames[0].to_json().encode("UTF-8")
+
+        return _encode_json
+
+    dumps = _get_binary_dumps(format)
+
+    def _encode_binary(frames: List[PropagateDataResponse]) -> bytes:
+        size = None
+        packed_frames = []
+        for frame in frames:
+            packed_results = []
+            for result in frame.results:
+                size = result.mask.size
+                packed_results.append(
+                    [result.object_id, result.mask.counts.encode("ascii")]
+                )
+            packed_frames.append([frame.frame_index, packed_results])
+        return dumps({"size": size, "frames": packed_frames})
+
+    return _encode_binary
+
+
+def batch_frames(
+    frames: Iterable[PropagateDataResponse],
+    frames_per_part: int,
+) -> Generator[List[PropagateDataResponse], None, None]:
+    """
+    Group the streamed frames into batches of at most `frames_per_part` frames,
+    cutting a batch early once its first frame waited `MAX_BATCH_DELAY_SECONDS`.
+
+    The frames are read on a separate thread, so that a batch is cut when its delay
+    expires even while the next frame is still being computed. Closing the batches
+    (e.g. when the client disconnects) closes `frames` on that thread.
+    """
+    reader = _FrameReader(frames, max_buffered=frames_per_part)
+    try:
+        batch = []
+        batch_deadline = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(batch_deadline - time.monotonic(), 0)
+            try:
+                frame = reader.get(timeout)
+            except queue.Empty:
+                # the first frame of the batch waited long enough
+                yield batch
+                batch = []
+                continue
+            if frame is _END_OF_FRAMES:
+                break
+            if not batch:
+                batch_deadline = time.monotonic() + MAX_BATCH_DELAY_SECONDS
+            batch.append(frame)
+            if len(batch) >= frames_per_part or time.monotonic() >= batch_deadline:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        reader.close()
+
+
+class _FrameReader:
+    """Read the frames of a stream on a thread, buffering up to `max_buffered`."""
+
+    def __init__(self, frames: Iterable[Any], max_buffered: int) -> None:
+        self.frames = frames
+        self.items: queue.Queue = queue.Queue(maxsize=max(max_buffered, 1))
+        # whether the consumer stopped reading the frames
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, name="frame-reader", daemon=True)
+        self.thread.start()
+
+    def get(self, timeout: Optional[float]) -> Any:
+        """
+        Wait up to `timeout` seconds (or indefinitely if None) for the next frame,
+        raising `queue.Empty` if there's none yet (and re-raising the exceptions of
+        the frames' iterator).
+        """
+        item = self.items.get(timeout=timeout)
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def close(self) -> None:
+        """Stop reading: the frames are closed once the frame being read is done."""
+        self.stopped.set()
+
+    def _run(self) -> None:
+        try:
+            for frame in self.frames:
+                if not self._put(frame):
+                    return
+            self._put(_END_OF_FRAMES)
+        except Exception as e:
+            self._put(e)
+        finally:
+            if hasattr(self.frames, "close"):
+                self.frames.close()
+
+    def _put(self, item: Any) -> bool:
+        """Buffer an item, unless the consumer stopped (then return False)."""
+        while not self.stopped.is_set():
+            try:
+                self.items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def get_stream_headers(
+    format: str, num_frames_sent: int, num_frames_total: int
+) -> Dict[str, str]:
+    """Get the headers of a stream part."""
+    return {
+        "Content-Type": STREAM_FORMATS[format],
+        # number of frames sent so far, including the ones in this part
+        "Frame-Current": str(num_frames_sent),
+        # number of frames the propagation streams
+        "Frame-Total": str(num_frames_total),
+        "Mask-Type": "RLE[]",
+    }
@@ -4,16 +4,25 @@
 # LICENSE file in the root directory of this source tree.
 
 import contextlib
+import functools
 import logging
 import os
 import uuid
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, Generator, List
+from typing import Any, Dict, Generator, List, Optional, Tuple
 
-import numpy as np
 import torch
-from app_conf import APP_ROOT, MODEL_SIZE
+from app_conf import (
+    APP_ROOT,
+    FEATURE_PREFETCH_FRAMES,
+    MODEL_SIZE,
+    PROPAGATION_BUFFER_FRAMES,
+    SESSION_MAX_LIFETIME_SECONDS,
+    SESSION_MEMORY_BUDGET_MB,
+    SESSION_SPILL_MODE,
+    SESSION_SPILL_PATH,
+    SESSION_TTL_SECONDS,
+)
 from inference.data_types import (
     AddMaskRequest,
     AddPointsRequest,
@@ -30,22 +39,53 @@ from inference.data_types import (
     PropagateInVideoRequest,
     RemoveObjectRequest,
     RemoveObjectResponse,
+    RenewSessionRequest,
+    RenewSessionResponse,
     StartSessionRequest,
     StartSessionResponse,
 )
-from pycocotools.mask import decode as decode_masks, encode as encode_masks
+from inference.result_cache import PropagationResultCache
+from inference.scheduler import (
+    InferenceScheduler,
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+)
+from inference.session_manager import SessionManager
+from pycocotools.mask import decode as decode_masks
 from sam2.build_sam import build_sam2_video_predictor
+from sam2.utils.amg import coco_encode_rle, mask_to_rle_pytorch
 
 
 logger = logging.getLogger(__name__)
 
 
+def run_on_scheduler(method):
+    """
+    Run an `InferenceAPI` request method as an interactive task on its scheduler,
+    and then account for the memory of the request's session.
+    """
+
+    def _run(self, request, *args, **kwargs):
+        response = method(self, request, *args, **kwargs)
+        if request.session_id is not None:
+            self.sessions.update_memory(request.session_id)
+        return response
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return self.scheduler.run(
+            functools.partial(_run, self, request, *args, **kwargs),
+            priority=PRIORITY_INTERACTIVE,
+        )
+
+    return wrapper
+
+
 class InferenceAPI:
 
     def __init__(self) -> None:
         super(InferenceAPI, self).__init__()
 
-        self.session_states: Dict[str, Any] = {}
         self.score_thresh = 0
 
         if MODEL_SIZE == "tiny":
@@ -89,7 +129,17 @@ class InferenceAPI:
         self.predictor = build_sam2_video_predictor(
             model_cfg, checkpoint, device=device
         )
-        self.inference_lock = Lock()
+        # all the model work runs on the scheduler's worker thread (under autocast),
+        # interleaving the sessions' requests at frame granularity
+        self.scheduler = InferenceScheduler(context_factory=self.autocast_context)
+        self.sessions = SessionManager(
+            self.predictor,
+            ttl_seconds=SESSION_TTL_SECONDS,
+            max_lifetime_seconds=SESSION_MAX_LIFETIME_SECONDS,
+            memory_budget_mb=SESSION_MEMORY_BUDGET_MB,
+            spill_mode=SESSION_SPILL_MODE,
+            spill_path=SESSION_SPILL_PATH,
+        )
 
     def autocast_context(self):
         if self.device.type == "cuda":
@@ -97,262 +147,440 @@ class InferenceAPI:
         else:
             return contextlib.nullcontext()
 
+    @run_on_scheduler
     def start_session(self, request: StartSessionRequest) -> StartSessionResponse:
-        with self.autocast_context(), self.inference_lock:
-            session_id = str(uuid.uuid4())
-            # for MPS devices, we offload the video frames to CPU by default to avoid
-            # memory fragmentation in MPS (which sometimes crashes the entire process)
-            offload_video_to_cpu = self.device.type == "mps"
-            inference_state = self.predictor.init_state(
-                request.path,
-                offload_video_to_cpu=offload_video_to_cpu,
-            )
-            self.session_states[session_id] = {
-                "canceled": False,
-                "state": inference_state,
-            }
-            return StartSessionResponse(session_id=session_id)
-
+        session_id = str(uuid.uuid4())
+        # for MPS devices, we offload the video frames to CPU by default to avoid
+        # memory fragmentation in MPS (which sometimes crashes the entire process)
+        offload_video_to_cpu = self.device.type == "mps"
+        # only the first frame is decoded (and encoded) before the session starts,
+        # and the other frames are prepared in the background (see `__view_frame`)
+        inference_state = self.predictor.init_state(
+            request.path,
+            offload_video_to_cpu=offload_video_to_cpu,
+            async_loading_frames=True,
+        )
+        session = self.sessions.add(
+            session_id, inference_state, offload_video_to_cpu=offload_video_to_cpu
+        )
+        session["result_cache"] = PropagationResultCache()
+        session["viewed_frame_idx"] = 0
+        # whether a background task prefetches the image features of the session
+        session["prefetching"] = False
+        self.__view_frame(session_id, 0)
+        return StartSessionResponse(session_id=session_id)
+
+    @run_on_scheduler
     def close_session(self, request: CloseSessionRequest) -> CloseSessionResponse:
         is_successful = self.__clear_session_state(request.session_id)
         return CloseSessionResponse(success=is_successful)
 
+    @run_on_scheduler
+    def renew_session(self, request: RenewSessionRequest) -> RenewSessionResponse:
+        """
+        Keep a session alive (each request to a session renews it, this is for idle
+        clients), and record the frame its client is viewing, if it's set.
+        """
+        session = self.__get_session(request.session_id)
+        if request.frame_index is not None:
+            self.__view_frame(request.session_id, request.frame_index)
+        expiration_time, max_expiration_time = self.sessions.get_expiration(session)
+        return RenewSessionResponse(
+            session_id=request.session_id,
+            expiration_time=expiration_time,
+            max_expiration_time=max_expiration_time,
+            ttl=int(self.sessions.ttl_seconds),
+        )
+
+    @run_on_scheduler
     def add_points(
         self, request: AddPointsRequest, test: str = ""
     ) -> PropagateDataResponse:
-        with self.autocast_context(), self.inference_lock:
-            session = self.__get_session(request.session_id)
-            inference_state = session["state"]
-
-            frame_idx = request.frame_index
-            obj_id = request.object_id
-            points = request.points
-            labels = request.labels
-            clear_old_points = request.clear_old_points
-
-            # add new prompts and instantly get the output on the same frame
-            frame_idx, object_ids, masks = self.predictor.add_new_points_or_box(
-                inference_state=inference_state,
-                frame_idx=frame_idx,
-                obj_id=obj_id,
-                points=points,
-                labels=labels,
-                clear_old_points=clear_old_points,
-                normalize_coords=False,
-            )
+        inference_state = self.__get_session_state(request.session_id)
+
+        frame_idx = request.frame_index
+        obj_id = request.object_id
+        points = request.points
+        labels = request.labels
+        clear_old_points = request.clear_old_points
+
+        # add new prompts and instantly get the output on the same frame
+        frame_idx, object_ids, masks = self.predictor.add_new_points_or_box(
+            inference_state=inference_state,
+            frame_idx=frame_idx,
+            obj_id=obj_id,
+            points=points,
+            labels=labels,
+            clear_old_points=clear_old_points,
+            normalize_coords=False,
+        )
+        self.__get_result_cache(request.session_id).invalidate()
+        self.__view_frame(request.session_id, frame_idx)
 
-            masks_binary = (masks > self.score_thresh)[:, 0].cpu().numpy()
+        mask_rles = self.__encode_masks(masks)
 
-            rle_mask_list = self.__get_rle_mask_list(
-                object_ids=object_ids, masks=masks_binary
-            )
+        rle_mask_list = self.__get_rle_mask_list(
+            object_ids=object_ids, mask_rles=mask_rles
+        )
 
-            return PropagateDataResponse(
-                frame_index=frame_idx,
-                results=rle_mask_list,
-            )
+        return PropagateDataResponse(
+            frame_index=frame_idx,
+            results=rle_mask_list,
+        )
 
+    @run_on_scheduler
     def add_mask(self, request: AddMaskRequest) -> PropagateDataResponse:
         """
         Add new points on a specific video frame.
         - mask is a numpy array of shape [H_im, W_im] (containing 1 for foreground and 0 for background).
         Note: providing an input mask would overwrite any previous input points on this frame.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            frame_idx = request.frame_index
-            obj_id = request.object_id
-            rle_mask = {
-                "counts": request.mask.counts,
-                "size": request.mask.size,
-            }
+        session_id = request.session_id
+        frame_idx = request.frame_index
+        obj_id = request.object_id
+        rle_mask = {
+            "counts": request.mask.counts,
+            "size": request.mask.size,
+        }
 
-            mask = decode_masks(rle_mask)
+        mask = decode_masks(rle_mask)
 
-            logger.info(
-                f"add mask on frame {frame_idx} in session {session_id}: {obj_id=}, {mask.shape=}"
-            )
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
+        logger.info(
+            f"add mask on frame {frame_idx} in session {session_id}: {obj_id=}, {mask.shape=}"
+        )
+        inference_state = self.__get_session_state(session_id)
 
-            frame_idx, obj_ids, video_res_masks = self.model.add_new_mask(
-                inference_state=inference_state,
-                frame_idx=frame_idx,
-                obj_id=obj_id,
-                mask=torch.tensor(mask > 0),
-            )
-            masks_binary = (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
+        frame_idx, obj_ids, video_res_masks = self.model.add_new_mask(
+            inference_state=inference_state,
+            frame_idx=frame_idx,
+            obj_id=obj_id,
+            mask=torch.tensor(mask > 0),
+        )
+        self.__get_result_cache(session_id).invalidate()
+        self.__view_frame(session_id, frame_idx)
+        mask_rles = self.__encode_masks(video_res_masks)
 
-            rle_mask_list = self.__get_rle_mask_list(
-                object_ids=obj_ids, masks=masks_binary
-            )
+        rle_mask_list = self.__get_rle_mask_list(
+            object_ids=obj_ids, mask_rles=mask_rles
+        )
 
-            return PropagateDataResponse(
-                frame_index=frame_idx,
-                results=rle_mask_list,
-            )
+        return PropagateDataResponse(
+            frame_index=frame_idx,
+            results=rle_mask_list,
+        )
 
+    @run_on_scheduler
     def clear_points_in_frame(
         self, request: ClearPointsInFrameRequest
     ) -> PropagateDataResponse:
         """
         Remove all input points in a specific frame.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            frame_idx = request.frame_index
-            obj_id = request.object_id
+        session_id = request.session_id
+        frame_idx = request.frame_index
+        obj_id = request.object_id
 
-            logger.info(
-                f"clear inputs on frame {frame_idx} in session {session_id}: {obj_id=}"
-            )
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
-            frame_idx, obj_ids, video_res_masks = (
-                self.predictor.clear_all_prompts_in_frame(
-                    inference_state, frame_idx, obj_id
-                )
+        logger.info(
+            f"clear inputs on frame {frame_idx} in session {session_id}: {obj_id=}"
+        )
+        inference_state = self.__get_session_state(session_id)
+        frame_idx, obj_ids, video_res_masks = (
+            self.predictor.clear_all_prompts_in_frame(
+                inference_state, frame_idx, obj_id
             )
-            masks_binary = (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
+        )
+        self.__get_result_cache(session_id).invalidate()
+        self.__view_frame(session_id, frame_idx)
+        mask_rles = self.__encode_masks(video_res_masks)
 
-            rle_mask_list = self.__get_rle_mask_list(
-                object_ids=obj_ids, masks=masks_binary
-            )
+        rle_mask_list = self.__get_rle_mask_list(
+            object_ids=obj_ids, mask_rles=mask_rles
+        )
 
-            return PropagateDataResponse(
-                frame_index=frame_idx,
-                results=rle_mask_list,
-            )
+        return PropagateDataResponse(
+            frame_index=frame_idx,
+            results=rle_mask_list,
+        )
 
+    @run_on_scheduler
     def clear_points_in_video(
         self, request: ClearPointsInVideoRequest
     ) -> ClearPointsInVideoResponse:
         """
         Remove all input points in all frames throughout the video.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            logger.info(f"clear all inputs across the video in session {session_id}")
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
-            self.predictor.reset_state(inference_state)
-            return ClearPointsInVideoResponse(success=True)
+        session_id = request.session_id
+        logger.info(f"clear all inputs across the video in session {session_id}")
+        inference_state = self.__get_session_state(session_id)
+        self.predictor.reset_state(inference_state)
+        self.__get_result_cache(session_id).invalidate()
+        return ClearPointsInVideoResponse(success=True)
 
+    @run_on_scheduler
     def remove_object(self, request: RemoveObjectRequest) -> RemoveObjectResponse:
         """
         Remove an object id from the tracking state.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            obj_id = request.object_id
-            logger.info(f"remove object in session {session_id}: {obj_id=}")
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
-            new_obj_ids, updated_frames = self.predictor.remove_object(
-                inference_state, obj_id
-            )
+        session_id = request.session_id
+        obj_id = request.object_id
+        logger.info(f"remove object in session {session_id}: {obj_id=}")
+        inference_state = self.__get_session_state(session_id)
+        # the removal affects the other objects if some of its frames with inputs are
+        # no longer conditioning frames without them (i.e. no other object has inputs)
+        obj_idx = inference_state["obj_id_to_idx"].get(obj_id, None)
+        obj_input_frames, other_input_frames = set(), set()
+        for inputs_per_obj in [
+            inference_state["point_inputs_per_obj"],
+            inference_state["mask_inputs_per_obj"],
+        ]:
+            for idx, inputs in inputs_per_obj.items():
+                if idx == obj_idx:
+                    obj_input_frames.update(inputs)
+                else:
+                    other_input_frames.update(inputs)
+        changes_conditioning = not obj_input_frames.issubset(other_input_frames)
+        new_obj_ids, updated_frames = self.predictor.remove_object(
+            inference_state, obj_id
+        )
+        self.__get_result_cache(session_id).remove_object(
+            obj_id, changes_conditioning
+        )
 
-            results = []
-            for frame_index, video_res_masks in updated_frames:
-                masks = (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
-                rle_mask_list = self.__get_rle_mask_list(
-                    object_ids=new_obj_ids, masks=masks
-                )
-                results.append(
-                    PropagateDataResponse(
-                        frame_index=frame_index,
-                        results=rle_mask_list,
-                    )
+        results = []
+        for frame_index, video_res_masks in updated_frames:
+            mask_rles = self.__encode_masks(video_res_masks)
+            rle_mask_list = self.__get_rle_mask_list(
+                object_ids=new_obj_ids, mask_rles=mask_rles
+            )
+            results.append(
+                PropagateDataResponse(
+                    frame_index=frame_index,
+                    results=rle_mask_list,
                 )
+            )
 
-            return RemoveObjectResponse(results=results)
+        return RemoveObjectResponse(results=results)
 
     def propagate_in_video(
         self, request: PropagateInVideoRequest
     ) -> Generator[PropagateDataResponse, None, None]:
         session_id = request.session_id
         start_frame_idx = request.start_frame_index
-        propagation_direction = "both"
-        max_frame_num_to_track = None
+        propagation_direction = request.propagation_direction
+        max_frame_num_to_track = request.max_frame_num_to_track
 
         """
         Propagate existing input points in all frames to track the object across video.
         """
 
-        # Note that as this method is a generator, we also need to use autocast_context
-        # in caller to this method to ensure that it's called under the correct context
-        # (we've added `autocast_context` to `gen_track_with_mask_stream` in app.py).
-        with self.autocast_context(), self.inference_lock:
-            logger.info(
-                f"propagate in video in session {session_id}: "
-                f"{propagation_direction=}, {start_frame_idx=}, {max_frame_num_to_track=}"
-            )
-
-            try:
-                session = self.__get_session(session_id)
-                session["canceled"] = False
-
-                inference_state = session["state"]
-                if propagation_direction not in ["both", "forward", "backward"]:
-                    raise ValueError(
-                        f"invalid propagation direction: {propagation_direction}"
-                    )
+        # The model runs on the scheduler's worker thread one frame at a time (so that
+        # other sessions' requests interleave with this propagation) and encodes the
+        # masks into RLEs on the device, while their compression into COCO RLE strings
+        # runs on the calling thread. The worker computes up to
+        # PROPAGATION_BUFFER_FRAMES frames ahead of the caller, and stops as soon as
+        # this generator is closed (e.g. when the client disconnects).
+        logger.info(
+            f"propagate in video in session {session_id}: "
+            f"{propagation_direction=}, {start_frame_idx=}, {max_frame_num_to_track=}"
+        )
 
-                # First doing the forward propagation
-                if propagation_direction in ["both", "forward"]:
-                    for outputs in self.predictor.propagate_in_video(
-                        inference_state=inference_state,
-                        start_frame_idx=start_frame_idx,
-                        max_frame_num_to_track=max_frame_num_to_track,
-                        reverse=False,
-                    ):
-                        if session["canceled"]:
-                            return None
+        try:
+            session = self.__get_session(session_id)
+            session["canceled"] = False
 
-                        frame_idx, obj_ids, video_res_masks = outputs
-                        masks_binary = (
-                            (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
-                        )
+            if propagation_direction not in ["both", "forward", "backward"]:
+                raise ValueError(
+                    f"invalid propagation direction: {propagation_direction}"
+                )
 
-                        rle_mask_list = self.__get_rle_mask_list(
-                            object_ids=obj_ids, masks=masks_binary
-                        )
+            result_cache = session["result_cache"]
+            directions = self.__get_propagation_frame_ranges(
+                request, num_frames=session["num_frames"]
+            )
 
+            # keep the session from being evicted while it's propagated
+            with self.sessions.in_use(session):
+                for reverse, frame_range in directions:
+                    # results computed after a prompt edit are not cached
+                    prompt_revision = result_cache.prompt_revision
+                    # serve the frames tracked before the first frame without cached
+                    # results (e.g. where a previous propagation was interrupted)
+                    num_cached_frames = 0
+                    for frame_idx in frame_range:
+                        rle_mask_list = result_cache.get(frame_idx, reverse)
+                        if rle_mask_list is None:
+                            break
+                        num_cached_frames += 1
                         yield PropagateDataResponse(
                             frame_index=frame_idx,
                             results=rle_mask_list,
                         )
-
-                # Then doing the backward propagation (reverse in time)
-                if propagation_direction in ["both", "backward"]:
-                    for outputs in self.predictor.propagate_in_video(
-                        inference_state=inference_state,
-                        start_frame_idx=start_frame_idx,
-                        max_frame_num_to_track=max_frame_num_to_track,
-                        reverse=True,
-                    ):
+                    if num_cached_frames == len(frame_range):
+                        continue
+
+                    # and resume the tracking from there
+                    frames = self.__propagate_frames(
+                        session_id=session_id,
+                        start_frame_idx=frame_range[num_cached_frames],
+                        max_frame_num_to_track=len(frame_range) - num_cached_frames - 1,
+                        reverse=reverse,
+                    )
+                    frames = self.scheduler.stream(
+                        frames, buffer_size=PROPAGATION_BUFFER_FRAMES
+                    )
+                    for frame_idx, obj_ids, mask_rles in frames:
                         if session["canceled"]:
                             return None
 
-                        frame_idx, obj_ids, video_res_masks = outputs
-                        masks_binary = (
-                            (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
-                        )
-
                         rle_mask_list = self.__get_rle_mask_list(
-                            object_ids=obj_ids, masks=masks_binary
+                            object_ids=obj_ids, mask_rles=mask_rles
+                        )
+                        result_cache.put(
+                            prompt_revision, frame_idx, reverse, rle_mask_list
                         )
 
                         yield PropagateDataResponse(
                             frame_index=frame_idx,
                             results=rle_mask_list,
                         )
-            finally:
-                # Log upon completion (so that e.g. we can see if two propagations happen in parallel).
-                # Using `finally` here to log even when the tracking is aborted with GeneratorExit.
-                logger.info(
-                    f"propagation ended in session {session_id}; {self.__get_session_stats()}"
-                )
+        finally:
+            # account for the memory of the tracked frames
+            self.scheduler.run(self.sessions.update_memory, session_id)
+            # Log upon completion (so that e.g. we can see if two propagations happen in parallel).
+            # Using `finally` here to log even when the tracking is aborted with GeneratorExit.
+            logger.info(
+                f"propagation ended in session {session_id}; {self.__get_session_stats()}"
+            )
+
+    def get_num_propagated_frames(self, request: PropagateInVideoRequest) -> int:
+        """Get the number of frames `propagate_in_video` yields for a request."""
+        num_frames = self.__get_session(request.session_id)["num_frames"]
+        directions = self.__get_propagation_frame_ranges(request, num_frames)
+        return sum(len(frame_range) for _, frame_range in directions)
+
+    def __get_propagation_frame_ranges(
+        self, request: PropagateInVideoRequest, num_frames: int
+    ) -> List[Tuple[bool, range]]:
+        """Get the (reverse, frames in tracking order) of each propagation pass."""
+        start_frame_idx = request.start_frame_index
+        max_frame_num_to_track = request.max_frame_num_to_track
+        if max_frame_num_to_track is None:
+            max_frame_num_to_track = num_frames
+        directions = []
+        # First doing the forward propagation
+        if request.propagation_direction in ["both", "forward"]:
+            end_frame_idx = min(
+                start_frame_idx + max_frame_num_to_track, num_frames - 1
+            )
+            directions.append((False, range(start_frame_idx, end_frame_idx + 1)))
+        # Then doing the backward propagation (reverse in time)
+        if request.propagation_direction in ["both", "backward"]:
+            end_frame_idx = max(start_frame_idx - max_frame_num_to_track, 0)
+            directions.append((True, range(start_frame_idx, end_frame_idx - 1, -1)))
+        return directions
+
+    def __propagate_frames(
+        self,
+        session_id: str,
+        start_frame_idx: int,
+        max_frame_num_to_track: int,
+        reverse: bool,
+    ) -> Generator[Tuple[int, List[int], List[Dict[str, Any]]], None, None]:
+        """
+        Track the objects in the given direction and yield the (uncompressed) RLEs of
+        the masks on each frame. It runs on the scheduler's worker thread (see
+        `InferenceScheduler.stream`).
+        """
+        session = self.__get_session(session_id)
+        inference_state = self.__get_session_state(session_id)
+        for outputs in self.predictor.propagate_in_video(
+            inference_state=inference_state,
+            start_frame_idx=start_frame_idx,
+            max_frame_num_to_track=max_frame_num_to_track,
+            reverse=reverse,
+        ):
+            frame_idx, obj_ids, video_res_masks = outputs
+            if session["canceled"]:
+                # stop computing ahead of the canceled stream
+                return
+            yield frame_idx, obj_ids, self.__encode_masks(video_res_masks)
+
+    def __view_frame(self, session_id: str, frame_idx: int) -> None:
+        """
+        Record the frame a user is viewing in a session: the remaining frames of the
+        video are decoded starting from it, and the image features of the frames
+        around it are prefetched in the background. This must run on the scheduler's
+        worker thread.
+        """
+        session = self.sessions.peek(session_id)
+        if session is None or session["state"] is None:
+            return
+        frame_idx = min(max(frame_idx, 0), session["num_frames"] - 1)
+        session["viewed_frame_idx"] = frame_idx
+        images = session["state"]["images"]
+        if hasattr(images, "prioritize"):
+            images.prioritize(frame_idx)
+        if FEATURE_PREFETCH_FRAMES > 0 and not session["prefetching"]:
+            session["prefetching"] = True
+            self.scheduler.submit(
+                self.__prefetch_features, session_id, priority=PRIORITY_BACKGROUND
+            )
+
+    def __prefetch_features(self, session_id: str) -> None:
+        """
+        Compute the image features of the next frame around the viewed frame of a
+        session, and queue the following one, until all the FEATURE_PREFETCH_FRAMES
+        frames around it have their features. Each frame is a separate background
+        task, so that any other request only waits for one frame.
+        """
+        session = self.sessions.peek(session_id)
+        if session is None:
+            return
+        inference_state = session["state"]
+        frame_idx = None
+        # a spilled session is not restored for its prefetching
+        if inference_state is not None:
+            frame_idx = self.__get_next_frame_to_prefetch(session)
+        if frame_idx is None:
+            session["prefetching"] = False
+            # account for the memory of the prefetched features
+            self.sessions.update_memory(session_id)
+            return
+        try:
+            self.predictor.prefetch_image_feature(
+                inference_state,
+                frame_idx,
+                max_prefetched_frames=FEATURE_PREFETCH_FRAMES,
+            )
+        except Exception:
+            logger.exception(f"failed to prefetch frame {frame_idx} of {session_id}")
+            session["prefetching"] = False
+            return
+        self.scheduler.submit(
+            self.__prefetch_features, session_id, priority=PRIORITY_BACKGROUND
+        )
+
+    def __get_next_frame_to_prefetch(self, session: Dict[str, Any]) -> Optional[int]:
+        """
+        Get the frame closest to the viewed frame (in the order: viewed frame, next
+        frame, previous frame, ...) among the FEATURE_PREFETCH_FRAMES frames around
+        it whose image features are not computed yet, if any.
+        """
+        inference_state = session["state"]
+        viewed_frame_idx = session["viewed_frame_idx"]
+        for offset in range(FEATURE_PREFETCH_FRAMES):
+            if offset % 2 == 1:
+                frame_idx = viewed_frame_idx + (offset + 1) // 2
+            else:
+                frame_idx = viewed_frame_idx - offset // 2
+            if not 0 <= frame_idx < session["num_frames"]:
+                continue
+            if (
+                frame_idx not in inference_state["prefetched_features"]
+                and frame_idx not in inference_state["cached_features"]
+            ):
+                return frame_idx
+        return None
 
     def cancel_propagate_in_video(
         self, request: CancelPropagateInVideoRequest
@@ -361,25 +589,33 @@ class InferenceAPI:
         session["canceled"] = True
         return CancelPorpagateResponse(success=True)
 
+    def __encode_masks(self, masks: torch.Tensor) -> List[Dict[str, Any]]:
+        """
+        Threshold the [N, 1, H, W] mask scores of N objects and encode them into
+        uncompressed RLEs on their device, so that only the run lengths (instead of
+        the full masks) are copied to the host.
+        """
+        masks_binary = (masks > self.score_thresh)[:, 0]
+        return mask_to_rle_pytorch(masks_binary)
+
     def __get_rle_mask_list(
-        self, object_ids: List[int], masks: np.ndarray
+        self, object_ids: List[int], mask_rles: List[Dict[str, Any]]
     ) -> List[PropagateDataValue]:
         """
         Return a list of data values, i.e. list of object/mask combos.
         """
         return [
-            self.__get_mask_for_object(object_id=object_id, mask=mask)
-            for object_id, mask in zip(object_ids, masks)
+            self.__get_mask_for_object(object_id=object_id, mask_rle=mask_rle)
+            for object_id, mask_rle in zip(object_ids, mask_rles)
         ]
 
     def __get_mask_for_object(
-        self, object_id: int, mask: np.ndarray
+        self, object_id: int, mask_rle: Dict[str, Any]
     ) -> PropagateDataValue:
         """
         Create a data value for an object/mask combo.
         """
-        mask_rle = encode_masks(np.array(mask, dtype=np.uint8, order="F"))
-        mask_rle["counts"] = mask_rle["counts"].decode()
+        mask_rle = coco_encode_rle(mask_rle)
         return PropagateDataValue(
             object_id=object_id,
             mask=Mask(
@@ -389,24 +625,49 @@ class InferenceAPI:
         )
 
     def __get_session(self, session_id: str):
-        session = self.session_states.get(session_id, None)
+        session = self.sessions.get(session_id)
         if session is None:
             raise RuntimeError(
                 f"Cannot find session {session_id}; it might have expired"
             )
         return session
 
+    def __get_result_cache(self, session_id: str) -> PropagationResultCache:
+        return self.__get_session(session_id)["result_cache"]
+
+    def __get_session_state(self, session_id: str) -> Dict[str, Any]:
+        """
+        Get the inference state of a session (restoring it if it was spilled); this
+        must run on the scheduler's worker thread.
+        """
+        inference_state = self.sessions.get_state(session_id)
+        if inference_state is None:
+            raise RuntimeError(
+                f"Cannot find session {session_id}; it might have expired"
+            )
+        return inference_state
+
     def __get_session_stats(self):
         """Get a statistics string for live sessions and their GPU usage."""
-        # print both the session ids and their video frame numbers
-        live_session_strs = [
-            f"'{session_id}' ({session['state']['num_frames']} frames, "
-            f"{len(session['state']['obj_ids'])} objects)"
-            for session_id, session in self.session_states.items()
-        ]
+        # print both the session ids and their video frame numbers and memory
+        live_session_strs = []
+        for session_id, session in self.sessions.items():
+            if session["state"] is None:
+                live_session_strs.append(
+                    f"'{session_id}' (spilled to {self.sessions.spill_mode})"
+                )
+                continue
+            live_session_strs.append(
+                f"'{session_id}' ({session['state']['num_frames']} frames, "
+                f"{len(session['state']['obj_ids'])} objects, "
+                f"{session['memory_bytes'] // 1024**2} MiB)"
+            )
         session_stats_str = (
             "Test String Here - -"
-            f"live sessions: [{', '.join(live_session_strs)}], GPU memory: "
+            f"live sessions: [{', '.join(live_session_strs)}], session memory: "
+            f"{self.sessions.live_memory_bytes() // 1024**2} MiB live and "
+            f"{self.sessions.spilled_memory_bytes() // 1024**2} MiB spilled to host, "
+            "GPU memory: "
             f"{torch.cuda.memory_allocated() // 1024**2} MiB used and "
             f"{torch.cuda.memory_reserved() // 1024**2} MiB reserved"
             f" (max over time: {torch.cuda.max_memory_allocated() // 1024**2} MiB used "
@@ -415,7 +676,7 @@ class InferenceAPI:
         return session_stats_str
 
     def __clear_session_state(self, session_id: str) -> bool:
-        session = self.session_states.pop(session_id, None)
+        session = self.sessions.pop(session_id)
         if session is None:
             logger.warning(
                 f"cannot close session {session_id} as it does not exist (it might have expired); "
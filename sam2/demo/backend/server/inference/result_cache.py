@@ -0,0 +1,80 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+from threading import Lock
+from typing import Dict, List, Optional
+
+from inference.data_types import PropagateDataValue
+
+
+class PropagationResultCache:
+    """
+    The encoded per-frame results of the propagations of a session, so that a
+    repeated propagation (e.g. when the client re-opens the video or scrubs back)
+    is served without re-running the model.
+
+    The results are stored per tracking direction. Each prompt edit bumps
+    `prompt_revision` and drops all the results: the memory attention of every
+    tracked frame attends to all the conditioning frames (the frames with prompts),
+    including the later ones, so an edit on any frame can change the results on all
+    the frames. Results computed by a propagation that started before an edit are
+    not stored. A propagation interrupted at the same revision (e.g. when the client
+    disconnected) is still resumed from its first frame without a result.
+    """
+
+    def __init__(self) -> None:
+        self.prompt_revision = 0
+        # {reverse: {frame_idx: results}}
+        self._results: Dict[bool, Dict[int, List[PropagateDataValue]]] = {
+            False: {},
+            True: {},
+        }
+        self._lock = Lock()
+
+    def get(
+        self, frame_idx: int, reverse: bool
+    ) -> Optional[List[PropagateDataValue]]:
+        with self._lock:
+            return self._results[reverse].get(frame_idx, None)
+
+    def put(
+        self,
+        prompt_revision: int,
+        frame_idx: int,
+        reverse: bool,
+        results: List[PropagateDataValue],
+    ) -> None:
+        """Store the results of a frame computed at `prompt_revision`."""
+        with self._lock:
+            if prompt_revision == self.prompt_revision:
+                self._results[reverse][frame_idx] = results
+
+    def invalidate(self) -> None:
+        """Record a prompt edit and drop all the results."""
+        with self._lock:
+            self.prompt_revision += 1
+            self._clear()
+
+    def remove_object(self, object_id: int, changes_conditioning: bool) -> None:
+        """
+        Record the removal of an object, whose results are dropped from all frames.
+        The tracking of the other objects doesn't depend on it, unless some frames
+        are no longer conditioning frames without its prompts (`changes_conditioning`),
+        in which case all the results are dropped.
+        """
+        with self._lock:
+            self.prompt_revision += 1
+            if changes_conditioning:
+                self._clear()
+                return
+            for results_per_frame in self._results.values():
+                for t, results in results_per_frame.items():
+                    results_per_frame[t] = [
+                        r for r in results if r.object_id != object_id
+                    ]
+
+    def _clear(self) -> None:
+        for results_per_frame in self._results.values():
+            results_per_frame.clear()
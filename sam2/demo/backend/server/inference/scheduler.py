@@ -0,0 +1,176 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import contextlib
+import itertools
+import logging
+import queue
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Any, Callable, ContextManager, Generator, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Task priorities (lower runs first). Interactive requests (clicks, masks, clears)
+# are short and a user is waiting on them, so they go ahead of the frames of any
+# ongoing propagation, and background work (e.g. prefetching the image features
+# around the frame a user is viewing) only runs when the worker is otherwise idle.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PROPAGATION = 1
+PRIORITY_BACKGROUND = 2
+
+# marks the end of a stepped generator
+_END_OF_STREAM = object()
+
+
+class InferenceScheduler:
+    """
+    Run all the model work of the inference API on a single worker thread.
+
+    Requests from the server threads are queued as tasks and run one at a time by
+    priority, and in submission order within a priority. A propagation is not one
+    long task: its generator is stepped one frame per task (see `stream`), so that
+    the frames of concurrent sessions interleave and an interactive request only
+    waits for the frame being processed, instead of the whole propagation.
+
+    The worker runs each task in `context_factory()` (e.g. the autocast context,
+    which is thread-local and therefore has to be entered on the worker thread).
+
+    The tasks of different sessions are interleaved but not batched together: each
+    session tracks its own video with its own feature cache and memory bank (whose
+    frames and numbers of objects differ), so there is no common batch to run one
+    stage of several sessions on.
+    """
+
+    def __init__(
+        self, context_factory: Callable[[], ContextManager] = contextlib.nullcontext
+    ) -> None:
+        self.context_factory = context_factory
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        # tie-breaker to keep submission order within a priority
+        self._counter = itertools.count()
+        self._worker = Thread(
+            target=self._run_worker, name="inference-scheduler", daemon=True
+        )
+        self._worker.start()
+
+    def submit(
+        self, fn: Callable[..., Any], *args, priority: int = PRIORITY_INTERACTIVE
+    ) -> Future:
+        """Queue `fn(*args)` to run on the worker thread."""
+        future = Future()
+        self._queue.put((priority, next(self._counter), future, fn, args))
+        return future
+
+    def run(
+        self, fn: Callable[..., Any], *args, priority: int = PRIORITY_INTERACTIVE
+    ) -> Any:
+        """Run `fn(*args)` on the worker thread and wait for its result."""
+        return self.submit(fn, *args, priority=priority).result()
+
+    def stream(
+        self,
+        generator: Generator,
+        priority: int = PRIORITY_PROPAGATION,
+        buffer_size: int = 1,
+    ) -> Iterator[Any]:
+        """
+        Step `generator` on the worker thread, one item per task, and yield its
+        items. The worker runs ahead of the caller by up to `buffer_size` items, so
+        that it never waits for the caller (e.g. for a socket write) while the
+        caller consumes the buffered items, and pauses when the buffer is full, so
+        that a slow consumer doesn't hold the worker (backpressure). The generator
+        is closed on the worker thread as soon as the caller stops iterating (e.g.
+        when the client disconnects or cancels the propagation).
+        """
+        stream = _BufferedStream(self, generator, priority, buffer_size)
+        try:
+            stream.resume()
+            while True:
+                item = stream.get()
+                if item is _END_OF_STREAM:
+                    return
+                yield item
+        finally:
+            stream.close()
+
+    def _run_worker(self) -> None:
+        while True:
+            _, _, future, fn, args = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with self.context_factory():
+                    result = fn(*args)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class _BufferedStream:
+    """The bounded buffer between a generator stepped on the worker and its caller."""
+
+    def __init__(
+        self,
+        scheduler: InferenceScheduler,
+        generator: Generator,
+        priority: int,
+        buffer_size: int,
+    ) -> None:
+        self.scheduler = scheduler
+        self.generator = generator
+        self.priority = priority
+        self.buffer_size = max(buffer_size, 1)
+        self.items: queue.Queue = queue.Queue()
+        self.lock = Lock()
+        # number of items produced and not yet consumed
+        self.num_buffered = 0
+        # whether a step of the generator is queued or running
+        self.stepping = False
+        # whether the generator ended or the caller stopped iterating
+        self.stopped = False
+
+    def resume(self) -> None:
+        """Queue the next step if the buffer has room for its item."""
+        with self.lock:
+            if self.stepping or self.stopped or self.num_buffered >= self.buffer_size:
+                return
+            self.stepping = True
+        self.scheduler.submit(self._step, priority=self.priority)
+
+    def get(self) -> Any:
+        """Wait for the next item (re-raising the generator's exceptions)."""
+        item = self.items.get()
+        if isinstance(item, BaseException):
+            raise item
+        with self.lock:
+            self.num_buffered -= 1
+        self.resume()
+        return item
+
+    def close(self) -> None:
+        with self.lock:
+            self.stopped = True
+        # run the generator's cleanup (e.g. its `finally` blocks) on the worker,
+        # ahead of the other propagation frames
+        self.scheduler.run(self.generator.close, priority=PRIORITY_INTERACTIVE)
+
+    def _step(self) -> None:
+        with self.lock:
+            if self.stopped:
+                self.stepping = False
+                return
+        try:
+            item = next(self.generator, _END_OF_STREAM)
+        except Exception as e:
+            item = e
+        with self.lock:
+            self.stepping = False
+            self.num_buffered += 1
+            if item is _END_OF_STREAM or isinstance(item, BaseException):
+                self.stopped = True
+        self.items.put(item)
+        self.resume()
@@ -0,0 +1,295 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import contextlib
+import io
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# What to do with the state of a session evicted to fit the memory budget:
+# "none" drops the session, "host" saves it into host memory, and "disk" saves it
+# into a file, from which it's restored on the next request to the session.
+SESSION_SPILL_MODES = ("none", "host", "disk")
+
+
+class SessionManager:
+    """
+    Hold the inference sessions of the demo, and free the ones abandoned by their
+    clients (e.g. closed browser tabs, which never call `close_session`).
+
+    - A session expires after `ttl_seconds` without any request (and at the latest
+      `max_lifetime_seconds` after it started), after which it's removed.
+    - If `memory_budget_mb` is set, the least recently used sessions are evicted
+      whenever the memory held by all the live sessions exceeds the budget. Evicted
+      sessions are dropped or, depending on `spill_mode`, saved with
+      `SAM2VideoPredictor.save_state` and restored on their next request.
+
+    Expired sessions are swept whenever a session is added or accessed. Sessions in
+    use (i.e. with an ongoing propagation) are never expired nor evicted.
+
+    The sessions are accessed from the server threads, but restoring, spilling and
+    measuring the inference states runs model code, which must only happen on the
+    inference scheduler's worker thread (see `get_state` and `update_memory`).
+    """
+
+    def __init__(
+        self,
+        predictor,
+        ttl_seconds: float,
+        max_lifetime_seconds: Optional[float] = None,
+        memory_budget_mb: Optional[float] = None,
+        spill_mode: str = "none",
+        spill_path: Optional[Path] = None,
+    ) -> None:
+        if spill_mode not in SESSION_SPILL_MODES:
+            raise ValueError(
+                f"invalid session spill mode: {spill_mode} "
+                f"(must be one of {SESSION_SPILL_MODES})"
+            )
+        if spill_mode == "disk" and spill_path is None:
+            raise ValueError("spill_path must be set to spill sessions to disk")
+        self.predictor = predictor
+        self.ttl_seconds = ttl_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+        self.memory_budget_bytes = (
+            int(memory_budget_mb * 1024**2) if memory_budget_mb else None
+        )
+        self.spill_mode = spill_mode
+        self.spill_path = spill_path
+        if spill_mode == "disk":
+            os.makedirs(spill_path, exist_ok=True)
+        # sessions in the order of their last access (least recently used first)
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = Lock()
+
+    def add(
+        self,
+        session_id: str,
+        inference_state: Dict[str, Any],
+        offload_video_to_cpu: bool,
+    ) -> Dict[str, Any]:
+        now = time.time()
+        session = {
+            "canceled": False,
+            "state": inference_state,
+            "video_path": inference_state["video_path"],
+            "num_frames": inference_state["num_frames"],
+            "offload_video_to_cpu": offload_video_to_cpu,
+            "start_time": now,
+            "last_access_time": now,
+            # number of ongoing propagations (a session in use is never evicted)
+            "num_users": 0,
+            # the saved state of a spilled session (a buffer or a file path)
+            "spilled_state": None,
+            "memory_bytes": 0,
+        }
+        with self._lock:
+            self._sessions[session_id] = session
+        self.update_memory(session_id)
+        return session
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session (without restoring its state) and mark it as used now."""
+        self.evict_expired()
+        with self._lock:
+            session = self._sessions.get(session_id, None)
+            if session is not None:
+                session["last_access_time"] = time.time()
+                self._sessions.move_to_end(session_id)
+        return session
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session without marking it as used (e.g. for background work)."""
+        with self._lock:
+            return self._sessions.get(session_id, None)
+
+    def get_state(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the inference state of a session, restoring it if it was spilled. This
+        must run on the inference worker thread.
+        """
+        session = self.get(session_id)
+        if session is None:
+            return None
+        if session["state"] is None:
+            self._restore(session_id, session)
+        return session["state"]
+
+    @contextlib.contextmanager
+    def in_use(self, session: Dict[str, Any]):
+        """Keep a session from being expired or evicted in this context."""
+        with self._lock:
+            session["num_users"] += 1
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session["num_users"] -= 1
+                session["last_access_time"] = time.time()
+
+    def pop(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._stop_frame_loading(session)
+            self._discard_spilled_state(session)
+        return session
+
+    def get_expiration(self, session: Dict[str, Any]) -> Tuple[int, Optional[int]]:
+        """Get the (expiration time, max expiration time) of a session in seconds."""
+        expiration_time = session["last_access_time"] + self.ttl_seconds
+        max_expiration_time = None
+        if self.max_lifetime_seconds is not None:
+            max_expiration_time = session["start_time"] + self.max_lifetime_seconds
+            expiration_time = min(expiration_time, max_expiration_time)
+            max_expiration_time = int(max_expiration_time)
+        return int(expiration_time), max_expiration_time
+
+    def evict_expired(self) -> None:
+        now = time.time()
+        expired_session_ids = []
+        with self._lock:
+            for session_id, session in self._sessions.items():
+                if session["num_users"] > 0:
+                    continue
+                if now >= self.get_expiration(session)[0]:
+                    expired_session_ids.append(session_id)
+        for session_id in expired_session_ids:
+            if self.pop(session_id) is not None:
+                logger.info(f"session {session_id} expired")
+
+    def update_memory(self, session_id: str) -> None:
+        """
+        Measure the memory held by a session after a request changed it, and evict
+        the least recently used sessions if the budget is exceeded. This must run on
+        the inference worker thread.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id, None)
+        if session is None or session["state"] is None:
+            return
+        session["memory_bytes"] = get_state_memory_bytes(session["state"])
+        self._enforce_memory_budget(keep_session_id=session_id)
+
+    def _enforce_memory_budget(self, keep_session_id: str) -> None:
+        if self.memory_budget_bytes is None:
+            return
+        with self._lock:
+            # least recently used first
+            candidates = [
+                (session_id, session)
+                for session_id, session in self._sessions.items()
+                if session_id != keep_session_id
+                and session["num_users"] == 0
+                and session["state"] is not None
+            ]
+        for session_id, session in candidates:
+            if self.live_memory_bytes() <= self.memory_budget_bytes:
+                break
+            self._evict(session_id, session)
+        if self.live_memory_bytes() > self.memory_budget_bytes:
+            logger.warning(
+                f"the live sessions hold {self.live_memory_bytes() // 1024**2} MiB, "
+                f"over the budget of {self.memory_budget_bytes // 1024**2} MiB, "
+                "but none of them can be evicted"
+            )
+
+    def _evict(self, session_id: str, session: Dict[str, Any]) -> None:
+        if session["num_users"] > 0:
+            # a propagation started on this session in the meantime
+            return
+        if self.spill_mode == "none":
+            self.pop(session_id)
+            logger.info(f"session {session_id} evicted to fit the memory budget")
+            return
+        if self.spill_mode == "host":
+            spilled_state = io.BytesIO()
+        else:
+            spilled_state = self.spill_path / f"{session_id}.pt"
+        self.predictor.save_state(session["state"], spilled_state)
+        self._stop_frame_loading(session)
+        session["spilled_state"] = spilled_state
+        session["state"] = None
+        session["memory_bytes"] = 0
+        logger.info(f"session {session_id} spilled to {self.spill_mode}")
+
+    def _restore(self, session_id: str, session: Dict[str, Any]) -> None:
+        spilled_state = session["spilled_state"]
+        if isinstance(spilled_state, io.BytesIO):
+            spilled_state.seek(0)
+        session["state"] = self.predictor.load_state(
+            spilled_state,
+            video_path=session["video_path"],
+            offload_video_to_cpu=session["offload_video_to_cpu"],
+            async_loading_frames=True,
+        )
+        self._discard_spilled_state(session)
+        logger.info(f"session {session_id} restored from {self.spill_mode}")
+        self.update_memory(session_id)
+
+    def _stop_frame_loading(self, session: Dict[str, Any]) -> None:
+        """Stop decoding the frames of a session loaded asynchronously, if any."""
+        if session["state"] is None:
+            return
+        images = session["state"]["images"]
+        if hasattr(images, "close"):
+            images.close()
+
+    def _discard_spilled_state(self, session: Dict[str, Any]) -> None:
+        spilled_state = session["spilled_state"]
+        session["spilled_state"] = None
+        if isinstance(spilled_state, Path):
+            spilled_state.unlink(missing_ok=True)
+
+    def live_memory_bytes(self) -> int:
+        with self._lock:
+            return sum(s["memory_bytes"] for s in self._sessions.values())
+
+    def spilled_memory_bytes(self) -> int:
+        """Get the size of the sessions spilled to host memory."""
+        with self._lock:
+            return sum(
+                s["spilled_state"].getbuffer().nbytes
+                for s in self._sessions.values()
+                if isinstance(s["spilled_state"], io.BytesIO)
+            )
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return iter(list(self._sessions.items()))
+
+
+def get_state_memory_bytes(inference_state: Dict[str, Any]) -> int:
+    """
+    Get the memory held by the tensors of an inference state (counting the tensors
+    sharing the same storage, e.g. the per-object slices of the outputs, once).
+    """
+    storages = {}
+
+    def _visit(tree):
+        if isinstance(tree, torch.Tensor):
+            storage = tree.untyped_storage()
+            storages[(tree.device, storage.data_ptr())] = storage.nbytes()
+        elif isinstance(tree, dict):
+            for v in tree.values():
+                _visit(v)
+        elif isinstance(tree, (list, tuple)):
+            for v in tree:
+                _visit(v)
+        elif isinstance(getattr(tree, "images", None), list):
+            # frames loaded asynchronously (see `AsyncVideoFrameLoader`)
+            _visit(tree.images)
+
+    _visit(inference_state)
+    return sum(storages.values())
@@ -0,0 +1,118 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("dataclasses_json")
+
+from inference import mask_stream
+from inference.data_types import Mask, PropagateDataResponse, PropagateDataValue
+from inference.mask_stream import batch_frames, get_stream_encoder
+
+SIZE = [96, 128]
+
+
+def _get_frame(frame_idx):
+    return PropagateDataResponse(
+        frame_index=frame_idx,
+        results=[
+            PropagateDataValue(
+                object_id=obj_id,
+                mask=Mask(size=SIZE, counts=f"{frame_idx}Ob{obj_id}0"),
+            )
+            for obj_id in [1, 3]
+        ],
+    )
+
+
+def _decode_binary(format, body):
+    if format == "msgpack":
+        return pytest.importorskip("msgpack").unpackb(body)
+    return pytest.importorskip("cbor2").loads(body)
+
+
+@pytest.mark.parametrize("format", ["msgpack", "cbor"])
+def test_binary_encoders_round_trip(format):
+    frames = [_get_frame(frame_idx) for frame_idx in [4, 5, 6]]
+    body = get_stream_encoder(format)(frames)
+
+    decoded = _decode_binary(format, body)
+    assert decoded["size"] == SIZE
+    assert decoded["frames"] == [
+        [
+            frame.frame_index,
+            [
+                [result.object_id, result.mask.counts.encode("ascii")]
+                for result in frame.results
+            ],
+        ]
+        for frame in frames
+    ]
+
+
+def test_json_encoder_round_trip():
+    frame = _get_frame(2)
+    body = get_stream_encoder("json")([frame])
+    assert PropagateDataResponse.from_dict(json.loads(body)) == frame
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        get_stream_encoder("protobuf")
+
+
+def test_batches_are_full_or_end_the_stream():
+    frames = (_get_frame(frame_idx) for frame_idx in range(7))
+    batches = list(batch_frames(frames, frames_per_part=3))
+    assert [[f.frame_index for f in batch] for batch in batches] == [
+        [0, 1, 2],
+        [3, 4, 5],
+        [6],
+    ]
+
+
+def test_batch_is_sent_when_its_delay_expires(monkeypatch):
+    monkeypatch.setattr(mask_stream, "MAX_BATCH_DELAY_SECONDS", 0.01)
+    first_batch_sent = threading.Event()
+
+    def _slow_frames():
+        yield _get_frame(0)
+        # the next frame takes until the first batch is sent
+        assert first_batch_sent.wait(timeout=5)
+        yield _get_frame(1)
+
+    batches = batch_frames(_slow_frames(), frames_per_part=8)
+    assert [f.frame_index for f in next(batches)] == [0]
+    first_batch_sent.set()
+    assert [[f.frame_index for f in batch] for batch in batches] == [[1]]
+
+
+def test_closing_the_batches_closes_the_frames():
+    frames_closed = threading.Event()
+
+    def _frames():
+        try:
+            for frame_idx in range(100):
+                yield _get_frame(frame_idx)
+        finally:
+            frames_closed.set()
+
+    batches = batch_frames(_frames(), frames_per_part=2)
+    next(batches)
+    batches.close()
+    assert frames_closed.wait(timeout=5)
+
+
+def test_frame_errors_are_raised():
+    def _failing_frames():
+        yield _get_frame(0)
+        raise RuntimeError("propagation failed")
+
+    with pytest.raises(RuntimeError, match="propagation failed"):
+        list(batch_frames(_failing_frames(), frames_per_part=8))
@@ -0,0 +1,83 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("dataclasses_json")
+
+from inference.data_types import Mask, PropagateDataValue
+from inference.result_cache import PropagationResultCache
+
+NUM_FRAMES = 10
+
+
+def _get_results(frame_idx, object_ids=(1, 2)):
+    return [
+        PropagateDataValue(
+            object_id=obj_id, mask=Mask(size=[4, 4], counts=f"{frame_idx}:{obj_id}")
+        )
+        for obj_id in object_ids
+    ]
+
+
+def _get_cached_frames(cache, reverse):
+    return [t for t in range(NUM_FRAMES) if cache.get(t, reverse) is not None]
+
+
+@pytest.fixture
+def cache():
+    """A cache with the results of a forward and a backward propagation."""
+    cache = PropagationResultCache()
+    for reverse in [False, True]:
+        for frame_idx in range(NUM_FRAMES):
+            results = _get_results(frame_idx)
+            cache.put(cache.prompt_revision, frame_idx, reverse, results)
+    return cache
+
+
+def test_repeated_propagation_is_served_from_cache(cache):
+    for reverse in [False, True]:
+        assert _get_cached_frames(cache, reverse) == list(range(NUM_FRAMES))
+        assert cache.get(3, reverse) == _get_results(3)
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_edit_drops_the_results_of_both_directions(cache, reverse):
+    # an edit after a propagation in this direction: the frames tracked before and
+    # after the edited frame attend to its new prompts
+    cache.invalidate()
+
+    assert cache.prompt_revision == 1
+    assert _get_cached_frames(cache, reverse) == []
+    assert _get_cached_frames(cache, not reverse) == []
+
+
+def test_results_of_a_propagation_started_before_an_edit_are_not_stored(cache):
+    prompt_revision = cache.prompt_revision
+    cache.invalidate()
+    cache.put(prompt_revision, 5, False, _get_results(5))
+    assert cache.get(5, False) is None
+
+    cache.put(cache.prompt_revision, 5, False, _get_results(5))
+    assert cache.get(5, False) == _get_results(5)
+
+
+def test_remove_object_keeps_the_results_of_the_other_objects(cache):
+    prompt_revision = cache.prompt_revision
+    cache.remove_object(2, changes_conditioning=False)
+
+    assert cache.prompt_revision == prompt_revision + 1
+    for reverse in [False, True]:
+        assert _get_cached_frames(cache, reverse) == list(range(NUM_FRAMES))
+        for frame_idx in range(NUM_FRAMES):
+            assert cache.get(frame_idx, reverse) == _get_results(frame_idx, [1])
+
+
+def test_remove_object_changing_the_conditioning_frames_drops_all_results(cache):
+    cache.remove_object(2, changes_conditioning=True)
+
+    assert _get_cached_frames(cache, False) == []
+    assert _get_cached_frames(cache, True) == []
@@ -0,0 +1,43 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import threading
+
+import pytest
+
+from data.transcode_pool import TranscodePool
+
+
+@pytest.fixture
+def pool():
+    pool = TranscodePool(num_workers=1, max_pending_jobs=4)
+    yield pool
+    pool._executor.shutdown(wait=True)
+
+
+def test_cached_result_does_not_replace_a_running_job(pool):
+    release = threading.Event()
+    job, is_new_job = pool.submit("a", lambda job: release.wait(timeout=5))
+    assert is_new_job
+
+    # a duplicate upload finds a (partial) output of the running job
+    assert pool.put_result("a", "partial") is job
+    assert pool.get_job("a") is job
+    release.set()
+    assert job.result() is True
+
+
+def test_cached_result_replaces_a_failed_job(pool):
+    def _fail(job):
+        raise RuntimeError("transcoding failed")
+
+    job, _ = pool.submit("a", _fail)
+    with pytest.raises(RuntimeError):
+        job.result()
+
+    cached_job = pool.put_result("a", "cached")
+    assert cached_job is not job
+    assert pool.get_job("a") is cached_job
+    assert cached_job.result() == "cached"
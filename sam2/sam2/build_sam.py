@@ -4,8 +4,11 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import contextlib
+import functools
 import logging
 import os
+import time
 
 import torch
 from hydra import compose
@@ -13,6 +16,8 @@ from hydra.utils import instantiate
 from omegaconf import OmegaConf
 
 import sam2
+from sam2.utils.misc import configure_cpu_threads, get_default_device
+from sam2.utils.precision import PrecisionPolicy
 
 # Check if the user is running Python from the parent directory of the sam2 repo
 # (i.e. the directory where this repo is cloned into) -- this is not supported since
@@ -87,11 +92,7 @@ def build_sam2(
             "++model.sam_mask_decoder_extra_args.dynamic_multimask_stability_thresh=0.98",
         ]
     # Read config and init model
-    cfg = compose(config_name=config_file, overrides=hydra_overrides_extra)
-    OmegaConf.resolve(cfg)
-    model = instantiate(cfg.model, _recursive_=True)
-    _load_checkpoint(model, ckpt_path)
-    model = model.to(device)
+    model = _build_model(config_file, hydra_overrides_extra, ckpt_path, device)
     if mode == "eval":
         model.eval()
     return model
@@ -100,15 +101,62 @@ def build_sam2(
 def build_sam2_video_predictor(
     config_file,
     ckpt_path=None,
-    device="cuda",
+    device=None,
     mode="eval",
     hydra_overrides_extra=[],
     apply_postprocessing=True,
+    precision=None,
+    num_threads=None,
+    num_interop_threads=None,
+    quantize_int8=False,
+    image_size=None,
+    fast_init=True,
     **kwargs,
 ):
+    """
+    Build a SAM2VideoPredictor. `precision` sets the compute precision policy of
+    the backbone, memory and decoder components: a precision name ("fp32", "bf16"
+    or "fp16") for all of them, a dict such as {"backbone": "bf16", "memory": "bf16",
+    "decoder": "fp32"}, or None to keep the precision of the caller.
+
+    `device` defaults to CUDA if it's available and CPU otherwise. On CPU,
+    `num_threads` and `num_interop_threads` size PyTorch's intra-op and inter-op
+    thread pools (see `configure_cpu_threads` for the defaults).
+
+    `quantize_int8=True` (CPU only) applies int8 dynamic quantization to the linear
+    layers in the memory attention and in the SAM mask decoder's two-way transformer,
+    which dominate the per-frame cost after the image encoder on CPU.
+
+    `image_size` overrides the inference resolution of the config (e.g. 512 or 768
+    instead of 1024) to trade accuracy for throughput; it must be a multiple of 32.
+
+    With `fast_init=True` (the default) and a checkpoint, the model is instantiated
+    on the meta device (skipping the random weight initialization) and the weights
+    are memory-mapped from the checkpoint. The time spent in each step of the
+    construction is logged and kept in `predictor.startup_times`.
+    """
+    if device is None:
+        device = get_default_device()
     hydra_overrides = [
         "++model._target_=sam2.sam2_video_predictor.SAM2VideoPredictor",
     ]
+    policy = PrecisionPolicy.from_spec(precision)
+    if quantize_int8:
+        if torch.device(device).type != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        if policy is not None and (
+            policy.dtype("memory") != torch.float32
+            or policy.dtype("decoder") != torch.float32
+        ):
+            # the dynamically quantized linear layers take float32 inputs
+            raise ValueError(
+                "int8 dynamic quantization requires fp32 memory and decoder precision"
+            )
+    if image_size is not None:
+        hydra_overrides.extend(_get_image_size_overrides(image_size))
+    if policy is not None:
+        policy_spec = ",".join(f"{k}:{v}" for k, v in policy.to_spec().items())
+        hydra_overrides.append(f"++model.precision_policy={{{policy_spec}}}")
     if apply_postprocessing:
         hydra_overrides_extra = hydra_overrides_extra.copy()
         hydra_overrides_extra += [
@@ -124,16 +172,131 @@ def build_sam2_video_predictor(
     hydra_overrides.extend(hydra_overrides_extra)
 
     # Read config and init model
-    cfg = compose(config_name=config_file, overrides=hydra_overrides)
-    OmegaConf.resolve(cfg)
-    model = instantiate(cfg.model, _recursive_=True)
-    _load_checkpoint(model, ckpt_path)
-    model = model.to(device)
+    model = _build_model(config_file, hydra_overrides, ckpt_path, device, fast_init)
+    start = time.perf_counter()
+    if model.device.type == "cpu":
+        _configure_cpu_inference(model, num_threads, num_interop_threads)
     if mode == "eval":
         model.eval()
+    if quantize_int8:
+        _quantize_tracking_heads(model)
+    model.startup_times["configure"] = time.perf_counter() - start
+    model.startup_times["total"] = sum(model.startup_times.values())
+    logging.info(
+        "Built the video predictor in "
+        + ", ".join(f"{k} {v:.2f}s" for k, v in model.startup_times.items())
+    )
     return model
 
 
+@functools.lru_cache(maxsize=16)
+def _compose_config(config_file, hydra_overrides):
+    """Compose and resolve a model config (cached, since composing it is slow)."""
+    cfg = compose(config_name=config_file, overrides=list(hydra_overrides))
+    OmegaConf.resolve(cfg)
+    return cfg
+
+
+def _build_model(config_file, hydra_overrides, ckpt_path, device, fast_init=False):
+    """
+    Instantiate the model from its config and load its checkpoint onto `device`.
+    With `fast_init` and a checkpoint, the model is instantiated on the meta device
+    and its parameters and buffers are replaced with the (memory-mapped) checkpoint
+    tensors, instead of allocating and randomly initializing weights that are
+    overwritten (see `_init_non_persistent_tensors` for the other tensors).
+    """
+    startup_times = {}
+    start = time.perf_counter()
+    cfg = _compose_config(config_file, tuple(hydra_overrides))
+    startup_times["compose"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_init = fast_init and ckpt_path is not None
+    # the default device set by `torch.device` only applies to the current thread
+    with torch.device("meta") if fast_init else contextlib.nullcontext():
+        model = instantiate(cfg.model, _recursive_=True)
+    startup_times["instantiate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _load_checkpoint(model, ckpt_path, assign=fast_init)
+    if fast_init:
+        _init_non_persistent_tensors(model)
+    startup_times["load_checkpoint"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = model.to(device)
+    startup_times["to_device"] = time.perf_counter() - start
+    model.startup_times = startup_times
+    return model
+
+
+def _init_non_persistent_tensors(model):
+    """
+    Compute the tensors of a model instantiated on the meta device that aren't in its
+    state dict (so they're not loaded from the checkpoint): the modules with such
+    tensors (e.g. the RoPE tables) recompute them in `reset_non_persistent_tensors`.
+    Any tensor that is still on the meta device is reported.
+    """
+    for module in model.modules():
+        if hasattr(module, "reset_non_persistent_tensors"):
+            module.reset_non_persistent_tensors()
+
+    tensors = list(model.named_parameters()) + list(model.named_buffers())
+    for module_name, module in model.named_modules():
+        for name, value in vars(module).items():
+            if isinstance(value, torch.Tensor):
+                tensors.append((f"{module_name}.{name}", value))
+    for name, tensor in tensors:
+        if tensor.is_meta:
+            raise RuntimeError(f"{name} was not loaded from the checkpoint or reset")
+
+
+def _get_image_size_overrides(image_size, backbone_stride=16):
+    """Hydra overrides to run the model at a different input resolution."""
+    # the Hiera trunk tiles its window positional embedding (8x8 at stride 4) over the
+    # stride-4 feature map, so the resolution must be a multiple of 32
+    if image_size <= 0 or image_size % 32 != 0:
+        raise ValueError(
+            f"image_size must be a positive multiple of 32, got {image_size}"
+        )
+    # the RoPE tables in the memory attention are precomputed for the stride-16 feature
+    # size (the image encoder and the SAM heads derive their sizes from `image_size`)
+    feat_size = image_size // backbone_stride
+    rope_feat_sizes = f"[{feat_size},{feat_size}]"
+    return [
+        f"++model.image_size={image_size}",
+        f"++model.memory_attention.layer.self_attention.feat_sizes={rope_feat_sizes}",
+        f"++model.memory_attention.layer.cross_attention.feat_sizes={rope_feat_sizes}",
+    ]
+
+
+def _configure_cpu_inference(model, num_threads=None, num_interop_threads=None):
+    """Size the CPU thread pools and use channels-last weights in the conv layers."""
+    num_threads, num_interop_threads = configure_cpu_threads(
+        num_threads, num_interop_threads
+    )
+    logging.info(
+        f"CPU inference with {num_threads} intra-op and "
+        f"{num_interop_threads} inter-op threads"
+    )
+    # oneDNN convolutions are faster in NHWC, and the backbone permutes its
+    # feature maps to channels-last layout anyway
+    for module in model.modules():
+        if isinstance(module, (torch.nn.Conv2d, torch.nn.ConvTranspose2d)):
+            module.to(memory_format=torch.channels_last)
+
+
+def _quantize_tracking_heads(model):
+    """
+    Apply int8 dynamic quantization (int8 weights, activations quantized on the fly)
+    to the linear layers in the memory attention and the SAM mask decoder transformer.
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    for module in [model.memory_attention, model.sam_mask_decoder.transformer]:
+        quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
 def _hf_download(model_id):
     from huggingface_hub import hf_hub_download
 
@@ -154,10 +317,14 @@ def build_sam2_video_predictor_hf(model_id, **kwargs):
     )
 
 
-def _load_checkpoint(model, ckpt_path):
+def _load_checkpoint(model, ckpt_path, assign=False):
     if ckpt_path is not None:
-        sd = torch.load(ckpt_path, map_location="cpu", weights_only=True)["model"]
-        missing_keys, unexpected_keys = model.load_state_dict(sd)
+        # memory-map the checkpoint, so that only the tensors are read from disk
+        # (and, with `assign=True`, directly used as the model's parameters)
+        sd = torch.load(
+            ckpt_path, map_location="cpu", weights_only=True, mmap=True
+        )["model"]
+        missing_keys, unexpected_keys = model.load_state_dict(sd, assign=assign)
         if missing_keys:
             logging.error(missing_keys)
             raise RuntimeError()
@@ -225,8 +225,9 @@ class Hiera(nn.Module):
             torch.zeros(1, embed_dim, self.window_spec[0], self.window_spec[0])
         )
 
+        # (on CPU, since the model can be instantiated on the meta device)
         dpr = [
-            x.item() for x in torch.linspace(0, drop_path_rate, depth)
+            x.item() for x in torch.linspace(0, drop_path_rate, depth, device="cpu")
         ]  # stochastic depth decay rule
 
         cur_stage = 1
@@ -8,7 +8,7 @@ import contextlib
 import math
 import warnings
 from functools import partial
-from typing import Tuple, Type
+from typing import Optional, Tuple, Type
 
 import torch
 import torch.nn.functional as F
@@ -25,12 +25,16 @@ OLD_GPU, USE_FLASH_ATTN, MATH_KERNEL_ON = get_sdpa_settings()
 ALLOW_ALL_KERNELS = False
 
 
-def sdp_kernel_context(dropout_p):
+def sdp_kernel_context(dropout_p, attn_mask=None, device=None):
     """
     Get the context for the attention scaled dot-product kernel. We use Flash Attention
-    by default, but fall back to all available kernels if Flash Attention fails.
+    by default, but fall back to all available kernels if Flash Attention fails (or if
+    an attention mask is used, which Flash Attention doesn't support). On non-CUDA
+    devices, PyTorch picks the kernel itself.
     """
-    if ALLOW_ALL_KERNELS:
+    if ALLOW_ALL_KERNELS or attn_mask is not None:
+        return contextlib.nullcontext()
+    if device is not None and device.type != "cuda":
         return contextlib.nullcontext()
 
     return torch.backends.cuda.sdp_kernel(
@@ -252,7 +256,9 @@ class Attention(nn.Module):
         x = x.transpose(1, 2)
         return x.reshape(b, n_tokens, n_heads * c_per_head)  # B x N_tokens x C
 
-    def forward(self, q: Tensor, k: Tensor, v: Tensor) -> Tensor:
+    def forward(
+        self, q: Tensor, k: Tensor, v: Tensor, attn_mask: Optional[Tensor] = None
+    ) -> Tensor:
         # Input projections
         q = self.q_proj(q)
         k = self.k_proj(k)
@@ -266,8 +272,10 @@ class Attention(nn.Module):
         dropout_p = self.dropout_p if self.training else 0.0
         # Attention
         try:
-            with sdp_kernel_context(dropout_p):
-                out = F.scaled_dot_product_attention(q, k, v, dropout_p=dropout_p)
+            with sdp_kernel_context(dropout_p, attn_mask, q.device):
+                out = F.scaled_dot_product_attention(
+                    q, k, v, attn_mask=attn_mask, dropout_p=dropout_p
+                )
         except Exception as e:
             # Fall back to all kernels if the Flash attention kernel fails
             warnings.warn(
@@ -278,7 +286,9 @@ class Attention(nn.Module):
             )
             global ALLOW_ALL_KERNELS
             ALLOW_ALL_KERNELS = True
-            out = F.scaled_dot_product_attention(q, k, v, dropout_p=dropout_p)
+            out = F.scaled_dot_product_attention(
+                q, k, v, attn_mask=attn_mask, dropout_p=dropout_p
+            )
 
         out = self._recombine_heads(out)
         out = self.out_proj(out)
@@ -304,12 +314,23 @@ class RoPEAttention(Attention):
         self.compute_cis = partial(
             compute_axial_cis, dim=self.internal_dim // self.num_heads, theta=rope_theta
         )
-        freqs_cis = self.compute_cis(end_x=feat_sizes[0], end_y=feat_sizes[1])
-        self.freqs_cis = freqs_cis
+        self.feat_sizes = tuple(feat_sizes)
+        self.reset_non_persistent_tensors()
         self.rope_k_repeat = rope_k_repeat
 
+    def reset_non_persistent_tensors(self):
+        """Compute the RoPE table (which isn't in the state dict)."""
+        self.freqs_cis = self.compute_cis(
+            end_x=self.feat_sizes[0], end_y=self.feat_sizes[1]
+        )
+
     def forward(
-        self, q: Tensor, k: Tensor, v: Tensor, num_k_exclude_rope: int = 0
+        self,
+        q: Tensor,
+        k: Tensor,
+        v: Tensor,
+        num_k_exclude_rope: int = 0,
+        attn_mask: Optional[Tensor] = None,
     ) -> Tensor:
         # Input projections
         q = self.q_proj(q)
@@ -340,8 +361,10 @@ class RoPEAttention(Attention):
         dropout_p = self.dropout_p if self.training else 0.0
         # Attention
         try:
-            with sdp_kernel_context(dropout_p):
-                out = F.scaled_dot_product_attention(q, k, v, dropout_p=dropout_p)
+            with sdp_kernel_context(dropout_p, attn_mask, q.device):
+                out = F.scaled_dot_product_attention(
+                    q, k, v, attn_mask=attn_mask, dropout_p=dropout_p
+                )
         except Exception as e:
             # Fall back to all kernels if the Flash attention kernel fails
             warnings.warn(
@@ -352,7 +375,9 @@ class RoPEAttention(Attention):
             )
             global ALLOW_ALL_KERNELS
             ALLOW_ALL_KERNELS = True
-            out = F.scaled_dot_product_attention(q, k, v, dropout_p=dropout_p)
+            out = F.scaled_dot_product_attention(
+                q, k, v, attn_mask=attn_mask, dropout_p=dropout_p
+            )
 
         out = self._recombine_heads(out)
         out = self.out_proj(out)
@@ -4,6 +4,8 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import contextlib
+
 from loguru import logger
 
 import torch
@@ -18,12 +20,32 @@ from sam2.modeling.sam.transformer import TwoWayTransformer
 from sam2.modeling.sam2_utils import get_1d_sine_pe, MLP, select_closest_cond_frames
 
 from sam2.utils.kalman_filter import KalmanFilter
+from sam2.utils.precision import cast_floating, PrecisionPolicy
 
 # a large negative value as a placeholder score for missing objects
 NO_OBJ_SCORE = -1024.0
 
 
+def _samurai_state_property(key):
+    """An attribute of the model kept in its current `samurai_state`."""
+
+    def _get(self):
+        return self.samurai_state[key]
+
+    def _set(self, value):
+        self.samurai_state[key] = value
+
+    return property(_get, _set)
+
+
 class SAM2Base(torch.nn.Module):
+    # the SAMURAI Kalman filter state of the video being tracked
+    kf_mean = _samurai_state_property("kf_mean")
+    kf_covariance = _samurai_state_property("kf_covariance")
+    stable_frames = _samurai_state_property("stable_frames")
+    history = _samurai_state_property("history")
+    frame_cnt = _samurai_state_property("frame_cnt")
+
     def __init__(
         self,
         image_encoder,
@@ -97,6 +119,15 @@ class SAM2Base(torch.nn.Module):
         # extra arguments used to construct the SAM mask decoder; if not None, it should be a dict of kwargs to be passed into `MaskDecoder` class.
         sam_mask_decoder_extra_args=None,
         compile_image_encoder: bool = False,
+        # whether to compile the per-frame tracking modules (memory attention, SAM mask decoder
+        # and memory encoder) with static shapes; the memory bank is padded to a fixed number of
+        # slots so that its shape doesn't change from frame to frame
+        compile_track_step: bool = False,
+        # the compute precision of the backbone, memory and decoder components, either a
+        # precision name ("fp32", "bf16" or "fp16") for all of them or a dict such as
+        # {"backbone": "bf16", "memory": "bf16", "decoder": "fp32"} (see `PrecisionPolicy`);
+        # None keeps the precision of the caller (e.g. an outer `torch.autocast`)
+        precision_policy=None,
         # Whether to use SAMURAI or original SAM 2
         samurai_mode: bool = False,
         # Hyperparameters for SAMURAI
@@ -194,19 +225,19 @@ class SAM2Base(torch.nn.Module):
 
         self._build_sam_heads()
         self.max_cond_frames_in_attn = max_cond_frames_in_attn
+        # whether the SAM heads upsample all the candidate masks to the image size (for
+        # the losses on each of them in training and validation); inference predictors
+        # turn it off to only upsample the selected candidate
+        self.upsample_all_mask_candidates = True
 
         # Whether to use SAMURAI or original SAM 2
         self.samurai_mode = samurai_mode
 
         # Init Kalman Filter
         self.kf = KalmanFilter()
-        self.kf_mean = None
-        self.kf_covariance = None
-        self.stable_frames = 0
-
-        # Debug purpose
-        self.history = {} # debug
-        self.frame_cnt = 0 # debug
+        # its state is specific to a video (the video predictor keeps one per session
+        # and sets it as the model's current state before tracking a frame)
+        self.samurai_state = self.init_samurai_state()
 
         # Hyperparameters for SAMURAI
         self.stable_frames_threshold = stable_frames_threshold
@@ -231,11 +262,60 @@ class SAM2Base(torch.nn.Module):
                 fullgraph=True,
                 dynamic=False,
             )
+        self.precision_policy = PrecisionPolicy.from_spec(precision_policy)
+        self.compile_track_step = compile_track_step
+        if compile_track_step:
+            print(
+                "Track step compilation is enabled. First forward passes will be slow."
+            )
+            # the SAM mask decoder stays eager, since its prompt tokens (and thus its
+            # shapes) change with the number of clicks on each frame
+            for module in [self.memory_attention, self.memory_encoder]:
+                module.forward = torch.compile(module.forward, dynamic=False)
 
     @property
     def device(self):
         return next(self.parameters()).device
 
+    @staticmethod
+    def init_samurai_state():
+        """A new SAMURAI Kalman filter state, before tracking any frame."""
+        return {
+            "kf_mean": None,
+            "kf_covariance": None,
+            "stable_frames": 0,
+            # Debug purpose
+            "history": {},
+            "frame_cnt": 0,
+        }
+
+    @property
+    def memory_storage_dtype(self):
+        """The dtype to store the memory features in."""
+        if self.precision_policy is None:
+            # bfloat16 halves the memory footprint of the stored features
+            return torch.bfloat16
+        return self.precision_policy.memory_storage_dtype
+
+    def _autocast(self, component):
+        """The autocast context of `component` under the precision policy."""
+        if self.precision_policy is None:
+            return contextlib.nullcontext()
+        return self.precision_policy.autocast(component, self.device.type)
+
+    @staticmethod
+    def _profile(profiler, stage):
+        """The profiling context of a tracking stage (if a `StageProfiler` is given)."""
+        if profiler is None:
+            return contextlib.nullcontext()
+        return profiler.stage(stage)
+
+    def _to_policy_output(self, outputs):
+        """Cast the outputs of a component to float32 under the precision policy."""
+        if self.precision_policy is None:
+            return outputs
+        return cast_floating(outputs)
+
     def forward(self, *args, **kwargs):
         raise NotImplementedError(
             "Please use the corresponding methods in SAM2VideoPredictor for inference or SAM2Train for training/fine-tuning"
@@ -299,6 +379,7 @@ class SAM2Base(torch.nn.Module):
         mask_inputs=None,
         high_res_features=None,
         multimask_output=False,
+        skip_high_res_if_absent=False,
     ):
         """
         Forward SAM prompt encoders and mask heads.
@@ -318,6 +399,9 @@ class SAM2Base(torch.nn.Module):
         - multimask_output: if it's True, we output 3 candidate masks and their 3
           corresponding IoU estimates, and if it's False, we output only 1 mask and
           its corresponding IoU estimate.
+        - skip_high_res_if_absent: if it's True and no object appears in the frame,
+          the high-resolution masks (and the SAMURAI box tracking on them) are skipped
+          and `high_res_multimasks` and `high_res_masks` are returned as None.
 
         Outputs:
         - low_res_multimasks: [B, M, H*4, W*4] shape (where M = 3 if
@@ -327,7 +411,8 @@ class SAM2Base(torch.nn.Module):
         - high_res_multimasks: [B, M, H*16, W*16] shape (where M = 3
           if `multimask_output=True` and M = 1 if `multimask_output=False`),
           upsampled from the low-resolution masks, with shape size as the image
-          (stride is 1 pixel).
+          (stride is 1 pixel). It's None if `upsample_all_mask_candidates` is off (at
+          inference, where only the selected mask is upsampled to `high_res_masks`).
         - ious, [B, M] shape, where (where M = 3 if `multimask_output=True` and M = 1
           if `multimask_output=False`), the estimated IoU of each output mask.
         - low_res_masks: [B, 1, H*4, W*4] shape, the best mask in `low_res_multimasks`.
@@ -375,25 +460,27 @@ class SAM2Base(torch.nn.Module):
             # a learned `no_mask_embed` to indicate no mask input in this case).
             sam_mask_prompt = None
 
-        sparse_embeddings, dense_embeddings = self.sam_prompt_encoder(
-            points=(sam_point_coords, sam_point_labels),
-            boxes=None,
-            masks=sam_mask_prompt,
-        )
+        with self._autocast("decoder"):
+            sparse_embeddings, dense_embeddings = self.sam_prompt_encoder(
+                points=(sam_point_coords, sam_point_labels),
+                boxes=None,
+                masks=sam_mask_prompt,
+            )
+            decoder_out = self.sam_mask_decoder(
+                image_embeddings=backbone_features,
+                image_pe=self.sam_prompt_encoder.get_dense_pe(),
+                sparse_prompt_embeddings=sparse_embeddings,
+                dense_prompt_embeddings=dense_embeddings,
+                multimask_output=multimask_output,
+                repeat_image=False,  # the image is already batched
+                high_res_features=high_res_features,
+            )
         (
             low_res_multimasks,
             ious,
             sam_output_tokens,
             object_score_logits,
-        ) = self.sam_mask_decoder(
-            image_embeddings=backbone_features,
-            image_pe=self.sam_prompt_encoder.get_dense_pe(),
-            sparse_prompt_embeddings=sparse_embeddings,
-            dense_prompt_embeddings=dense_embeddings,
-            multimask_output=multimask_output,
-            repeat_image=False,  # the image is already batched
-            high_res_features=high_res_features,
-        )
+        ) = self._to_policy_output(decoder_out)
         if self.pred_obj_scores:
             is_obj_appearing = object_score_logits > self.min_obj_score_logits
 
@@ -408,12 +495,44 @@ class SAM2Base(torch.nn.Module):
         # convert masks from possibly bfloat16 (or float16) to float32
         # (older PyTorch versions before 2.1 don't support `interpolate` on bf16)
         low_res_multimasks = low_res_multimasks.float()
-        high_res_multimasks = F.interpolate(
-            low_res_multimasks,
-            size=(self.image_size, self.image_size),
-            mode="bilinear",
-            align_corners=False,
-        )
+        if (
+            skip_high_res_if_absent
+            and self.pred_obj_scores
+            and not is_obj_appearing.any()
+        ):
+            # all the masks are NO_OBJ_SCORE, so there's nothing to upsample or to track
+            # with the Kalman filter (which is re-initialized once the object reappears)
+            self.stable_frames = 0
+            best_iou_inds = torch.argmax(ious, dim=-1) if multimask_output else 0
+            batch_inds = torch.arange(B, device=device)
+            sam_output_token = sam_output_tokens[:, 0]
+            if multimask_output:
+                low_res_masks = low_res_multimasks[batch_inds, best_iou_inds]
+                low_res_masks = low_res_masks.unsqueeze(1)
+                if sam_output_tokens.size(1) > 1:
+                    sam_output_token = sam_output_tokens[batch_inds, best_iou_inds]
+            else:
+                low_res_masks = low_res_multimasks
+            obj_ptr = self._get_obj_ptr(
+                sam_output_token, object_score_logits, is_obj_appearing
+            )
+            return (
+                low_res_multimasks,
+                None,
+                ious,
+                low_res_masks,
+                None,
+                obj_ptr,
+                object_score_logits,
+                ious[0][best_iou_inds],
+                None,
+            )
+
+        # For the losses, all the candidate masks are upsampled; in the video predictor
+        # (see `upsample_all_mask_candidates`), only the selected one is upsampled below
+        high_res_multimasks = None
+        if self.upsample_all_mask_candidates:
+            high_res_multimasks = self._upsample_to_image_size(low_res_multimasks)
 
         sam_output_token = sam_output_tokens[:, 0]
         kf_ious = None
@@ -422,7 +541,7 @@ class SAM2Base(torch.nn.Module):
                 best_iou_inds = torch.argmax(ious, dim=-1)
                 batch_inds = torch.arange(B, device=device)
                 low_res_masks = low_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
-                high_res_masks = high_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
+                high_res_masks = self._upsample_to_image_size(low_res_masks)
                 non_zero_indices = torch.argwhere(high_res_masks[0][0] > 0.0)
                 if len(non_zero_indices) == 0:
                     high_res_bbox = [0, 0, 0, 0]
@@ -440,7 +559,7 @@ class SAM2Base(torch.nn.Module):
                 best_iou_inds = torch.argmax(ious, dim=-1)
                 batch_inds = torch.arange(B, device=device)
                 low_res_masks = low_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
-                high_res_masks = high_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
+                high_res_masks = self._upsample_to_image_size(low_res_masks)
                 non_zero_indices = torch.argwhere(high_res_masks[0][0] > 0.0)
                 if len(non_zero_indices) == 0:
                     high_res_bbox = [0, 0, 0, 0]
@@ -461,13 +580,7 @@ class SAM2Base(torch.nn.Module):
                 high_res_multibboxes = []
                 batch_inds = torch.arange(B, device=device)
                 for i in range(ious.shape[1]):
-                    non_zero_indices = torch.argwhere(high_res_multimasks[batch_inds, i].unsqueeze(1)[0][0] > 0.0)
-                    if len(non_zero_indices) == 0:
-                        high_res_multibboxes.append([0, 0, 0, 0])
-                    else:
-                        y_min, x_min = non_zero_indices.min(dim=0).values
-                        y_max, x_max = non_zero_indices.max(dim=0).values
-                        high_res_multibboxes.append([x_min.item(), y_min.item(), x_max.item(), y_max.item()])
+                    high_res_multibboxes.append(self._get_high_res_bbox(low_res_multimasks[0, i]))
                 # compute the IoU between the predicted bbox and the high_res_multibboxes
                 kf_ious = torch.tensor(self.kf.compute_iou(self.kf_mean[:4], high_res_multibboxes), device=device)
                 # weighted iou
@@ -475,7 +588,7 @@ class SAM2Base(torch.nn.Module):
                 best_iou_inds = torch.argmax(weighted_ious, dim=-1)
                 batch_inds = torch.arange(B, device=device)
                 low_res_masks = low_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
-                high_res_masks = high_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
+                high_res_masks = self._upsample_to_image_size(low_res_masks)
                 if sam_output_tokens.size(1) > 1:
                     sam_output_token = sam_output_tokens[batch_inds, best_iou_inds]
 
@@ -501,25 +614,20 @@ class SAM2Base(torch.nn.Module):
             best_iou_inds = torch.argmax(ious, dim=-1)
             batch_inds = torch.arange(B, device=device)
             low_res_masks = low_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
-            high_res_masks = high_res_multimasks[batch_inds, best_iou_inds].unsqueeze(1)
+            high_res_masks = self._upsample_to_image_size(low_res_masks)
             if sam_output_tokens.size(1) > 1:
                 sam_output_token = sam_output_tokens[batch_inds, best_iou_inds]
         else:
             best_iou_inds = 0
             low_res_masks, high_res_masks = low_res_multimasks, high_res_multimasks
+            if high_res_masks is None:
+                high_res_masks = self._upsample_to_image_size(low_res_masks)
 
-        # Extract object pointer from the SAM output token (with occlusion handling)
-        obj_ptr = self.obj_ptr_proj(sam_output_token)
-        if self.pred_obj_scores:
-            # Allow *soft* no obj ptr, unlike for masks
-            if self.soft_no_obj_ptr:
-                lambda_is_obj_appearing = object_score_logits.sigmoid()
-            else:
-                lambda_is_obj_appearing = is_obj_appearing.float()
-
-            if self.fixed_no_obj_ptr:
-                obj_ptr = lambda_is_obj_appearing * obj_ptr
-            obj_ptr = obj_ptr + (1 - lambda_is_obj_appearing) * self.no_obj_ptr
+        obj_ptr = self._get_obj_ptr(
+            sam_output_token,
+            object_score_logits,
+            is_obj_appearing if self.pred_obj_scores else None,
+        )
 
         return (
             low_res_multimasks,
@@ -533,6 +641,68 @@ class SAM2Base(torch.nn.Module):
             kf_ious[best_iou_inds] if kf_ious is not None else None,
         )
 
+    def _upsample_to_image_size(self, low_res_masks):
+        """Upsample [B, M, H*4, W*4] mask logits to the image size."""
+        return F.interpolate(
+            low_res_masks,
+            size=(self.image_size, self.image_size),
+            mode="bilinear",
+            align_corners=False,
+        )
+
+    def _get_high_res_bbox(self, low_res_mask):
+        """
+        Get the box [x_min, y_min, x_max, y_max] of the positive pixels in the high-res
+        version of a [H*4, W*4] low-res mask, by only upsampling its crop around the
+        positive low-res pixels. It's the same as the box on the fully upsampled mask:
+        a bilinearly interpolated pixel is a convex combination of its 2x2 neighboring
+        low-res pixels, so it can only be positive next to a positive low-res pixel,
+        and a margin of 2 low-res pixels keeps them away from the crop borders (where
+        the interpolation would clamp differently than on the full mask).
+        """
+        h, w = low_res_mask.shape
+        scale = self.image_size // w
+        non_zero_indices = torch.argwhere(low_res_mask > 0.0)
+        if len(non_zero_indices) == 0:
+            return [0, 0, 0, 0]
+        y_min, x_min = non_zero_indices.min(dim=0).values.tolist()
+        y_max, x_max = non_zero_indices.max(dim=0).values.tolist()
+        y_min, x_min = max(y_min - 2, 0), max(x_min - 2, 0)
+        y_max, x_max = min(y_max + 2, h - 1), min(x_max + 2, w - 1)
+        crop = low_res_mask[y_min : y_max + 1, x_min : x_max + 1]
+        high_res_crop = F.interpolate(
+            crop[None, None],
+            size=(crop.size(0) * scale, crop.size(1) * scale),
+            mode="bilinear",
+            align_corners=False,
+        )
+        non_zero_indices = torch.argwhere(high_res_crop[0, 0] > 0.0)
+        if len(non_zero_indices) == 0:
+            return [0, 0, 0, 0]
+        crop_y_min, crop_x_min = non_zero_indices.min(dim=0).values.tolist()
+        crop_y_max, crop_x_max = non_zero_indices.max(dim=0).values.tolist()
+        return [
+            x_min * scale + crop_x_min,
+            y_min * scale + crop_y_min,
+            x_min * scale + crop_x_max,
+            y_min * scale + crop_y_max,
+        ]
+
+    def _get_obj_ptr(self, sam_output_token, object_score_logits, is_obj_appearing):
+        """Extract object pointer from the SAM output token (with occlusion handling)."""
+        obj_ptr = self.obj_ptr_proj(sam_output_token)
+        if self.pred_obj_scores:
+            # Allow *soft* no obj ptr, unlike for masks
+            if self.soft_no_obj_ptr:
+                lambda_is_obj_appearing = object_score_logits.sigmoid()
+            else:
+                lambda_is_obj_appearing = is_obj_appearing.float()
+
+            if self.fixed_no_obj_ptr:
+                obj_ptr = lambda_is_obj_appearing * obj_ptr
+            obj_ptr = obj_ptr + (1 - lambda_is_obj_appearing) * self.no_obj_ptr
+        return obj_ptr
+
     def _use_mask_as_output(self, backbone_features, high_res_features, mask_inputs):
         """
         Directly turn binary `mask_inputs` into a output mask logits without using SAM.
@@ -589,17 +759,18 @@ class SAM2Base(torch.nn.Module):
 
     def forward_image(self, img_batch: torch.Tensor):
         """Get the image feature on the input batch."""
-        backbone_out = self.image_encoder(img_batch)
-        if self.use_high_res_features_in_sam:
-            # precompute projected level 0 and level 1 features in SAM decoder
-            # to avoid running it again on every SAM click
-            backbone_out["backbone_fpn"][0] = self.sam_mask_decoder.conv_s0(
-                backbone_out["backbone_fpn"][0]
-            )
-            backbone_out["backbone_fpn"][1] = self.sam_mask_decoder.conv_s1(
-                backbone_out["backbone_fpn"][1]
-            )
-        return backbone_out
+        with self._autocast("backbone"):
+            backbone_out = self.image_encoder(img_batch)
+            if self.use_high_res_features_in_sam:
+                # precompute projected level 0 and level 1 features in SAM decoder
+                # to avoid running it again on every SAM click
+                backbone_out["backbone_fpn"][0] = self.sam_mask_decoder.conv_s0(
+                    backbone_out["backbone_fpn"][0]
+                )
+                backbone_out["backbone_fpn"][1] = self.sam_mask_decoder.conv_s1(
+                    backbone_out["backbone_fpn"][1]
+                )
+        return self._to_policy_output(backbone_out)
 
     def _prepare_backbone_features(self, backbone_out):
         """Prepare and flatten visual features."""
@@ -617,6 +788,92 @@ class SAM2Base(torch.nn.Module):
 
         return backbone_out, vision_feats, vision_pos_embeds, feat_sizes
 
+    def _select_memory_frames(self, frame_idx, output_dict, track_in_reverse=False):
+        """
+        Select the outputs of previous frames that the current frame at `frame_idx`
+        attends to in the memory attention.
+
+        Outputs:
+        - selected_cond_outputs: the conditioning frame outputs used for cross attention.
+        - unselected_cond_outputs: the remaining conditioning frame outputs.
+        - t_pos_and_prevs: a list of (t_pos, out) pairs for the spatial memories, where
+          `out` is None for padding frames.
+        """
+        # Select a maximum number of temporally closest cond frames for cross attention
+        cond_outputs = output_dict["cond_frame_outputs"]
+        selected_cond_outputs, unselected_cond_outputs = select_closest_cond_frames(
+            frame_idx, cond_outputs, self.max_cond_frames_in_attn
+        )
+        t_pos_and_prevs = [(0, out) for out in selected_cond_outputs.values()]
+        # Add last (self.num_maskmem - 1) frames before current frame for non-conditioning memory
+        # the earliest one has t_pos=1 and the latest one has t_pos=self.num_maskmem-1
+        # We also allow taking the memory frame non-consecutively (with stride>1), in which case
+        # we take (self.num_maskmem - 2) frames among every stride-th frames plus the last frame.
+        stride = 1 if self.training else self.memory_temporal_stride_for_eval
+
+        if self.samurai_mode:
+            valid_indices = [] 
+            if frame_idx > 1:  # Ensure we have previous frames to evaluate
+                for i in range(frame_idx - 1, 1, -1):  # Iterate backwards through previous frames
+                    # Check if frame i exists in the output dict before accessing it
+                    if i not in output_dict["non_cond_frame_outputs"]:
+                        continue
+                    iou_score = output_dict["non_cond_frame_outputs"][i]["best_iou_score"]  # Get mask affinity score
+                    obj_score = output_dict["non_cond_frame_outputs"][i]["object_score_logits"]  # Get object score
+                    kf_score = output_dict["non_cond_frame_outputs"][i]["kf_score"] if "kf_score" in output_dict["non_cond_frame_outputs"][i] else None  # Get motion score if available
+                    # Check if the scores meet the criteria for being a valid index
+                    if iou_score.item() > self.memory_bank_iou_threshold and \
+                       obj_score.item() > self.memory_bank_obj_score_threshold and \
+                       (kf_score is None or kf_score.item() > self.memory_bank_kf_score_threshold):
+                        valid_indices.insert(0, i)  
+                    # Check the number of valid indices
+                    if len(valid_indices) >= self.max_obj_ptrs_in_encoder - 1:  
+                        break
+            # Only add frame_idx - 1 if it exists in the output dict
+            if frame_idx - 1 not in valid_indices and (frame_idx - 1) in output_dict["non_cond_frame_outputs"]: 
+                valid_indices.append(frame_idx - 1)
+            for t_pos in range(1, self.num_maskmem):  # Iterate over the number of mask memories
+                idx = t_pos - self.num_maskmem  # Calculate the index for valid indices
+                if idx < -len(valid_indices):  # Skip if index is out of bounds
+                    continue
+                out = output_dict["non_cond_frame_outputs"].get(valid_indices[idx], None)  # Get output for the valid index
+                if out is None:  # If not found, check unselected outputs
+                    out = unselected_cond_outputs.get(valid_indices[idx], None)
+                t_pos_and_prevs.append((t_pos, out))  # Append the temporal position and output to the list
+        else:
+            for t_pos in range(1, self.num_maskmem):
+                t_rel = self.num_maskmem - t_pos  # how many frames before current frame
+                if t_rel == 1:
+                    # for t_rel == 1, we take the last frame (regardless of r)
+                    if not track_in_reverse:
+                        # the frame immediately before this frame (i.e. frame_idx - 1)
+                        prev_frame_idx = frame_idx - t_rel
+                    else:
+                        # the frame immediately after this frame (i.e. frame_idx + 1)
+                        prev_frame_idx = frame_idx + t_rel
+                else:
+                    # for t_rel >= 2, we take the memory frame from every r-th frames
+                    if not track_in_reverse:
+                        # first find the nearest frame among every r-th frames before this frame
+                        # for r=1, this would be (frame_idx - 2)
+                        prev_frame_idx = ((frame_idx - 2) // stride) * stride
+                        # then seek further among every r-th frames
+                        prev_frame_idx = prev_frame_idx - (t_rel - 2) * stride
+                    else:
+                        # first find the nearest frame among every r-th frames after this frame
+                        # for r=1, this would be (frame_idx + 2)
+                        prev_frame_idx = -(-(frame_idx + 2) // stride) * stride
+                        # then seek further among every r-th frames
+                        prev_frame_idx = prev_frame_idx + (t_rel - 2) * stride
+                out = output_dict["non_cond_frame_outputs"].get(prev_frame_idx, None)
+                if out is None:
+                    # If an unselected conditioning frame is among the last (self.num_maskmem - 1)
+                    # frames, we still attend to it as if it's a non-conditioning frame.
+                    out = unselected_cond_outputs.get(prev_frame_idx, None)
+                t_pos_and_prevs.append((t_pos, out))
+
+        return selected_cond_outputs, unselected_cond_outputs, t_pos_and_prevs
+
     def _prepare_memory_conditioned_features(
         self,
         frame_idx,
@@ -648,82 +905,15 @@ class SAM2Base(torch.nn.Module):
             # Add conditioning frames's output first (all cond frames have t_pos=0 for
             # when getting temporal positional embedding below)
             assert len(output_dict["cond_frame_outputs"]) > 0
-            # Select a maximum number of temporally closest cond frames for cross attention
-            cond_outputs = output_dict["cond_frame_outputs"]
-            selected_cond_outputs, unselected_cond_outputs = select_closest_cond_frames(
-                frame_idx, cond_outputs, self.max_cond_frames_in_attn
+            selected_cond_outputs, unselected_cond_outputs, t_pos_and_prevs = (
+                self._select_memory_frames(frame_idx, output_dict, track_in_reverse)
             )
-            t_pos_and_prevs = [(0, out) for out in selected_cond_outputs.values()]
-            # Add last (self.num_maskmem - 1) frames before current frame for non-conditioning memory
-            # the earliest one has t_pos=1 and the latest one has t_pos=self.num_maskmem-1
-            # We also allow taking the memory frame non-consecutively (with stride>1), in which case
-            # we take (self.num_maskmem - 2) frames among every stride-th frames plus the last frame.
-            stride = 1 if self.training else self.memory_temporal_stride_for_eval
-
-            if self.samurai_mode:
-                valid_indices = [] 
-                if frame_idx > 1:  # Ensure we have previous frames to evaluate
-                    for i in range(frame_idx - 1, 1, -1):  # Iterate backwards through previous frames
-                        # Check if frame i exists in the output dict before accessing it
-                        if i not in output_dict["non_cond_frame_outputs"]:
-                            continue
-                        iou_score = output_dict["non_cond_frame_outputs"][i]["best_iou_score"]  # Get mask affinity score
-                        obj_score = output_dict["non_cond_frame_outputs"][i]["object_score_logits"]  # Get object score
-                        kf_score = output_dict["non_cond_frame_outputs"][i]["kf_score"] if "kf_score" in output_dict["non_cond_frame_outputs"][i] else None  # Get motion score if available
-                        # Check if the scores meet the criteria for being a valid index
-                        if iou_score.item() > self.memory_bank_iou_threshold and \
-                           obj_score.item() > self.memory_bank_obj_score_threshold and \
-                           (kf_score is None or kf_score.item() > self.memory_bank_kf_score_threshold):
-                            valid_indices.insert(0, i)  
-                        # Check the number of valid indices
-                        if len(valid_indices) >= self.max_obj_ptrs_in_encoder - 1:  
-                            break
-                # Only add frame_idx - 1 if it exists in the output dict
-                if frame_idx - 1 not in valid_indices and (frame_idx - 1) in output_dict["non_cond_frame_outputs"]: 
-                    valid_indices.append(frame_idx - 1)
-                for t_pos in range(1, self.num_maskmem):  # Iterate over the number of mask memories
-                    idx = t_pos - self.num_maskmem  # Calculate the index for valid indices
-                    if idx < -len(valid_indices):  # Skip if index is out of bounds
-                        continue
-                    out = output_dict["non_cond_frame_outputs"].get(valid_indices[idx], None)  # Get output for the valid index
-                    if out is None:  # If not found, check unselected outputs
-                        out = unselected_cond_outputs.get(valid_indices[idx], None)
-                    t_pos_and_prevs.append((t_pos, out))  # Append the temporal position and output to the list
-            else:
-                for t_pos in range(1, self.num_maskmem):
-                    t_rel = self.num_maskmem - t_pos  # how many frames before current frame
-                    if t_rel == 1:
-                        # for t_rel == 1, we take the last frame (regardless of r)
-                        if not track_in_reverse:
-                            # the frame immediately before this frame (i.e. frame_idx - 1)
-                            prev_frame_idx = frame_idx - t_rel
-                        else:
-                            # the frame immediately after this frame (i.e. frame_idx + 1)
-                            prev_frame_idx = frame_idx + t_rel
-                    else:
-                        # for t_rel >= 2, we take the memory frame from every r-th frames
-                        if not track_in_reverse:
-                            # first find the nearest frame among every r-th frames before this frame
-                            # for r=1, this would be (frame_idx - 2)
-                            prev_frame_idx = ((frame_idx - 2) // stride) * stride
-                            # then seek further among every r-th frames
-                            prev_frame_idx = prev_frame_idx - (t_rel - 2) * stride
-                        else:
-                            # first find the nearest frame among every r-th frames after this frame
-                            # for r=1, this would be (frame_idx + 2)
-                            prev_frame_idx = -(-(frame_idx + 2) // stride) * stride
-                            # then seek further among every r-th frames
-                            prev_frame_idx = prev_frame_idx + (t_rel - 2) * stride
-                    out = output_dict["non_cond_frame_outputs"].get(prev_frame_idx, None)
-                    if out is None:
-                        # If an unselected conditioning frame is among the last (self.num_maskmem - 1)
-                        # frames, we still attend to it as if it's a non-conditioning frame.
-                        out = unselected_cond_outputs.get(prev_frame_idx, None)
-                    t_pos_and_prevs.append((t_pos, out))
 
             for t_pos, prev in t_pos_and_prevs:
-                if prev is None:
-                    continue  # skip padding frames
+                if prev is None or prev["maskmem_features"] is None:
+                    # skip padding frames and frames without memory (e.g. those tracked
+                    # while the object was absent with `skip_high_res_if_absent`)
+                    continue
                 # "maskmem_features" might have been offloaded to CPU in demo use cases,
                 # so we load it back to GPU (it's a no-op if it's already on GPU).
                 feats = prev["maskmem_features"].to(device, non_blocking=True)
@@ -736,6 +926,7 @@ class SAM2Base(torch.nn.Module):
                     maskmem_enc + self.maskmem_tpos_enc[self.num_maskmem - t_pos - 1]
                 )
                 to_cat_memory_pos_embed.append(maskmem_enc)
+            num_spatial_mem_tokens = sum(x.size(0) for x in to_cat_memory)
 
             # Construct the list of past object pointers
             if self.use_obj_ptrs_in_encoder:
@@ -815,18 +1006,84 @@ class SAM2Base(torch.nn.Module):
         # Step 2: Concatenate the memories and forward through the transformer encoder
         memory = torch.cat(to_cat_memory, dim=0)
         memory_pos_embed = torch.cat(to_cat_memory_pos_embed, dim=0)
+        memory_mask = None
+        if self.compile_track_step and not is_init_cond_frame:
+            # pad the memory to a fixed number of slots, so that the compiled memory
+            # attention sees the same shapes on every frame
+            num_cond_frames = len(selected_cond_outputs)
+            num_spatial_mem_slots = (num_cond_frames + self.num_maskmem - 1) * H * W
+            num_obj_ptr_slots = 0
+            if self.use_obj_ptrs_in_encoder:
+                num_obj_ptr_slots = (num_cond_frames + max_obj_ptrs_in_encoder - 1) * (
+                    C // self.mem_dim
+                )
+            memory, memory_pos_embed, memory_mask, num_obj_ptr_tokens = (
+                self._pad_memory_to_static_slots(
+                    memory,
+                    memory_pos_embed,
+                    num_spatial_mem_tokens=num_spatial_mem_tokens,
+                    num_spatial_mem_slots=num_spatial_mem_slots,
+                    num_obj_ptr_tokens=num_obj_ptr_tokens,
+                    num_obj_ptr_slots=num_obj_ptr_slots,
+                )
+            )
 
-        pix_feat_with_mem = self.memory_attention(
-            curr=current_vision_feats,
-            curr_pos=current_vision_pos_embeds,
-            memory=memory,
-            memory_pos=memory_pos_embed,
-            num_obj_ptr_tokens=num_obj_ptr_tokens,
-        )
+        if self.precision_policy is not None:
+            # the memory features might be stored in a lower precision
+            memory = memory.float()
+        with self._autocast("memory"):
+            pix_feat_with_mem = self.memory_attention(
+                curr=current_vision_feats,
+                curr_pos=current_vision_pos_embeds,
+                memory=memory,
+                memory_pos=memory_pos_embed,
+                num_obj_ptr_tokens=num_obj_ptr_tokens,
+                memory_mask=memory_mask,
+            )
+        pix_feat_with_mem = self._to_policy_output(pix_feat_with_mem)
         # reshape the output (HW)BC => BCHW
         pix_feat_with_mem = pix_feat_with_mem.permute(1, 2, 0).view(B, C, H, W)
         return pix_feat_with_mem
 
+    def _pad_memory_to_static_slots(
+        self,
+        memory,
+        memory_pos_embed,
+        num_spatial_mem_tokens,
+        num_spatial_mem_slots,
+        num_obj_ptr_tokens,
+        num_obj_ptr_slots,
+    ):
+        """
+        Pad the spatial memory tokens and the object pointer tokens in `memory` (and
+        `memory_pos_embed`) with zeros up to `num_spatial_mem_slots` and
+        `num_obj_ptr_slots` tokens. Returns the padded memory, its positional encoding,
+        a [L] bool mask of the valid (non-padding) tokens and the padded number of
+        object pointer tokens. If the memory doesn't fit into the slots, it's returned
+        as is (without a mask).
+        """
+        spatial_pad = num_spatial_mem_slots - num_spatial_mem_tokens
+        obj_ptr_pad = num_obj_ptr_slots - num_obj_ptr_tokens
+        if spatial_pad < 0 or obj_ptr_pad < 0:
+            return memory, memory_pos_embed, None, num_obj_ptr_tokens
+
+        def _pad(x):
+            spatial, obj_ptrs = x.split([num_spatial_mem_tokens, num_obj_ptr_tokens])
+            spatial_zeros = x.new_zeros(spatial_pad, *x.shape[1:])
+            obj_ptr_zeros = x.new_zeros(obj_ptr_pad, *x.shape[1:])
+            return torch.cat([spatial, spatial_zeros, obj_ptrs, obj_ptr_zeros], dim=0)
+
+        device = memory.device
+        memory_mask = torch.cat(
+            [
+                torch.ones(num_spatial_mem_tokens, dtype=torch.bool, device=device),
+                torch.zeros(spatial_pad, dtype=torch.bool, device=device),
+                torch.ones(num_obj_ptr_tokens, dtype=torch.bool, device=device),
+                torch.zeros(obj_ptr_pad, dtype=torch.bool, device=device),
+            ]
+        )
+        return _pad(memory), _pad(memory_pos_embed), memory_mask, num_obj_ptr_slots
+
     def _encode_new_memory(
         self,
         current_vision_feats,
@@ -860,9 +1117,11 @@ class SAM2Base(torch.nn.Module):
             mask_for_mem = mask_for_mem * self.sigmoid_scale_for_mem_enc
         if self.sigmoid_bias_for_mem_enc != 0.0:
             mask_for_mem = mask_for_mem + self.sigmoid_bias_for_mem_enc
-        maskmem_out = self.memory_encoder(
-            pix_feat, mask_for_mem, skip_mask_sigmoid=True  # sigmoid already applied
-        )
+        with self._autocast("memory"):
+            maskmem_out = self.memory_encoder(
+                pix_feat, mask_for_mem, skip_mask_sigmoid=True  # sigmoid already applied
+            )
+        maskmem_out = self._to_policy_output(maskmem_out)
         maskmem_features = maskmem_out["vision_features"]
         maskmem_pos_enc = maskmem_out["vision_pos_enc"]
         # add a no-object embedding to the spatial memory to indicate that the frame
@@ -890,6 +1149,8 @@ class SAM2Base(torch.nn.Module):
         num_frames,
         track_in_reverse,
         prev_sam_mask_logits,
+        skip_high_res_if_absent=False,
+        profiler=None,
     ):
         current_out = {"point_inputs": point_inputs, "mask_inputs": mask_inputs}
         # High-resolution feature maps for the SAM head, reshape (HW)BC => BCHW
@@ -910,16 +1171,17 @@ class SAM2Base(torch.nn.Module):
             )
         else:
             # fused the visual feature with previous memory features in the memory bank
-            pix_feat = self._prepare_memory_conditioned_features(
-                frame_idx=frame_idx,
-                is_init_cond_frame=is_init_cond_frame,
-                current_vision_feats=current_vision_feats[-1:],
-                current_vision_pos_embeds=current_vision_pos_embeds[-1:],
-                feat_sizes=feat_sizes[-1:],
-                output_dict=output_dict,
-                num_frames=num_frames,
-                track_in_reverse=track_in_reverse,
-            )
+            with self._profile(profiler, "memory_attention"):
+                pix_feat = self._prepare_memory_conditioned_features(
+                    frame_idx=frame_idx,
+                    is_init_cond_frame=is_init_cond_frame,
+                    current_vision_feats=current_vision_feats[-1:],
+                    current_vision_pos_embeds=current_vision_pos_embeds[-1:],
+                    feat_sizes=feat_sizes[-1:],
+                    output_dict=output_dict,
+                    num_frames=num_frames,
+                    track_in_reverse=track_in_reverse,
+                )
             # apply SAM-style segmentation head
             # here we might feed previously predicted low-res SAM mask logits into the SAM mask decoder,
             # e.g. in demo where such logits come from earlier interaction instead of correction sampling
@@ -928,13 +1190,15 @@ class SAM2Base(torch.nn.Module):
                 assert point_inputs is not None and mask_inputs is None
                 mask_inputs = prev_sam_mask_logits
             multimask_output = self._use_multimask(is_init_cond_frame, point_inputs)
-            sam_outputs = self._forward_sam_heads(
-                backbone_features=pix_feat,
-                point_inputs=point_inputs,
-                mask_inputs=mask_inputs,
-                high_res_features=high_res_features,
-                multimask_output=multimask_output,
-            )
+            with self._profile(profiler, "mask_decoder"):
+                sam_outputs = self._forward_sam_heads(
+                    backbone_features=pix_feat,
+                    point_inputs=point_inputs,
+                    mask_inputs=mask_inputs,
+                    high_res_features=high_res_features,
+                    multimask_output=multimask_output,
+                    skip_high_res_if_absent=skip_high_res_if_absent,
+                )
 
         return current_out, sam_outputs, high_res_features, pix_feat
 
@@ -947,16 +1211,18 @@ class SAM2Base(torch.nn.Module):
         high_res_masks,
         object_score_logits,
         current_out,
+        profiler=None,
     ):
         if run_mem_encoder and self.num_maskmem > 0:
             high_res_masks_for_mem_enc = high_res_masks
-            maskmem_features, maskmem_pos_enc = self._encode_new_memory(
-                current_vision_feats=current_vision_feats,
-                feat_sizes=feat_sizes,
-                pred_masks_high_res=high_res_masks_for_mem_enc,
-                object_score_logits=object_score_logits,
-                is_mask_from_pts=(point_inputs is not None),
-            )
+            with self._profile(profiler, "memory_encoder"):
+                maskmem_features, maskmem_pos_enc = self._encode_new_memory(
+                    current_vision_feats=current_vision_feats,
+                    feat_sizes=feat_sizes,
+                    pred_masks_high_res=high_res_masks_for_mem_enc,
+                    object_score_logits=object_score_logits,
+                    is_mask_from_pts=(point_inputs is not None),
+                )
             current_out["maskmem_features"] = maskmem_features
             current_out["maskmem_pos_enc"] = maskmem_pos_enc
         else:
@@ -983,6 +1249,12 @@ class SAM2Base(torch.nn.Module):
         run_mem_encoder=True,
         # The previously predicted SAM mask logits (which can be fed together with new clicks in demo).
         prev_sam_mask_logits=None,
+        # Whether to skip the high-res masks and the memory encoder when no object appears in the
+        # frame (e.g. while the object is occluded or out of view for many frames); in this case,
+        # "pred_masks_high_res", "maskmem_features" and "maskmem_pos_enc" are None in the output.
+        skip_high_res_if_absent=False,
+        # An optional `StageProfiler` recording the time of each tracking stage.
+        profiler=None,
     ):
         current_out, sam_outputs, _, _ = self._track_step(
             frame_idx,
@@ -996,6 +1268,8 @@ class SAM2Base(torch.nn.Module):
             num_frames,
             track_in_reverse,
             prev_sam_mask_logits,
+            skip_high_res_if_absent=skip_high_res_if_absent,
+            profiler=profiler,
         )
 
         (
@@ -1026,10 +1300,11 @@ class SAM2Base(torch.nn.Module):
             current_vision_feats,
             feat_sizes,
             point_inputs,
-            run_mem_encoder,
+            run_mem_encoder and high_res_masks is not None,
             high_res_masks,
             object_score_logits,
             current_out,
+            profiler=profiler,
         )
 
         return current_out
@@ -4,15 +4,91 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import copy
 import warnings
 from collections import OrderedDict
+from collections.abc import Mapping
 
 import torch
+from loguru import logger
 
 from tqdm import tqdm
 
 from sam2.modeling.sam2_base import NO_OBJ_SCORE, SAM2Base
-from sam2.utils.misc import concat_points, fill_holes_in_mask_scores, load_video_frames
+from sam2.utils.misc import (
+    concat_points,
+    fill_holes_in_mask_scores,
+    get_video_content_hash,
+    load_video_frames,
+    upsampled_masks_to_boxes,
+)
+from sam2.utils.offload import AsyncStateOffloader
+
+
+# the version of the session snapshots written by `SAM2VideoPredictor.save_state`
+SESSION_SNAPSHOT_VERSION = 1
+
+# the outputs that `SAM2VideoPredictor.propagate_in_video` can yield for each frame
+PROPAGATION_OUTPUT_MODES = ("video_res_masks", "binary_masks", "low_res_masks", "boxes")
+
+
+def _tree_to_device(tree, device):
+    """Move all tensors in a nested structure of dicts and lists to `device`."""
+    if isinstance(tree, torch.Tensor):
+        return tree.to(device)
+    if isinstance(tree, dict):
+        return {k: _tree_to_device(v, device) for k, v in tree.items()}
+    if isinstance(tree, (list, tuple)):
+        return type(tree)(_tree_to_device(v, device) for v in tree)
+    return tree
+
+
+def _slice_objects(tree, obj_slice):
+    """Slice the object dimension of all (non-scalar) tensors in a frame output."""
+    if isinstance(tree, torch.Tensor):
+        return tree[obj_slice] if tree.dim() > 0 else tree
+    if isinstance(tree, dict):
+        return {k: _slice_objects(v, obj_slice) for k, v in tree.items()}
+    if isinstance(tree, (list, tuple)):
+        return type(tree)(_slice_objects(v, obj_slice) for v in tree)
+    return tree
+
+
+def _cat_objects(trees):
+    """Concatenate frame outputs of object chunks along the object dimension."""
+    first = trees[0]
+    if isinstance(first, torch.Tensor) and first.dim() > 0:
+        return torch.cat(trees, dim=0)
+    if isinstance(first, dict):
+        return {k: _cat_objects([tree[k] for tree in trees]) for k in first}
+    if isinstance(first, (list, tuple)):
+        return type(first)(_cat_objects(list(v)) for v in zip(*trees))
+    # scalars (and None) don't have an object dimension
+    return first
+
+
+class _ObjectSliceDict(Mapping):
+    """
+    A read-only view of a {frame_idx: <out>} dict in "output_dict", where each frame
+    output is sliced to a chunk of objects on access (so that only the frames used
+    as memory are sliced).
+    """
+
+    def __init__(self, outputs, obj_slice):
+        self.outputs = outputs
+        self.obj_slice = obj_slice
+
+    def __getitem__(self, frame_idx):
+        return _slice_objects(self.outputs[frame_idx], self.obj_slice)
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self.outputs
+
+    def __iter__(self):
+        return iter(self.outputs)
+
+    def __len__(self):
+        return len(self.outputs)
 
 
 class SAM2VideoPredictor(SAM2Base):
@@ -31,6 +107,16 @@ class SAM2VideoPredictor(SAM2Base):
         # if `add_all_frames_to_correct_as_cond` is True, we also append to the conditioning frame list any frame that receives a later correction click
         # if `add_all_frames_to_correct_as_cond` is False, we conditioning frame list to only use those initial conditioning frames
         add_all_frames_to_correct_as_cond=False,
+        # in the keyframe-skipping mode of `propagate_in_video` (`keyframe_interval` > 1), frames
+        # are only skipped while the last model output has a predicted mask IoU, an object score
+        # logit and an IoU with the Kalman filter box prediction above these thresholds
+        keyframe_min_iou=0.5,
+        keyframe_min_obj_score=0.0,
+        keyframe_min_kf_iou=0.5,
+        # a memory budget (in MB) for the memory attention activations when tracking multiple objects;
+        # the objects are split into chunks that run one after the other on the same image features
+        # so that each chunk fits in the budget (None to always track all objects in one batch)
+        object_batch_memory_budget_mb=None,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -39,6 +125,12 @@ class SAM2VideoPredictor(SAM2Base):
         self.clear_non_cond_mem_around_input = clear_non_cond_mem_around_input
         self.clear_non_cond_mem_for_multi_obj = clear_non_cond_mem_for_multi_obj
         self.add_all_frames_to_correct_as_cond = add_all_frames_to_correct_as_cond
+        self.keyframe_min_iou = keyframe_min_iou
+        self.keyframe_min_obj_score = keyframe_min_obj_score
+        self.keyframe_min_kf_iou = keyframe_min_kf_iou
+        self.object_batch_memory_budget_mb = object_batch_memory_budget_mb
+        # only the selected candidate mask is used, so only this one is upsampled
+        self.upsample_all_mask_candidates = False
 
     @torch.inference_mode()
     def init_state(
@@ -47,8 +139,29 @@ class SAM2VideoPredictor(SAM2Base):
         offload_video_to_cpu=False,
         offload_state_to_cpu=False,
         async_loading_frames=False,
+        async_offload_state=True,
     ):
         """Initialize an inference state."""
+        inference_state = self._create_inference_state(
+            video_path,
+            offload_video_to_cpu=offload_video_to_cpu,
+            offload_state_to_cpu=offload_state_to_cpu,
+            async_loading_frames=async_loading_frames,
+            async_offload_state=async_offload_state,
+        )
+        # Warm up the visual backbone and cache the image feature on frame 0
+        self._get_image_feature(inference_state, frame_idx=0, batch_size=1)
+        return inference_state
+
+    def _create_inference_state(
+        self,
+        video_path,
+        offload_video_to_cpu,
+        offload_state_to_cpu,
+        async_loading_frames,
+        async_offload_state,
+    ):
+        """Create an empty inference state on the video (see `init_state`)."""
         compute_device = self.device  # device of the model
         images, video_height, video_width = load_video_frames(
             video_path=video_path,
@@ -58,6 +171,14 @@ class SAM2VideoPredictor(SAM2Base):
             compute_device=compute_device,
         )
         inference_state = {}
+        # the video source, used to reference the frames by content hash in `save_state`
+        inference_state["video_path"] = video_path
+        # the hash of the video content, computed by the first `save_state`
+        inference_state["video_hash"] = None
+        # the `StageProfiler` of the running `propagate_in_video` call (if any)
+        inference_state["profiler"] = None
+        # the SAMURAI Kalman filter state of this session (see `_bind_samurai_state`)
+        inference_state["samurai_state"] = self.init_samurai_state()
         inference_state["images"] = images
         inference_state["num_frames"] = len(images)
         # whether to offload the video frames to CPU memory
@@ -76,11 +197,21 @@ class SAM2VideoPredictor(SAM2Base):
             inference_state["storage_device"] = torch.device("cpu")
         else:
             inference_state["storage_device"] = compute_device
+        # when offloading the state from a CUDA device, copy it into pinned host buffers
+        # on a separate stream and prefetch it back before the memory attention
+        # (so that the offloading doesn't block the tracking on device-to-host copies)
+        inference_state["state_offloader"] = None
+        use_async_offload = offload_state_to_cpu and async_offload_state
+        if use_async_offload and compute_device.type == "cuda":
+            inference_state["state_offloader"] = AsyncStateOffloader(compute_device)
         # inputs on each frame
         inference_state["point_inputs_per_obj"] = {}
         inference_state["mask_inputs_per_obj"] = {}
         # visual features on a small number of recently visited frames for quick interactions
         inference_state["cached_features"] = {}
+        # visual features computed ahead of the interactions with their frames
+        # (e.g. around the frame being viewed, see `prefetch_image_feature`)
+        inference_state["prefetched_features"] = {}
         # values that don't change across frames (so we only need to hold one copy of them)
         inference_state["constants"] = {}
         # mapping between client-side object id and model-side object index
@@ -106,8 +237,6 @@ class SAM2VideoPredictor(SAM2Base):
         # metadata for each tracking frame (e.g. which direction it's tracked)
         inference_state["tracking_has_started"] = False
         inference_state["frames_already_tracked"] = {}
-        # Warm up the visual backbone and cache the image feature on frame 0
-        self._get_image_feature(inference_state, frame_idx=0, batch_size=1)
         return inference_state
 
     @classmethod
@@ -127,6 +256,201 @@ class SAM2VideoPredictor(SAM2Base):
         sam_model = build_sam2_video_predictor_hf(model_id, **kwargs)
         return sam_model
 
+    def _get_session_model_signature(self):
+        """Model hyperparameters that a saved session must match to be restored."""
+        return {
+            "image_size": self.image_size,
+            "hidden_dim": self.hidden_dim,
+            "mem_dim": self.mem_dim,
+            "num_maskmem": self.num_maskmem,
+            "samurai_mode": self.samurai_mode,
+        }
+
+    @torch.inference_mode()
+    def save_state(self, inference_state, path, max_non_cond_frames=None):
+        """
+        Save a snapshot of `inference_state` to `path`, which can be restored later via
+        `load_state` (e.g. to resume a long tracking job or to move a session between
+        workers). The snapshot holds the prompt inputs, the consolidated outputs, the
+        memory of the tracked frames and the SAMURAI motion state; the video frames are
+        not copied but referenced by the hash of the video content.
+
+        If `max_non_cond_frames` is set, only the outputs on the latest (i.e. highest
+        index) `max_non_cond_frames` non-conditioning frames are kept as memory, which
+        makes the snapshot smaller but only allows resuming forward tracking from the
+        last tracked frame.
+        """
+        self._sync_offloaded_state(inference_state)
+        output_dict = inference_state["output_dict"]
+        non_cond_frame_outputs = output_dict["non_cond_frame_outputs"]
+        kept_non_cond_frame_inds = sorted(non_cond_frame_outputs)
+        if max_non_cond_frames is not None:
+            num_dropped = max(len(kept_non_cond_frame_inds) - max_non_cond_frames, 0)
+            kept_non_cond_frame_inds = set(kept_non_cond_frame_inds[num_dropped:])
+            # always keep the frames with consolidated outputs from user inputs
+            consolidated_inds = inference_state["consolidated_frame_inds"]
+            kept_non_cond_frame_inds |= consolidated_inds["non_cond_frame_outputs"]
+            kept_non_cond_frame_inds = sorted(kept_non_cond_frame_inds)
+
+        def _pack_output(out):
+            # "maskmem_pos_enc" is a constant of the session, so we only store whether
+            # it's set on this frame and restore it from the constants in `load_state`
+            packed = {k: v for k, v in out.items() if k != "maskmem_pos_enc"}
+            packed["has_maskmem_pos_enc"] = out.get("maskmem_pos_enc") is not None
+            return _tree_to_device(packed, torch.device("cpu"))
+
+        cond_frame_outputs = output_dict["cond_frame_outputs"]
+        snapshot = {
+            "version": SESSION_SNAPSHOT_VERSION,
+            "model": self._get_session_model_signature(),
+            "video_hash": self._get_video_hash(inference_state),
+            "num_frames": inference_state["num_frames"],
+            "video_height": inference_state["video_height"],
+            "video_width": inference_state["video_width"],
+            "obj_ids": list(inference_state["obj_ids"]),
+            "point_inputs_per_obj": _tree_to_device(
+                inference_state["point_inputs_per_obj"], torch.device("cpu")
+            ),
+            "mask_inputs_per_obj": _tree_to_device(
+                inference_state["mask_inputs_per_obj"], torch.device("cpu")
+            ),
+            "temp_output_dict_per_obj": {
+                obj_idx: {
+                    storage_key: {
+                        t: _pack_output(out) for t, out in obj_outputs.items()
+                    }
+                    for storage_key, obj_outputs in obj_temp_output_dict.items()
+                }
+                for obj_idx, obj_temp_output_dict in inference_state[
+                    "temp_output_dict_per_obj"
+                ].items()
+            },
+            "output_dict": {
+                "cond_frame_outputs": {
+                    t: _pack_output(out) for t, out in cond_frame_outputs.items()
+                },
+                "non_cond_frame_outputs": {
+                    t: _pack_output(non_cond_frame_outputs[t])
+                    for t in kept_non_cond_frame_inds
+                },
+            },
+            "constants": _tree_to_device(
+                inference_state["constants"], torch.device("cpu")
+            ),
+            "consolidated_frame_inds": copy.deepcopy(
+                inference_state["consolidated_frame_inds"]
+            ),
+            "tracking_has_started": inference_state["tracking_has_started"],
+            "frames_already_tracked": copy.deepcopy(
+                inference_state["frames_already_tracked"]
+            ),
+            "samurai": {
+                key: copy.deepcopy(inference_state["samurai_state"][key])
+                for key in ["kf_mean", "kf_covariance", "stable_frames", "frame_cnt"]
+            },
+        }
+        torch.save(snapshot, path)
+
+    @torch.inference_mode()
+    def load_state(
+        self,
+        path,
+        video_path,
+        offload_video_to_cpu=False,
+        offload_state_to_cpu=False,
+        async_loading_frames=False,
+    ):
+        """
+        Restore an inference state saved by `save_state` on the video at `video_path`
+        (which must have the same content as the video of the saved session).
+        """
+        snapshot = torch.load(path, map_location="cpu", weights_only=False)
+        version = snapshot.get("version")
+        if version != SESSION_SNAPSHOT_VERSION:
+            raise RuntimeError(
+                f"Unsupported session snapshot version {version} in {path} "
+                f"(expected version {SESSION_SNAPSHOT_VERSION})."
+            )
+        if snapshot["model"] != self._get_session_model_signature():
+            raise RuntimeError(
+                f"The session in {path} was saved with a different model "
+                f"({snapshot['model']}) than the current one "
+                f"({self._get_session_model_signature()})."
+            )
+        if get_video_content_hash(video_path) != snapshot["video_hash"]:
+            raise RuntimeError(
+                f"The video at {video_path} doesn't match the video of the session "
+                f"saved in {path}."
+            )
+
+        # the image features are computed on demand (e.g. on the first frame to track)
+        inference_state = self._create_inference_state(
+            video_path,
+            offload_video_to_cpu=offload_video_to_cpu,
+            offload_state_to_cpu=offload_state_to_cpu,
+            async_loading_frames=async_loading_frames,
+            async_offload_state=True,
+        )
+        inference_state["video_hash"] = snapshot["video_hash"]
+        device = inference_state["device"]
+        storage_device = inference_state["storage_device"]
+        inference_state["constants"] = _tree_to_device(snapshot["constants"], device)
+
+        def _unpack_output(packed):
+            out = _tree_to_device(packed, device)
+            # mask scores and memory features live on the storage device
+            for key in ["maskmem_features", "pred_masks"]:
+                if isinstance(out.get(key), torch.Tensor):
+                    out[key] = out[key].to(storage_device)
+            has_maskmem_pos_enc = out.pop("has_maskmem_pos_enc")
+            out["maskmem_pos_enc"] = None
+            if has_maskmem_pos_enc:
+                batch_size = out["obj_ptr"].size(0)
+                out["maskmem_pos_enc"] = [
+                    x.expand(batch_size, -1, -1, -1)
+                    for x in inference_state["constants"]["maskmem_pos_enc"]
+                ]
+            return out
+
+        # rebuild the object id mappings and per-object storage
+        for obj_id in snapshot["obj_ids"]:
+            self._obj_id_to_idx(inference_state, obj_id)
+        inference_state["point_inputs_per_obj"].update(
+            _tree_to_device(snapshot["point_inputs_per_obj"], device)
+        )
+        inference_state["mask_inputs_per_obj"].update(
+            _tree_to_device(snapshot["mask_inputs_per_obj"], device)
+        )
+        for obj_idx, obj_temp_output_dict in snapshot[
+            "temp_output_dict_per_obj"
+        ].items():
+            for storage_key, obj_outputs in obj_temp_output_dict.items():
+                inference_state["temp_output_dict_per_obj"][obj_idx][storage_key] = {
+                    t: _unpack_output(out) for t, out in obj_outputs.items()
+                }
+        for storage_key, outputs in snapshot["output_dict"].items():
+            for frame_idx, packed in sorted(outputs.items()):
+                out = _unpack_output(packed)
+                inference_state["output_dict"][storage_key][frame_idx] = out
+                # per-object outputs are slices of the consolidated outputs
+                self._add_output_per_object(
+                    inference_state, frame_idx, out, storage_key
+                )
+
+        inference_state["consolidated_frame_inds"] = snapshot["consolidated_frame_inds"]
+        inference_state["tracking_has_started"] = snapshot["tracking_has_started"]
+        inference_state["frames_already_tracked"] = snapshot["frames_already_tracked"]
+        inference_state["samurai_state"].update(snapshot["samurai"])
+        return inference_state
+
+    def _get_video_hash(self, inference_state):
+        """Get the hash of the video content of a session (computed once)."""
+        if inference_state["video_hash"] is None:
+            inference_state["video_hash"] = get_video_content_hash(
+                inference_state["video_path"]
+            )
+        return inference_state["video_hash"]
+
     def _obj_id_to_idx(self, inference_state, obj_id):
         """Map client-side object id to model-side object index."""
         obj_idx = inference_state["obj_id_to_idx"].get(obj_id, None)
@@ -182,6 +506,7 @@ class SAM2VideoPredictor(SAM2Base):
         box=None,
     ):
         """Add new points to a frame."""
+        self._sync_offloaded_state(inference_state)
         obj_idx = self._obj_id_to_idx(inference_state, obj_id)
         point_inputs_per_frame = inference_state["point_inputs_per_obj"][obj_idx]
         mask_inputs_per_frame = inference_state["mask_inputs_per_obj"][obj_idx]
@@ -326,6 +651,7 @@ class SAM2VideoPredictor(SAM2Base):
         mask,
     ):
         """Add new mask to a frame."""
+        self._sync_offloaded_state(inference_state)
         obj_idx = self._obj_id_to_idx(inference_state, obj_id)
         point_inputs_per_frame = inference_state["point_inputs_per_obj"][obj_idx]
         mask_inputs_per_frame = inference_state["mask_inputs_per_obj"][obj_idx]
@@ -555,6 +881,7 @@ class SAM2VideoPredictor(SAM2Base):
 
     def _get_empty_mask_ptr(self, inference_state, frame_idx):
         """Get a dummy object pointer based on an empty mask on the current frame."""
+        self._bind_samurai_state(inference_state)
         # A dummy (empty) mask with a single object
         batch_size = 1
         mask_inputs = torch.zeros(
@@ -592,6 +919,7 @@ class SAM2VideoPredictor(SAM2Base):
     @torch.inference_mode()
     def propagate_in_video_preflight(self, inference_state):
         """Prepare inference_state and consolidate temporary outputs before tracking."""
+        self._sync_offloaded_state(inference_state)
         # Tracking has started and we don't allow adding new objects until session is reset.
         inference_state["tracking_has_started"] = True
         batch_size = self._get_obj_num(inference_state)
@@ -620,6 +948,9 @@ class SAM2VideoPredictor(SAM2Base):
                     inference_state, frame_idx, is_cond=is_cond, run_mem_encoder=True
                 )
                 # merge them into "output_dict" and also create per-object slices
+                self._release_offloaded_output(
+                    inference_state, output_dict[storage_key].get(frame_idx)
+                )
                 output_dict[storage_key][frame_idx] = consolidated_out
                 self._add_output_per_object(
                     inference_state, frame_idx, consolidated_out, storage_key
@@ -638,7 +969,10 @@ class SAM2VideoPredictor(SAM2Base):
         # edge case: if an output is added to "cond_frame_outputs", we remove any prior
         # output on the same frame in "non_cond_frame_outputs"
         for frame_idx in output_dict["cond_frame_outputs"]:
-            output_dict["non_cond_frame_outputs"].pop(frame_idx, None)
+            self._release_offloaded_output(
+                inference_state,
+                output_dict["non_cond_frame_outputs"].pop(frame_idx, None),
+            )
         for obj_output_dict in inference_state["output_dict_per_obj"].values():
             for frame_idx in obj_output_dict["cond_frame_outputs"]:
                 obj_output_dict["non_cond_frame_outputs"].pop(frame_idx, None)
@@ -666,8 +1000,56 @@ class SAM2VideoPredictor(SAM2Base):
         start_frame_idx=None,
         max_frame_num_to_track=None,
         reverse=False,
+        keyframe_interval=1,
+        absence_patience=None,
+        output_mode="video_res_masks",
+        mask_scale=1.0,
+        profiler=None,
     ):
-        """Propagate the input points across frames to track in the entire video."""
+        """
+        Propagate the input points across frames to track in the entire video.
+
+        For each frame, it yields the frame index, the object ids and the outputs of
+        each object, depending on `output_mode`:
+        - "video_res_masks": [B, 1, H, W] mask logits in the original video resolution.
+        - "binary_masks": [B, 1, H', W'] bool masks in the original video resolution
+          scaled by `mask_scale` (e.g. 0.25 for a quarter of the video resolution).
+        - "low_res_masks": [B, 1, h, w] mask logits in the model's low resolution (a
+          quarter of the model's input image size), without any upsampling.
+        - "boxes": [B, 5] tensor with the box (x_min, y_min, x_max, y_max) of the mask
+          in the original video resolution (all zeros for an empty mask) and the object
+          score logit of each object. The boxes are computed from the low-resolution
+          masks, without upsampling the full masks to the video resolution.
+
+        With `non_overlap_masks`, the non-overlapping constraints are applied to the
+        masks in the resolution they're output in, i.e. after resizing them for
+        "video_res_masks" and "binary_masks", but in the low resolution for
+        "low_res_masks" and "boxes" (so where the objects overlap, a box can slightly
+        differ from the box of the object's mask in "video_res_masks").
+
+        With `keyframe_interval` = k > 1 (SAMURAI single-object tracking only), the
+        model runs on every k-th frame once the Kalman filter is stable, and the frames
+        in between are filled from the Kalman filter's box prediction: their masks are
+        the predicted boxes (with positive scores inside the box), and the boxes are
+        recorded in `inference_state["interpolated_boxes"]`. Tracking falls back to
+        running the model on every frame when the predicted mask IoU or object score
+        drops, or when the model's mask box moves away from the Kalman prediction.
+        The number of model calls and skipped frames is reported in
+        `inference_state["keyframe_stats"]`.
+
+        With `absence_patience` = n, once no object has appeared (i.e. all object
+        score logits are below `min_obj_score_logits`) for n consecutive frames, the
+        following frames only run a cheap re-detection: while the objects stay absent,
+        the high-res masks, the memory encoder, the SAMURAI box tracking and the
+        hole filling are skipped (and these frames aren't added to the memory). Full
+        tracking resumes as soon as an object reappears.
+
+        With a `profiler` (a `sam2.utils.profiling.StageProfiler`), the wall time and
+        peak memory of each stage (frame loading, backbone, memory attention, mask
+        decoder, memory encoder, hole filling, host copies and output resizing) and
+        the latency of each frame (excluding the time spent by the caller between
+        frames) are recorded in the profiler.
+        """
         self.propagate_in_video_preflight(inference_state)
 
         output_dict = inference_state["output_dict"]
@@ -680,6 +1062,22 @@ class SAM2VideoPredictor(SAM2Base):
         clear_non_cond_mem = self.clear_non_cond_mem_around_input and (
             self.clear_non_cond_mem_for_multi_obj or batch_size <= 1
         )
+        if output_mode not in PROPAGATION_OUTPUT_MODES:
+            raise ValueError(
+                f"Unknown output_mode {output_mode!r}, "
+                f"expected one of {list(PROPAGATION_OUTPUT_MODES)}"
+            )
+        if keyframe_interval > 1 and not (self.samurai_mode and batch_size == 1):
+            raise ValueError(
+                "keyframe_interval > 1 requires SAMURAI mode with a single object"
+            )
+        keyframe_stats = {"model_calls": 0, "skipped_frames": 0, "dense_fallbacks": 0}
+        inference_state["keyframe_stats"] = keyframe_stats
+        inference_state["interpolated_boxes"] = {}
+        # whether the last model output is reliable enough to skip the next frames
+        can_skip_frames = False
+        num_frames_since_model = 0
+        num_absent_frames = 0
 
         # set start index, end index, and processing order
         if start_frame_idx is None:
@@ -700,49 +1098,248 @@ class SAM2VideoPredictor(SAM2Base):
             )
             processing_order = range(start_frame_idx, end_frame_idx + 1)
 
-        for frame_idx in tqdm(processing_order, desc="propagate in video"):
-            # We skip those frames already in consolidated outputs (these are frames
-            # that received input clicks or mask). Note that we cannot directly run
-            # batched forward on them via `_run_single_frame_inference` because the
-            # number of clicks on each object might be different.
-            if frame_idx in consolidated_frame_inds["cond_frame_outputs"]:
-                storage_key = "cond_frame_outputs"
-                current_out = output_dict[storage_key][frame_idx]
-                pred_masks = current_out["pred_masks"]
-                if clear_non_cond_mem:
-                    # clear non-conditioning memory of the surrounding frames
-                    self._clear_non_cond_mem_around_input(inference_state, frame_idx)
-            elif frame_idx in consolidated_frame_inds["non_cond_frame_outputs"]:
-                storage_key = "non_cond_frame_outputs"
-                current_out = output_dict[storage_key][frame_idx]
-                pred_masks = current_out["pred_masks"]
-            else:
-                storage_key = "non_cond_frame_outputs"
-                current_out, pred_masks = self._run_single_frame_inference(
-                    inference_state=inference_state,
-                    output_dict=output_dict,
-                    frame_idx=frame_idx,
-                    batch_size=batch_size,
-                    is_init_cond_frame=False,
-                    point_inputs=None,
-                    mask_inputs=None,
-                    reverse=reverse,
-                    run_mem_encoder=True,
+        # record the per-stage times in the model and in this loop with the profiler
+        # (kept in this session's state, since the model is shared across sessions)
+        inference_state["profiler"] = profiler
+        try:
+            for frame_idx in tqdm(processing_order, desc="propagate in video"):
+                if profiler is not None:
+                    profiler.begin_frame(frame_idx)
+                # We skip those frames already in consolidated outputs (these are frames
+                # that received input clicks or mask). Note that we cannot directly run
+                # batched forward on them via `_run_single_frame_inference` because the
+                # number of clicks on each object might be different.
+                if frame_idx in consolidated_frame_inds["cond_frame_outputs"]:
+                    storage_key = "cond_frame_outputs"
+                    current_out = output_dict[storage_key][frame_idx]
+                    pred_masks = current_out["pred_masks"]
+                    if clear_non_cond_mem:
+                        # clear non-conditioning memory of the surrounding frames
+                        self._clear_non_cond_mem_around_input(
+                            inference_state, frame_idx
+                        )
+                elif frame_idx in consolidated_frame_inds["non_cond_frame_outputs"]:
+                    storage_key = "non_cond_frame_outputs"
+                    current_out = output_dict[storage_key][frame_idx]
+                    pred_masks = current_out["pred_masks"]
+                elif can_skip_frames and num_frames_since_model < keyframe_interval - 1:
+                    # fill this frame from the Kalman filter without running the model
+                    num_frames_since_model += 1
+                    keyframe_stats["skipped_frames"] += 1
+                    box = self._interpolate_frame_from_kalman_filter(
+                        inference_state, frame_idx
+                    )
+                    with self._profile(profiler, "output_resize"):
+                        outputs = self._get_filled_output(
+                            inference_state, 1, box, output_mode, mask_scale
+                        )
+                    if profiler is not None:
+                        profiler.end_frame()
+                    yield frame_idx, obj_ids, outputs
+                    continue
+                else:
+                    storage_key = "non_cond_frame_outputs"
+                    keyframe_stats["model_calls"] += 1
+                    current_out, pred_masks = self._run_single_frame_inference(
+                        inference_state=inference_state,
+                        output_dict=output_dict,
+                        frame_idx=frame_idx,
+                        batch_size=batch_size,
+                        is_init_cond_frame=False,
+                        point_inputs=None,
+                        mask_inputs=None,
+                        reverse=reverse,
+                        run_mem_encoder=True,
+                        skip_high_res_if_absent=(
+                            absence_patience is not None
+                            and num_absent_frames >= absence_patience
+                        ),
+                    )
+                    self._release_offloaded_output(
+                        inference_state, output_dict[storage_key].get(frame_idx)
+                    )
+                    output_dict[storage_key][frame_idx] = current_out
+                if keyframe_interval > 1:
+                    # only the frames tracked by the model (not those with user inputs)
+                    # have the scores to decide whether to skip the next frames
+                    was_skipping = can_skip_frames
+                    can_skip_frames = (
+                        storage_key == "non_cond_frame_outputs"
+                        and frame_idx not in consolidated_frame_inds[storage_key]
+                        and self._is_reliable_keyframe(inference_state, current_out)
+                    )
+                    if was_skipping and not can_skip_frames:
+                        keyframe_stats["dense_fallbacks"] += 1
+                    num_frames_since_model = 0
+                # Create slices of per-object outputs for subsequent interaction with
+                # each individual object after tracking.
+                self._add_output_per_object(
+                    inference_state, frame_idx, current_out, storage_key
                 )
-                output_dict[storage_key][frame_idx] = current_out
-            # Create slices of per-object outputs for subsequent interaction with each
-            # individual object after tracking.
-            self._add_output_per_object(
-                inference_state, frame_idx, current_out, storage_key
+                inference_state["frames_already_tracked"][frame_idx] = {
+                    "reverse": reverse
+                }
+
+                is_absent = False
+                if absence_patience is not None:
+                    object_score_logits = current_out["object_score_logits"]
+                    is_absent = bool(
+                        (object_score_logits <= self.min_obj_score_logits).all()
+                    )
+                    num_absent_frames = num_absent_frames + 1 if is_absent else 0
+                with self._profile(profiler, "output_resize"):
+                    if is_absent and num_absent_frames > absence_patience:
+                        # all the mask scores are NO_OBJ_SCORE, so there's nothing to
+                        # resize
+                        outputs = self._get_filled_output(
+                            inference_state, batch_size, None, output_mode, mask_scale
+                        )
+                    else:
+                        outputs = self._get_propagation_output(
+                            inference_state,
+                            pred_masks,
+                            current_out["object_score_logits"],
+                            output_mode,
+                            mask_scale,
+                        )
+                if profiler is not None:
+                    profiler.end_frame()
+                yield frame_idx, obj_ids, outputs
+        finally:
+            inference_state["profiler"] = None
+
+        if keyframe_interval > 1:
+            logger.info(
+                f"keyframe skipping: {keyframe_stats['model_calls']} model calls, "
+                f"{keyframe_stats['skipped_frames']} frames filled from the Kalman "
+                f"filter, {keyframe_stats['dense_fallbacks']} fallbacks to dense "
+                "tracking"
             )
-            inference_state["frames_already_tracked"][frame_idx] = {"reverse": reverse}
 
-            # Resize the output mask to the original video resolution (we directly use
-            # the mask scores on GPU for output to avoid any CPU conversion in between)
+    def _is_reliable_keyframe(self, inference_state, current_out):
+        """Whether the tracking is stable enough to skip frames after this output."""
+        self._bind_samurai_state(inference_state)
+        if self.kf_mean is None or self.stable_frames < self.stable_frames_threshold:
+            return False
+        kf_score = current_out["kf_score"]
+        return (
+            kf_score is not None
+            and kf_score.item() > self.keyframe_min_kf_iou
+            and current_out["best_iou_score"].item() > self.keyframe_min_iou
+            and current_out["object_score_logits"].item() > self.keyframe_min_obj_score
+        )
+
+    def _get_propagation_output(
+        self, inference_state, pred_masks, object_score_logits, output_mode, mask_scale
+    ):
+        """Get the outputs of `propagate_in_video` on a frame from its mask logits."""
+        device = inference_state["device"]
+        video_H = inference_state["video_height"]
+        video_W = inference_state["video_width"]
+        if output_mode == "video_res_masks":
+            # Resize the output mask to the original video resolution (we directly
+            # use the mask scores on GPU for output to avoid any CPU conversion)
             _, video_res_masks = self._get_orig_video_res_output(
                 inference_state, pred_masks
             )
-            yield frame_idx, obj_ids, video_res_masks
+            return video_res_masks
+
+        pred_masks = pred_masks.to(device, non_blocking=True)
+        if output_mode == "binary_masks":
+            out_H, out_W = round(video_H * mask_scale), round(video_W * mask_scale)
+            if pred_masks.shape[-2:] != (out_H, out_W):
+                pred_masks = torch.nn.functional.interpolate(
+                    pred_masks,
+                    size=(out_H, out_W),
+                    mode="bilinear",
+                    align_corners=False,
+                )
+            # as for "video_res_masks", after resizing the masks
+            if self.non_overlap_masks:
+                pred_masks = self._apply_non_overlapping_constraints(pred_masks)
+            return pred_masks > 0
+
+        # the low-res masks are not resized, so the non-overlapping constraints
+        # apply in the low resolution
+        if self.non_overlap_masks:
+            pred_masks = self._apply_non_overlapping_constraints(pred_masks)
+        if output_mode == "low_res_masks":
+            return pred_masks
+
+        # output_mode == "boxes"
+        outputs = torch.zeros(pred_masks.size(0), 5, device=device)
+        boxes, _ = upsampled_masks_to_boxes(pred_masks[:, 0], (video_H, video_W))
+        outputs[:, :4] = boxes.float()
+        outputs[:, 4] = object_score_logits.to(device).float().flatten()
+        return outputs
+
+    def _get_filled_output(
+        self, inference_state, batch_size, box, output_mode, mask_scale
+    ):
+        """
+        Get the outputs of `propagate_in_video` on a frame without mask logits to
+        resize: all the objects have a NO_OBJ_SCORE mask if `box` is None, and
+        otherwise a box-shaped mask (with -NO_OBJ_SCORE inside) for the box
+        [x1, y1, x2, y2] given in the original video resolution.
+        """
+        device = inference_state["device"]
+        video_H = inference_state["video_height"]
+        video_W = inference_state["video_width"]
+        if output_mode == "boxes":
+            outputs = torch.zeros(batch_size, 5, device=device)
+            if box is None:
+                outputs[:, 4] = NO_OBJ_SCORE
+            else:
+                x1, y1, x2, y2 = (round(v) for v in box)
+                if x2 > x1 and y2 > y1:
+                    # from exclusive to inclusive bottom-right pixel coordinates
+                    outputs[:, :4] = torch.tensor([x1, y1, x2 - 1, y2 - 1])
+                outputs[:, 4] = -NO_OBJ_SCORE
+            return outputs
+
+        if output_mode == "low_res_masks":
+            out_H = out_W = self.image_size // 4
+        elif output_mode == "binary_masks":
+            out_H, out_W = round(video_H * mask_scale), round(video_W * mask_scale)
+        else:
+            out_H, out_W = video_H, video_W
+        masks = torch.full(
+            (batch_size, 1, out_H, out_W),
+            NO_OBJ_SCORE,
+            dtype=torch.float32,
+            device=device,
+        )
+        if box is not None:
+            x1, y1, x2, y2 = box
+            x1, x2 = round(x1 * out_W / video_W), round(x2 * out_W / video_W)
+            y1, y2 = round(y1 * out_H / video_H), round(y2 * out_H / video_H)
+            masks[..., y1:y2, x1:x2] = -NO_OBJ_SCORE
+        if output_mode == "binary_masks":
+            return masks > 0
+        return masks
+
+    def _interpolate_frame_from_kalman_filter(self, inference_state, frame_idx):
+        """
+        Advance the SAMURAI Kalman filter by one frame and return its predicted box
+        [x1, y1, x2, y2] on `frame_idx` in the original video resolution.
+        """
+        self._bind_samurai_state(inference_state)
+        self.kf_mean, self.kf_covariance = self.kf.predict(
+            self.kf_mean, self.kf_covariance
+        )
+        self.frame_cnt += 1
+        # the Kalman filter tracks boxes in the model's input resolution
+        video_H = inference_state["video_height"]
+        video_W = inference_state["video_width"]
+        x1, y1, x2, y2 = self.kf.xyah_to_xyxy(self.kf_mean[:4])
+        box = [
+            min(max(x1 * video_W / self.image_size, 0), video_W),
+            min(max(y1 * video_H / self.image_size, 0), video_H),
+            min(max(x2 * video_W / self.image_size, 0), video_W),
+            min(max(y2 * video_H / self.image_size, 0), video_H),
+        ]
+        inference_state["interpolated_boxes"][frame_idx] = box
+        return box
 
     def _add_output_per_object(
         self, inference_state, frame_idx, current_out, storage_key
@@ -778,6 +1375,7 @@ class SAM2VideoPredictor(SAM2Base):
         self, inference_state, frame_idx, obj_id, need_output=True
     ):
         """Remove all input points or mask in a specific frame for a given object."""
+        self._sync_offloaded_state(inference_state)
         obj_idx = self._obj_id_to_idx(inference_state, obj_id)
 
         # Clear the conditioning information on the given frame
@@ -856,6 +1454,14 @@ class SAM2VideoPredictor(SAM2Base):
         inference_state["mask_inputs_per_obj"].clear()
         inference_state["output_dict_per_obj"].clear()
         inference_state["temp_output_dict_per_obj"].clear()
+        inference_state["samurai_state"] = self.init_samurai_state()
+
+    def _bind_samurai_state(self, inference_state):
+        """
+        Make the SAMURAI Kalman filter state of a session the model's current state
+        (which is shared by all the sessions), before tracking one of its frames.
+        """
+        self.samurai_state = inference_state["samurai_state"]
 
     def _reset_tracking_results(self, inference_state):
         """Reset all tracking inputs and results across the videos."""
@@ -875,21 +1481,60 @@ class SAM2VideoPredictor(SAM2Base):
         inference_state["consolidated_frame_inds"]["non_cond_frame_outputs"].clear()
         inference_state["tracking_has_started"] = False
         inference_state["frames_already_tracked"].clear()
+        if inference_state["state_offloader"] is not None:
+            inference_state["state_offloader"].reset()
+
+    @torch.inference_mode()
+    def prefetch_image_feature(self, inference_state, frame_idx, max_prefetched_frames):
+        """
+        Compute the image feature on a frame ahead of the interactions with it (e.g. on
+        the frames around the one a user is viewing), so that they don't wait for the
+        backbone. At most `max_prefetched_frames` features are kept, and the earliest
+        prefetched ones are dropped first.
+        """
+        prefetched_features = inference_state["prefetched_features"]
+        if (
+            frame_idx in prefetched_features
+            or frame_idx in inference_state["cached_features"]
+        ):
+            return
+        prefetched_features[frame_idx] = self._compute_image_feature(
+            inference_state, frame_idx
+        )
+        while len(prefetched_features) > max_prefetched_frames:
+            prefetched_features.pop(next(iter(prefetched_features)))
+
+    def _compute_image_feature(self, inference_state, frame_idx):
+        """Run the backbone on a frame and return its (image, backbone_out)."""
+        device = inference_state["device"]
+        with self._profile(inference_state["profiler"], "frame_load"):
+            image = inference_state["images"][frame_idx].to(device).float()
+            image = image.unsqueeze(0)
+            if device.type == "cpu":
+                # the conv layers use channels-last weights on CPU
+                image = image.contiguous(memory_format=torch.channels_last)
+        with self._profile(inference_state["profiler"], "backbone"):
+            backbone_out = self.forward_image(image)
+        return image, backbone_out
 
     def _get_image_feature(self, inference_state, frame_idx, batch_size):
         """Compute the image features on a given frame."""
-        # Look up in the cache first
+        # Look up in the cache (and then in the prefetched features) first
         image, backbone_out = inference_state["cached_features"].get(
             frame_idx, (None, None)
         )
+        if backbone_out is None:
+            image, backbone_out = inference_state["prefetched_features"].get(
+                frame_idx, (None, None)
+            )
         if backbone_out is None:
             # Cache miss -- we will run inference on a single image
-            device = inference_state["device"]
-            image = inference_state["images"][frame_idx].to(device).float().unsqueeze(0)
-            backbone_out = self.forward_image(image)
-            # Cache the most recent frame's feature (for repeated interactions with
-            # a frame; we can use an LRU cache for more frames in the future).
-            inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
+            image, backbone_out = self._compute_image_feature(
+                inference_state, frame_idx
+            )
+        # Cache the most recent frame's feature (for repeated interactions with
+        # a frame; we can use an LRU cache for more frames in the future).
+        inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
 
         # expand the features to have the same dimension as the number of objects
         expanded_image = image.expand(batch_size, -1, -1, -1)
@@ -921,8 +1566,19 @@ class SAM2VideoPredictor(SAM2Base):
         reverse,
         run_mem_encoder,
         prev_sam_mask_logits=None,
+        skip_high_res_if_absent=False,
     ):
         """Run tracking on a single frame based on current inputs and previous memory."""
+        self._bind_samurai_state(inference_state)
+        # When the state is offloaded asynchronously, start copying the memories of the
+        # previous frames back to GPU, so that the copies overlap with the image encoder
+        offloader = inference_state["state_offloader"]
+        if offloader is not None and not is_init_cond_frame and mask_inputs is None:
+            _, _, t_pos_and_prevs = self._select_memory_frames(
+                frame_idx, output_dict, track_in_reverse=reverse
+            )
+            offloader.prefetch([prev for _, prev in t_pos_and_prevs if prev is not None])
+
         # Retrieve correct image features
         (
             _,
@@ -934,34 +1590,73 @@ class SAM2VideoPredictor(SAM2Base):
 
         # point and mask should not appear as input simultaneously on the same frame
         assert point_inputs is None or mask_inputs is None
-        current_out = self.track_step(
-            frame_idx=frame_idx,
-            is_init_cond_frame=is_init_cond_frame,
-            current_vision_feats=current_vision_feats,
-            current_vision_pos_embeds=current_vision_pos_embeds,
-            feat_sizes=feat_sizes,
-            point_inputs=point_inputs,
-            mask_inputs=mask_inputs,
-            output_dict=output_dict,
-            num_frames=inference_state["num_frames"],
-            track_in_reverse=reverse,
-            run_mem_encoder=run_mem_encoder,
-            prev_sam_mask_logits=prev_sam_mask_logits,
-        )
+        # split the objects into chunks under the memory budget when tracking without
+        # inputs (the SAMURAI Kalman filter only tracks a single object, so it can't
+        # run a frame in several chunks)
+        chunk_size = batch_size
+        if point_inputs is None and mask_inputs is None and not self.samurai_mode:
+            chunk_size = self._get_object_chunk_size(batch_size, feat_sizes)
+        if offloader is not None:
+            offloader.wait()
+        try:
+            if chunk_size < batch_size:
+                current_out = self._track_step_in_object_chunks(
+                    chunk_size=chunk_size,
+                    frame_idx=frame_idx,
+                    is_init_cond_frame=is_init_cond_frame,
+                    current_vision_feats=current_vision_feats,
+                    current_vision_pos_embeds=current_vision_pos_embeds,
+                    feat_sizes=feat_sizes,
+                    output_dict=output_dict,
+                    num_frames=inference_state["num_frames"],
+                    track_in_reverse=reverse,
+                    run_mem_encoder=run_mem_encoder,
+                    skip_high_res_if_absent=skip_high_res_if_absent,
+                    profiler=inference_state["profiler"],
+                )
+            else:
+                current_out = self.track_step(
+                    frame_idx=frame_idx,
+                    is_init_cond_frame=is_init_cond_frame,
+                    current_vision_feats=current_vision_feats,
+                    current_vision_pos_embeds=current_vision_pos_embeds,
+                    feat_sizes=feat_sizes,
+                    point_inputs=point_inputs,
+                    mask_inputs=mask_inputs,
+                    output_dict=output_dict,
+                    num_frames=inference_state["num_frames"],
+                    track_in_reverse=reverse,
+                    run_mem_encoder=run_mem_encoder,
+                    prev_sam_mask_logits=prev_sam_mask_logits,
+                    skip_high_res_if_absent=skip_high_res_if_absent,
+                    profiler=inference_state["profiler"],
+                )
+        finally:
+            if offloader is not None:
+                offloader.restore()
 
         # optionally offload the output to CPU memory to save GPU space
-        storage_device = inference_state["storage_device"]
+        # (only the tracking outputs that are kept as memory go through the pinned
+        # buffer pool; the temporary outputs from user clicks are copied directly)
         maskmem_features = current_out["maskmem_features"]
         if maskmem_features is not None:
-            maskmem_features = maskmem_features.to(torch.bfloat16)
-            maskmem_features = maskmem_features.to(storage_device, non_blocking=True)
+            maskmem_features = maskmem_features.to(self.memory_storage_dtype)
+            with self._profile(inference_state["profiler"], "host_copy"):
+                maskmem_features = self._offload_to_storage(
+                    inference_state, maskmem_features, pooled=run_mem_encoder
+                )
         pred_masks_gpu = current_out["pred_masks"] # (B, 1, H, W)
-        # potentially fill holes in the predicted masks
-        if self.fill_hole_area > 0:
-            pred_masks_gpu = fill_holes_in_mask_scores(
-                pred_masks_gpu, self.fill_hole_area
+        # potentially fill holes in the predicted masks (there are no holes to fill if
+        # the high-res masks were skipped since no object appears in the frame)
+        if self.fill_hole_area > 0 and current_out["pred_masks_high_res"] is not None:
+            with self._profile(inference_state["profiler"], "hole_filling"):
+                pred_masks_gpu = fill_holes_in_mask_scores(
+                    pred_masks_gpu, self.fill_hole_area
+                )
+        with self._profile(inference_state["profiler"], "host_copy"):
+            pred_masks = self._offload_to_storage(
+                inference_state, pred_masks_gpu, pooled=run_mem_encoder
             )
-        pred_masks = pred_masks_gpu.to(storage_device, non_blocking=True)
         # "maskmem_pos_enc" is the same across frames, so we only need to store one copy of it
         maskmem_pos_enc = self._get_maskmem_pos_enc(inference_state, current_out)
         # object pointer is a small tensor, so we always keep it on GPU memory for fast access
@@ -981,6 +1676,97 @@ class SAM2VideoPredictor(SAM2Base):
         }
         return compact_current_out, pred_masks_gpu
 
+    def _get_object_chunk_size(self, batch_size, feat_sizes):
+        """
+        Get the number of objects to track together so that the memory attention
+        activations fit in `object_batch_memory_budget_mb`.
+        """
+        if self.object_batch_memory_budget_mb is None or self.num_maskmem == 0:
+            return batch_size
+        H, W = feat_sizes[-1]
+        num_query_tokens = H * W
+        # an upper bound on the memory tokens: all the spatial memories and object
+        # pointers (each split into `hidden_dim // mem_dim` tokens)
+        num_mem_tokens = self.num_maskmem * H * W
+        num_mem_tokens += self.max_obj_ptrs_in_encoder * (
+            self.hidden_dim // self.mem_dim
+        )
+        # float32 attention scores (as materialized by the math SDPA kernel) plus the
+        # query, key, value and output projections of the current frame and memory
+        bytes_per_obj = 4 * num_query_tokens * num_mem_tokens
+        bytes_per_obj += 4 * 4 * (num_query_tokens + num_mem_tokens) * self.hidden_dim
+        budget_bytes = self.object_batch_memory_budget_mb * 1024**2
+        return max(1, min(batch_size, int(budget_bytes // bytes_per_obj)))
+
+    def _track_step_in_object_chunks(
+        self,
+        chunk_size,
+        frame_idx,
+        is_init_cond_frame,
+        current_vision_feats,
+        current_vision_pos_embeds,
+        feat_sizes,
+        output_dict,
+        num_frames,
+        track_in_reverse,
+        run_mem_encoder,
+        skip_high_res_if_absent=False,
+        profiler=None,
+    ):
+        """
+        Run `track_step` (without point or mask inputs) on chunks of `chunk_size`
+        objects one after the other and concatenate their outputs. All the chunks use
+        the same image features (expanded to the objects without copies), and each
+        chunk reads its slice of the previous frames' memories in `output_dict`.
+
+        With `skip_high_res_if_absent`, the high-res masks and the memory encoder are
+        only skipped if no object appears in any chunk (as for a single batch): the
+        chunks that skipped them are run again in full if an object appears in
+        another chunk.
+        """
+        batch_size = current_vision_feats[-1].size(1)
+        obj_slices = [
+            slice(start, start + chunk_size)
+            for start in range(0, batch_size, chunk_size)
+        ]
+
+        def _track_chunk(obj_slice, skip_high_res_if_absent):
+            chunk_output_dict = {
+                storage_key: _ObjectSliceDict(outputs, obj_slice)
+                for storage_key, outputs in output_dict.items()
+            }
+            # the vision features are (HW)BC tensors, with objects in dim 1
+            chunk_vision_feats = [x[:, obj_slice] for x in current_vision_feats]
+            chunk_vision_pos_embeds = [
+                x[:, obj_slice] for x in current_vision_pos_embeds
+            ]
+            return self.track_step(
+                frame_idx=frame_idx,
+                is_init_cond_frame=is_init_cond_frame,
+                current_vision_feats=chunk_vision_feats,
+                current_vision_pos_embeds=chunk_vision_pos_embeds,
+                feat_sizes=feat_sizes,
+                point_inputs=None,
+                mask_inputs=None,
+                output_dict=chunk_output_dict,
+                num_frames=num_frames,
+                track_in_reverse=track_in_reverse,
+                run_mem_encoder=run_mem_encoder,
+                skip_high_res_if_absent=skip_high_res_if_absent,
+                profiler=profiler,
+            )
+
+        chunk_outs = [
+            _track_chunk(obj_slice, skip_high_res_if_absent) for obj_slice in obj_slices
+        ]
+        skipped = [out["pred_masks_high_res"] is None for out in chunk_outs]
+        if any(skipped) and not all(skipped):
+            chunk_outs = [
+                _track_chunk(obj_slice, False) if is_skipped else out
+                for obj_slice, out, is_skipped in zip(obj_slices, chunk_outs, skipped)
+            ]
+        return _cat_objects(chunk_outs)
+
     def _run_memory_encoder(
         self,
         inference_state,
@@ -1008,15 +1794,36 @@ class SAM2VideoPredictor(SAM2Base):
         )
 
         # optionally offload the output to CPU memory to save GPU space
-        storage_device = inference_state["storage_device"]
-        maskmem_features = maskmem_features.to(torch.bfloat16)
-        maskmem_features = maskmem_features.to(storage_device, non_blocking=True)
+        maskmem_features = maskmem_features.to(self.memory_storage_dtype)
+        maskmem_features = self._offload_to_storage(inference_state, maskmem_features)
         # "maskmem_pos_enc" is the same across frames, so we only need to store one copy of it
         maskmem_pos_enc = self._get_maskmem_pos_enc(
             inference_state, {"maskmem_pos_enc": maskmem_pos_enc}
         )
         return maskmem_features, maskmem_pos_enc
 
+    def _offload_to_storage(self, inference_state, tensor, pooled=True):
+        """
+        Move a state tensor to the storage device. With an async state offloader, the
+        copy goes into a pinned host buffer on the offloader's copy stream.
+        """
+        offloader = inference_state["state_offloader"]
+        if offloader is not None and pooled:
+            return offloader.offload(tensor)
+        return tensor.to(inference_state["storage_device"], non_blocking=True)
+
+    def _release_offloaded_output(self, inference_state, out):
+        """Return the pinned buffers of a dropped output to the offloader's pool."""
+        offloader = inference_state["state_offloader"]
+        if offloader is not None and out is not None:
+            offloader.release(out)
+
+    def _sync_offloaded_state(self, inference_state):
+        """Wait for pending state offloading before reading the state on the host."""
+        offloader = inference_state["state_offloader"]
+        if offloader is not None:
+            offloader.synchronize()
+
     def _get_maskmem_pos_enc(self, inference_state, current_out):
         """
         `maskmem_pos_enc` is the same across frames and objects, so we cache it as
@@ -1048,6 +1855,7 @@ class SAM2VideoPredictor(SAM2Base):
         Remove an object id from the tracking state. If strict is True, we check whether
         the object id actually exists and raise an error if it doesn't exist.
         """
+        self._sync_offloaded_state(inference_state)
         old_obj_idx_to_rm = inference_state["obj_id_to_idx"].get(obj_id, None)
         updated_frames = []
         # Check whether this object_id to remove actually exists and possibly raise an error.
@@ -1114,13 +1922,24 @@ class SAM2VideoPredictor(SAM2Base):
         # Step 3: For packed tensor storage, we index the remaining ids and rebuild the per-object slices.
         def _slice_state(output_dict, storage_key):
             for frame_idx, out in output_dict[storage_key].items():
-                out["maskmem_features"] = out["maskmem_features"][remain_old_obj_inds]
-                out["maskmem_pos_enc"] = [
-                    x[remain_old_obj_inds] for x in out["maskmem_pos_enc"]
-                ]
+                # the sliced tensors below are new copies, so any pinned buffers of the
+                # packed ones are returned to the pool
+                # (frames tracked while the objects were absent have no memory features)
+                sliced_maskmem_features = None
+                if out["maskmem_features"] is not None:
+                    sliced_maskmem_features = out["maskmem_features"][
+                        remain_old_obj_inds
+                    ]
+                sliced_pred_masks = out["pred_masks"][remain_old_obj_inds]
+                self._release_offloaded_output(inference_state, out)
+                out["maskmem_features"] = sliced_maskmem_features
+                if out["maskmem_pos_enc"] is not None:
+                    out["maskmem_pos_enc"] = [
+                        x[remain_old_obj_inds] for x in out["maskmem_pos_enc"]
+                    ]
                 # "maskmem_pos_enc" is the same across frames, so we only need to store one copy of it
                 out["maskmem_pos_enc"] = self._get_maskmem_pos_enc(inference_state, out)
-                out["pred_masks"] = out["pred_masks"][remain_old_obj_inds]
+                out["pred_masks"] = sliced_pred_masks
                 out["obj_ptr"] = out["obj_ptr"][remain_old_obj_inds]
                 out["object_score_logits"] = out["object_score_logits"][
                     remain_old_obj_inds
@@ -1171,6 +1990,8 @@ class SAM2VideoPredictor(SAM2Base):
         output_dict = inference_state["output_dict"]
         non_cond_frame_outputs = output_dict["non_cond_frame_outputs"]
         for t in range(frame_idx_begin, frame_idx_end + 1):
-            non_cond_frame_outputs.pop(t, None)
+            self._release_offloaded_output(
+                inference_state, non_cond_frame_outputs.pop(t, None)
+            )
             for obj_output_dict in inference_state["output_dict_per_obj"].values():
                 obj_output_dict["non_cond_frame_outputs"].pop(t, None)
@@ -110,29 +110,51 @@ def mask_to_rle_pytorch(tensor: torch.Tensor) -> List[Dict[str, Any]]:
     """
     Encodes masks to an uncompressed RLE, in the format expected by
     pycoco tools.
+
+    All the masks are encoded together on their device, and only their run lengths
+    are copied to the host (in a single transfer), so the cost of the host copy
+    scales with the size of the RLEs rather than the size and number of the masks.
     """
     # Put in fortran order and flatten h,w
     b, h, w = tensor.shape
+    if b == 0:
+        return []
     tensor = tensor.permute(0, 2, 1).flatten(1)
 
     # Compute change indices
     diff = tensor[:, 1:] ^ tensor[:, :-1]
     change_indices = diff.nonzero()
 
-    # Encode run length
+    # Encode run length: the runs of each mask are the differences between its
+    # boundaries (its start, its change indices and its end), which we get for all
+    # masks at once by sorting the boundaries of all masks by (mask index, position)
+    device = tensor.device
+    mask_inds = torch.arange(b, device=device)
+    boundary_mask_inds = torch.cat([mask_inds, change_indices[:, 0], mask_inds])
+    boundary_positions = torch.cat(
+        [
+            torch.zeros(b, dtype=change_indices.dtype, device=device),
+            change_indices[:, 1] + 1,
+            torch.full((b,), h * w, dtype=change_indices.dtype, device=device),
+        ]
+    )
+    order = torch.argsort(boundary_mask_inds * (h * w + 1) + boundary_positions)
+    boundary_mask_inds = boundary_mask_inds[order]
+    boundary_positions = boundary_positions[order]
+    # keep the differences between consecutive boundaries of the same mask
+    same_mask = boundary_mask_inds[1:] == boundary_mask_inds[:-1]
+    btw_idxs = (boundary_positions[1:] - boundary_positions[:-1])[same_mask]
+    num_runs = torch.bincount(change_indices[:, 0], minlength=b) + 1
+    starts_with_one = tensor[:, 0].to(btw_idxs.dtype)
+
+    # Copy the run lengths to the host at once and split them per mask
+    host_data = torch.cat([starts_with_one, num_runs, btw_idxs]).cpu().numpy()
+    starts_with_one, num_runs = host_data[:b], host_data[b : 2 * b]
+    btw_idxs = np.split(host_data[2 * b :], np.cumsum(num_runs)[:-1])
     out = []
     for i in range(b):
-        cur_idxs = change_indices[change_indices[:, 0] == i, 1]
-        cur_idxs = torch.cat(
-            [
-                torch.tensor([0], dtype=cur_idxs.dtype, device=cur_idxs.device),
-                cur_idxs + 1,
-                torch.tensor([h * w], dtype=cur_idxs.dtype, device=cur_idxs.device),
-            ]
-        )
-        btw_idxs = cur_idxs[1:] - cur_idxs[:-1]
-        counts = [] if tensor[i, 0] == 0 else [0]
-        counts.extend(btw_idxs.detach().cpu().tolist())
+        counts = [] if starts_with_one[i] == 0 else [0]
+        counts.extend(btw_idxs[i].tolist())
         out.append({"size": [h, w], "counts": counts})
     return out
 
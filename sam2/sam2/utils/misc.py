@@ -4,9 +4,13 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import functools
+import hashlib
+import itertools
 import os
 import warnings
-from threading import Thread
+from collections import OrderedDict
+from threading import Lock, Thread
 
 import numpy as np
 import torch
@@ -14,6 +18,40 @@ from PIL import Image
 from tqdm import tqdm
 
 
+def get_default_device():
+    """The default compute device: CUDA if it's available and CPU otherwise."""
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def configure_cpu_threads(num_threads=None, num_interop_threads=None):
+    """
+    Size PyTorch's intra-op and inter-op thread pools for CPU inference. By default,
+    the intra-op pool uses all CPUs available to this process (which might be fewer
+    than `os.cpu_count()` under CPU affinity or container limits), and the inter-op
+    pool uses a single thread since the model runs its ops sequentially.
+    """
+    if num_threads is None:
+        if hasattr(os, "sched_getaffinity"):
+            num_threads = len(os.sched_getaffinity(0))
+        else:
+            num_threads = os.cpu_count() or 1
+    if num_interop_threads is None:
+        num_interop_threads = 1
+    torch.set_num_threads(num_threads)
+    if torch.get_num_interop_threads() != num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # the inter-op pool can only be sized before any inter-op parallel work
+            warnings.warn(
+                "Could not set the number of inter-op threads, since inter-op "
+                "parallel work has already started in this process.",
+                category=UserWarning,
+                stacklevel=2,
+            )
+    return num_threads, torch.get_num_interop_threads()
+
+
 def get_sdpa_settings():
     if torch.cuda.is_available():
         old_gpu = torch.cuda.get_device_properties(0).major < 7
@@ -57,10 +95,66 @@ def get_connected_components(mask):
               for foreground pixels and 0 for background pixels.
     - counts: A tensor of shape (N, 1, H, W) containing the area of the connected
               components for foreground pixels and 0 for background pixels.
+
+    CUDA masks use the kernel from the SAM 2 CUDA extension. Masks on other devices
+    (or when the extension isn't built) are labeled on CPU with OpenCV or SciPy.
+    """
+    device = mask.device
+    if device.type == "cuda":
+        _C = _get_connected_components_kernel()
+        if _C is not None:
+            return _C.get_connected_componnets(mask.to(torch.uint8).contiguous())
+    labels, counts = _get_connected_components_cpu(mask.detach().cpu().numpy())
+    return (
+        torch.from_numpy(labels).to(device, non_blocking=True),
+        torch.from_numpy(counts).to(device, non_blocking=True),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_connected_components_kernel():
+    """Get the SAM 2 CUDA extension with the connected components kernel (if built)."""
+    try:
+        from sam2 import _C
+    except ImportError:
+        return None
+    return _C
+
+
+def _get_connected_components_cpu(mask):
     """
-    from sam2 import _C
+    CPU version of `get_connected_components` on a (N, 1, H, W) numpy mask, with
+    OpenCV if it's installed and SciPy otherwise. Returns int32 numpy arrays.
+    """
+    mask = mask.astype(np.uint8)
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    counts = np.zeros(mask.shape, dtype=np.int32)
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+
+    if cv2 is not None:
+        for i in range(mask.shape[0]):
+            _, labels_i, stats, _ = cv2.connectedComponentsWithStats(
+                mask[i, 0], connectivity=8, ltype=cv2.CV_32S
+            )
+            areas = stats[:, cv2.CC_STAT_AREA].astype(np.int32)
+            areas[0] = 0  # label 0 is the background
+            labels[i, 0] = labels_i
+            counts[i, 0] = areas[labels_i]
+        return labels, counts
 
-    return _C.get_connected_componnets(mask.to(torch.uint8).contiguous())
+    from scipy import ndimage
+
+    # label all the masks at once, with 8-connectivity within each mask only
+    structure = np.zeros((3, 3, 3, 3), dtype=bool)
+    structure[1, 1] = True
+    labels[:], _ = ndimage.label(mask, structure=structure)
+    areas = np.bincount(labels.ravel(), minlength=1).astype(np.int32)
+    areas[0] = 0  # label 0 is the background
+    counts[:] = areas[labels]
+    return labels, counts
 
 
 def mask_to_box(masks: torch.Tensor):
@@ -89,6 +183,99 @@ def mask_to_box(masks: torch.Tensor):
     return bbox_coords
 
 
+@functools.lru_cache(maxsize=8)
+def _get_bilinear_weights(in_size, out_size, device):
+    """
+    Get the [out_size, in_size] matrix of the 1D interpolation weights used in
+    `F.interpolate(..., mode="bilinear", align_corners=False)` along one axis.
+    """
+    out_inds = torch.arange(out_size, device=device)
+    src = ((out_inds + 0.5) * (in_size / out_size) - 0.5).clamp(min=0)
+    inds0 = src.floor().long().clamp(max=in_size - 1)
+    inds1 = (inds0 + 1).clamp(max=in_size - 1)
+    lambda1 = src - inds0
+    weights = torch.zeros(out_size, in_size, device=device)
+    weights.index_put_((out_inds, inds0), 1 - lambda1, accumulate=True)
+    weights.index_put_((out_inds, inds1), lambda1, accumulate=True)
+    return weights
+
+
+def _get_upsampling_windows(is_positive, out_size):
+    """
+    For the [B, n] flags of the input rows (or columns) of B masks with a positive
+    pixel, get the windows of k input indices around them (their positive range and
+    one more index on each side, padded to the same size k), the windows of m output
+    indices after upsampling to `out_size` that have a weight on them, and the [B, m, k]
+    bilinear interpolation weights between both.
+    """
+    B, n = is_positive.shape
+    device = is_positive.device
+    inds = torch.arange(n, device=device)
+    has_positive = is_positive.any(dim=1)
+    lo = torch.where(is_positive, inds, n).min(dim=1).values - 1
+    hi = torch.where(is_positive, inds, -1).max(dim=1).values + 2
+    lo = torch.where(has_positive, lo.clamp(min=0), 0)
+    hi = torch.where(has_positive, hi.clamp(max=n), 1)
+    k = int((hi - lo).max())
+    in_inds = torch.minimum(lo, torch.full_like(lo, n - k))[:, None] + torch.arange(
+        k, device=device
+    )
+    # [B, out_size, k] weights of all the output indices on the input windows
+    weights = _get_bilinear_weights(n, out_size, device)[:, in_inds].permute(1, 0, 2)
+    out_inds = torch.arange(out_size, device=device)
+    has_weight = weights.sum(dim=2) > 0
+    out_lo = torch.where(has_weight, out_inds, out_size).min(dim=1).values
+    out_hi = torch.where(has_weight, out_inds, -1).max(dim=1).values + 1
+    m = int((out_hi - out_lo).max())
+    out_inds = torch.minimum(out_lo, torch.full_like(out_lo, out_size - m))[
+        :, None
+    ] + torch.arange(m, device=device)
+    weights = weights.gather(1, out_inds[:, :, None].expand(-1, -1, k))
+    return in_inds, out_inds, weights
+
+
+def upsampled_masks_to_boxes(masks, size):
+    """
+    Compute the bounding boxes of the positive pixels of [B, H, W] mask score maps
+    after bilinearly upsampling them to `size` (as `F.interpolate` with
+    `align_corners=False`), without materializing the upsampled masks. An upsampled
+    pixel is a weighted sum of its 2x2 neighboring input pixels, so only a window
+    around the positive input pixels of each mask is upsampled (the pixels outside
+    of it are weighted sums of non-positive input pixels). The windows of all the
+    masks are padded to the same size and upsampled together.
+
+    Returns a [B, 4] long tensor of the boxes (x_min, y_min, x_max, y_max) in the
+    upsampled resolution (all zeros for the masks without any positive pixel after
+    upsampling) and a [B] bool tensor of whether each mask has a box.
+    """
+    B, h, w = masks.shape
+    if B == 0:
+        return torch.zeros(0, 4, dtype=torch.long, device=masks.device), torch.zeros(
+            0, dtype=torch.bool, device=masks.device
+        )
+    is_positive = masks > 0
+    in_ys, out_ys, weights_y = _get_upsampling_windows(is_positive.any(dim=2), size[0])
+    in_xs, out_xs, weights_x = _get_upsampling_windows(is_positive.any(dim=1), size[1])
+    crops = masks.float().gather(1, in_ys[:, :, None].expand(-1, -1, w))
+    crops = crops.gather(2, in_xs[:, None, :].expand(-1, in_ys.size(1), -1))
+    upsampled = weights_y @ crops @ weights_x.transpose(1, 2)
+    upsampled_is_positive = upsampled > 0
+    rows = upsampled_is_positive.any(dim=2)
+    cols = upsampled_is_positive.any(dim=1)
+    has_box = rows.any(dim=1)
+    boxes = torch.stack(
+        [
+            torch.where(cols, out_xs, size[1]).min(dim=1).values,
+            torch.where(rows, out_ys, size[0]).min(dim=1).values,
+            torch.where(cols, out_xs, -1).max(dim=1).values,
+            torch.where(rows, out_ys, -1).max(dim=1).values,
+        ],
+        dim=1,
+    )
+    boxes = torch.where(has_box[:, None], boxes, 0)
+    return boxes, has_box
+
+
 def _load_img_as_tensor(img_path, image_size):
     img_pil = Image.open(img_path)
     img_np = np.array(img_pil.convert("RGB").resize((image_size, image_size)))
@@ -169,6 +356,126 @@ class AsyncVideoFrameLoader:
         return len(self.images)
 
 
+class AsyncVideoFileFrameLoader:
+    """
+    A list of the frames of a video file to be decoded asynchronously without blocking
+    session start. The frames are decoded in chunks of consecutive frames, starting
+    from the frame set with `prioritize` (e.g. the frame a user is viewing): first the
+    frames after it (in tracking order) and then the ones before it.
+    """
+
+    def __init__(
+        self,
+        video_path,
+        image_size,
+        offload_video_to_cpu,
+        img_mean,
+        img_std,
+        compute_device,
+        chunk_size=16,
+    ):
+        import decord
+
+        decord.bridge.set_bridge("torch")
+        self.image_size = image_size
+        self.offload_video_to_cpu = offload_video_to_cpu
+        self.compute_device = compute_device
+        if not offload_video_to_cpu:
+            img_mean = img_mean.to(compute_device)
+            img_std = img_std.to(compute_device)
+        self.img_mean = img_mean
+        self.img_std = img_std
+        self.chunk_size = chunk_size
+        # the original video height and width
+        self.video_height, self.video_width, _ = (
+            decord.VideoReader(video_path).next().shape
+        )
+        # decord readers are not thread-safe, so the decoding is serialized (and each
+        # frame is only decoded once, see `_load_chunk`)
+        self.reader = decord.VideoReader(
+            video_path, width=image_size, height=image_size
+        )
+        self.reader_lock = Lock()
+        # items in `self.images` will be decoded asynchronously
+        self.images = [None] * len(self.reader)
+        # catch and raise any exceptions in the async decoding thread
+        self.exception = None
+        # the frame around which the remaining frames are decoded first
+        self.priority_frame_idx = 0
+        self.closed = False
+
+        # decode the first frame (since it's most likely where the user will click)
+        self.__getitem__(0)
+
+        # decode the rest of frames asynchronously without blocking the session start
+        def _load_frames():
+            try:
+                while not self.closed:
+                    frame_inds = self._get_next_chunk()
+                    if not frame_inds:
+                        break
+                    self._load_chunk(frame_inds)
+            except Exception as e:
+                self.exception = e
+
+        self.thread = Thread(target=_load_frames, daemon=True)
+        self.thread.start()
+
+    def prioritize(self, frame_idx):
+        """Decode the frames around `frame_idx` first."""
+        self.priority_frame_idx = min(max(frame_idx, 0), len(self.images) - 1)
+
+    def close(self):
+        """Stop decoding the remaining frames (e.g. when the session is closed)."""
+        self.closed = True
+
+    def _get_next_chunk(self):
+        num_frames = len(self.images)
+        start = self.priority_frame_idx
+        forward = range(start, num_frames)
+        backward = range(start - 1, -1, -1)
+        for frame_idx in itertools.chain(forward, backward):
+            if self.images[frame_idx] is None:
+                break
+        else:
+            return []
+        end = min(frame_idx + self.chunk_size, num_frames)
+        return [n for n in range(frame_idx, end) if self.images[n] is None]
+
+    def _load_chunk(self, frame_inds):
+        # both the background thread and `__getitem__` (on a frame not decoded yet)
+        # load frames, so the frames still to decode are checked and written under
+        # the lock, and a frame decoded by one of them isn't decoded again
+        with self.reader_lock:
+            frame_inds = [n for n in frame_inds if self.images[n] is None]
+            if not frame_inds:
+                return
+            frames = self.reader.get_batch(frame_inds)
+            images = frames.permute(0, 3, 1, 2).float() / 255.0
+            if not self.offload_video_to_cpu:
+                images = images.to(self.compute_device, non_blocking=True)
+            # normalize by mean and std
+            images -= self.img_mean
+            images /= self.img_std
+            for frame_idx, img in zip(frame_inds, images):
+                self.images[frame_idx] = img
+
+    def __getitem__(self, index):
+        if self.exception is not None:
+            raise RuntimeError("Failure in frame loading thread") from self.exception
+
+        img = self.images[index]
+        if img is None:
+            # not decoded yet, so decode it right away (unless the background thread
+            # is decoding it, in which case this waits for it)
+            self._load_chunk([index])
+            img = self.images[index]
+        return img
+
+    def __len__(self):
+        return len(self.images)
+
+
 def load_video_frames(
     video_path,
     image_size,
@@ -176,12 +483,14 @@ def load_video_frames(
     img_mean=(0.485, 0.456, 0.406),
     img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
-    compute_device=torch.device("cuda"),
+    compute_device=None,
 ):
     """
     Load the video frames from video_path. The frames are resized to image_size as in
     the model and are loaded to GPU if offload_video_to_cpu=False. This is used by the demo.
     """
+    if compute_device is None:
+        compute_device = get_default_device()
     is_bytes = isinstance(video_path, bytes)
     is_str = isinstance(video_path, str)
     is_mp4_path = is_str and os.path.splitext(video_path)[-1] in [".mp4", ".MP4"]
@@ -192,6 +501,7 @@ def load_video_frames(
             offload_video_to_cpu=offload_video_to_cpu,
             img_mean=img_mean,
             img_std=img_std,
+            async_loading_frames=async_loading_frames,
             compute_device=compute_device,
         )
     elif is_str and os.path.isdir(video_path):
@@ -217,7 +527,7 @@ def load_video_frames_from_jpg_images(
     img_mean=(0.485, 0.456, 0.406),
     img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
-    compute_device=torch.device("cuda"),
+    compute_device=None,
 ):
     """
     Load the video frames from a directory of JPEG files ("<frame_index>.jpg" format).
@@ -227,6 +537,8 @@ def load_video_frames_from_jpg_images(
 
     You can load a frame asynchronously by setting `async_loading_frames` to `True`.
     """
+    if compute_device is None:
+        compute_device = get_default_device()
     if isinstance(video_path, str) and os.path.isdir(video_path):
         jpg_folder = video_path
     else:
@@ -283,13 +595,33 @@ def load_video_frames_from_video_file(
     offload_video_to_cpu,
     img_mean=(0.485, 0.456, 0.406),
     img_std=(0.229, 0.224, 0.225),
-    compute_device=torch.device("cuda"),
+    async_loading_frames=False,
+    compute_device=None,
 ):
-    """Load the video frames from a video file."""
+    """
+    Load the video frames from a video file.
+
+    You can decode the frames asynchronously by setting `async_loading_frames` to
+    `True`.
+    """
     import decord
 
+    if compute_device is None:
+        compute_device = get_default_device()
+
     img_mean = torch.tensor(img_mean, dtype=torch.float32)[:, None, None]
     img_std = torch.tensor(img_std, dtype=torch.float32)[:, None, None]
+    if async_loading_frames:
+        lazy_images = AsyncVideoFileFrameLoader(
+            video_path,
+            image_size,
+            offload_video_to_cpu,
+            img_mean,
+            img_std,
+            compute_device,
+        )
+        return lazy_images, lazy_images.video_height, lazy_images.video_width
+
     # Get the original video height and width
     decord.bridge.set_bridge("torch")
     video_height, video_width, _ = decord.VideoReader(video_path).next().shape
@@ -309,6 +641,60 @@ def load_video_frames_from_video_file(
     return images, video_height, video_width
 
 
+# the hashes of the recently hashed video files, keyed by their paths, sizes and
+# modification times (so that a changed file is hashed again)
+_VIDEO_HASH_CACHE = OrderedDict()
+_VIDEO_HASH_CACHE_SIZE = 64
+_video_hash_cache_lock = Lock()
+
+
+def get_video_content_hash(video_path, chunk_size=1 << 20):
+    """
+    Compute a SHA-256 hash of the video content at `video_path`, which can be an MP4
+    file path, its raw bytes, or a directory of JPEG frames (hashed in frame order).
+    The hashes of files are cached until the files change.
+    """
+    hasher = hashlib.sha256()
+    if isinstance(video_path, bytes):
+        hasher.update(video_path)
+        return hasher.hexdigest()
+
+    if os.path.isdir(video_path):
+        frame_names = [
+            p
+            for p in os.listdir(video_path)
+            if os.path.splitext(p)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
+        ]
+        frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+        file_paths = [os.path.join(video_path, p) for p in frame_names]
+    else:
+        file_paths = [video_path]
+    cache_key = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        cache_key.append((os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns))
+    cache_key = tuple(cache_key)
+    with _video_hash_cache_lock:
+        video_hash = _VIDEO_HASH_CACHE.get(cache_key, None)
+        if video_hash is not None:
+            _VIDEO_HASH_CACHE.move_to_end(cache_key)
+            return video_hash
+
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+    video_hash = hasher.hexdigest()
+    with _video_hash_cache_lock:
+        _VIDEO_HASH_CACHE[cache_key] = video_hash
+        while len(_VIDEO_HASH_CACHE) > _VIDEO_HASH_CACHE_SIZE:
+            _VIDEO_HASH_CACHE.popitem(last=False)
+    return video_hash
+
+
 def fill_holes_in_mask_scores(mask, max_area):
     """
     A post processor to fill small holes in mask scores with area under `max_area`.
@@ -324,7 +710,7 @@ def fill_holes_in_mask_scores(mask, max_area):
         # We fill holes with a small positive mask score (0.1) to change them to foreground.
         mask = torch.where(is_hole, 0.1, mask)
     except Exception as e:
-        # Skip the post-processing step on removing small holes if the CUDA kernel fails
+        # Skip the post-processing step on removing small holes if the labeling fails
         warnings.warn(
             f"{e}\n\nSkipping the post-processing step due to the error above. You can "
             "still use SAM 2 and it's OK to ignore the error above, although some post-processing "
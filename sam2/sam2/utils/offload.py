@@ -0,0 +1,184 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import math
+from collections import defaultdict, deque
+
+import torch
+
+
+class PinnedBufferPool:
+    """
+    A pool of reusable page-locked (pinned) host buffers, bucketed by their number
+    of elements and dtype. Allocating pinned memory is expensive, so buffers released
+    by the inference state are kept around and handed out again for later frames.
+    """
+
+    def __init__(self, max_free_per_bucket=64):
+        self.max_free_per_bucket = max_free_per_bucket
+        self._free = defaultdict(list)
+
+    def acquire(self, shape, dtype):
+        """Get a flat pinned buffer and a view of it in `shape`."""
+        numel = math.prod(shape)
+        bucket = self._free[(numel, dtype)]
+        if bucket:
+            buffer = bucket.pop()
+        else:
+            buffer = torch.empty(numel, dtype=dtype, pin_memory=True)
+        return buffer, buffer.view(shape)
+
+    def release(self, buffer):
+        """Return a flat pinned buffer to the pool."""
+        bucket = self._free[(buffer.numel(), buffer.dtype)]
+        if len(bucket) < self.max_free_per_bucket:
+            bucket.append(buffer)
+
+    def clear(self):
+        self._free.clear()
+
+
+class _OffloadedTensor:
+    """Bookkeeping for a GPU tensor that is being (or has been) copied to host."""
+
+    def __init__(self, buffer, source, event):
+        self.buffer = buffer  # the flat pinned buffer backing the host tensor
+        self.source = source  # the GPU tensor, kept until the copy finishes
+        self.event = event  # recorded on the copy stream after the copy
+
+
+class AsyncStateOffloader:
+    """
+    Offload per-frame inference state (e.g. "maskmem_features") from GPU memory into
+    pinned host buffers on a dedicated CUDA copy stream, and prefetch it back to GPU
+    ahead of the memory attention, so that `offload_state_to_cpu=True` doesn't stall
+    the compute stream on device-to-host copies.
+
+    The compute stream never waits for a device-to-host copy. Host-side readers of
+    the offloaded tensors (e.g. when consolidating outputs after user clicks) should
+    call `synchronize` first.
+    """
+
+    def __init__(self, device, pool=None):
+        device = torch.device(device)
+        assert device.type == "cuda", "async state offloading requires a CUDA device"
+        self.device = device
+        self.copy_stream = torch.cuda.Stream(device=device)
+        self.pool = pool if pool is not None else PinnedBufferPool()
+        # host tensor data_ptr -> _OffloadedTensor, for all pooled host tensors
+        self._offloaded = {}
+        # host tensor data_ptrs whose GPU source is still held (copy maybe in flight)
+        self._in_flight = deque()
+        # (output dict, key, host tensor) entries swapped with GPU tensors by `prefetch`
+        self._swapped = []
+        self._prefetch_event = None
+
+    def offload(self, tensor):
+        """
+        Start copying a GPU tensor into a pinned host buffer on the copy stream and
+        return the host tensor (whose content is valid once the copy finishes).
+        """
+        self._reap()
+        buffer, host_tensor = self.pool.acquire(tensor.shape, tensor.dtype)
+        # the copy must start after `tensor` is produced on the compute stream
+        self.copy_stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(self.copy_stream):
+            host_tensor.copy_(tensor, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self.copy_stream)
+        # don't let the caching allocator reuse `tensor` before the copy is done
+        tensor.record_stream(self.copy_stream)
+        ptr = host_tensor.data_ptr()
+        self._offloaded[ptr] = _OffloadedTensor(buffer, tensor, event)
+        self._in_flight.append(ptr)
+        return host_tensor
+
+    def prefetch(self, outputs, keys=("maskmem_features",)):
+        """
+        Start copying the offloaded `keys` in each of the `outputs` dicts back to GPU
+        on the copy stream. The tensors are swapped in place in `outputs` (so that the
+        model reads the GPU copies) until `restore` is called. Call `wait` before the
+        compute stream uses them.
+        """
+        self._reap()
+        with torch.cuda.stream(self.copy_stream):
+            for out in outputs:
+                for key in keys:
+                    host_tensor = out.get(key)
+                    if host_tensor is None or host_tensor.device.type != "cpu":
+                        continue
+                    entry = self._offloaded.get(host_tensor.data_ptr())
+                    if (
+                        entry is not None
+                        and entry.source is not None
+                        and entry.source.shape == host_tensor.shape
+                    ):
+                        # the GPU original is still alive, so we skip the round trip
+                        # (the shape check excludes per-object slices of the host tensor)
+                        gpu_tensor = entry.source
+                    else:
+                        gpu_tensor = host_tensor.to(self.device, non_blocking=True)
+                    self._swapped.append((out, key, host_tensor))
+                    out[key] = gpu_tensor
+            self._prefetch_event = torch.cuda.Event()
+            self._prefetch_event.record(self.copy_stream)
+
+    def wait(self):
+        """Make the compute stream wait for the prefetched tensors."""
+        if self._prefetch_event is None:
+            return
+        compute_stream = torch.cuda.current_stream(self.device)
+        compute_stream.wait_event(self._prefetch_event)
+        for out, key, _ in self._swapped:
+            # these tensors were allocated on the copy stream but are used on the compute stream
+            out[key].record_stream(compute_stream)
+        self._prefetch_event = None
+
+    def restore(self):
+        """Swap the host tensors back into the output dicts after the prefetch."""
+        for out, key, host_tensor in self._swapped:
+            out[key] = host_tensor
+        self._swapped.clear()
+        self._prefetch_event = None
+
+    def release(self, out, keys=("maskmem_features", "pred_masks")):
+        """
+        Return the pinned buffers behind `keys` in `out` to the pool. It should be
+        called when `out` is dropped or overwritten in the inference state.
+        """
+        for key in keys:
+            host_tensor = out.get(key)
+            if host_tensor is None or host_tensor.device.type != "cpu":
+                continue
+            entry = self._offloaded.pop(host_tensor.data_ptr(), None)
+            if entry is None:
+                continue
+            if entry.source is not None:
+                entry.event.synchronize()
+            self.pool.release(entry.buffer)
+
+    def synchronize(self):
+        """Wait for all pending copies, so that host tensors can be read on CPU."""
+        self.copy_stream.synchronize()
+        self._reap()
+
+    def reset(self):
+        """Return all pooled buffers after the inference state is reset."""
+        self.synchronize()
+        for entry in self._offloaded.values():
+            self.pool.release(entry.buffer)
+        self._offloaded.clear()
+        self._in_flight.clear()
+
+    def _reap(self):
+        """Drop the GPU sources of the host copies that have finished."""
+        while self._in_flight:
+            entry = self._offloaded.get(self._in_flight[0])
+            if entry is not None and not entry.event.query():
+                break
+            self._in_flight.popleft()
+            if entry is not None:
+                entry.source = None
@@ -0,0 +1,97 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import contextlib
+from collections.abc import Mapping
+
+import torch
+
+PRECISION_DTYPES = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
+# the parts of the model that can run in different precisions: the image encoder
+# ("backbone"), the memory attention and memory encoder ("memory") and the SAM prompt
+# encoder and mask decoder ("decoder")
+PRECISION_COMPONENTS = ("backbone", "memory", "decoder")
+
+
+class PrecisionPolicy:
+    """
+    The compute precision of each model component. A component in "bf16" or "fp16"
+    runs under `torch.autocast` (on CUDA or CPU), while a component in "fp32" runs
+    with autocast disabled (even if the caller wrapped the inference in autocast).
+    Each component returns float32 outputs, so the components can be mixed freely.
+    The memory features are stored in the dtype of the "memory" component.
+    """
+
+    def __init__(self, backbone="fp32", memory="fp32", decoder="fp32"):
+        self.precisions = {}
+        for component, precision in zip(
+            PRECISION_COMPONENTS, (backbone, memory, decoder)
+        ):
+            if precision not in PRECISION_DTYPES:
+                raise ValueError(
+                    f"Unknown precision {precision!r} for {component}, "
+                    f"expected one of {list(PRECISION_DTYPES)}"
+                )
+            self.precisions[component] = precision
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Build a policy from a precision name (e.g. "bf16") for all components, or a
+        mapping from component names to precision names (missing ones use "fp32").
+        """
+        if spec is None or isinstance(spec, PrecisionPolicy):
+            return spec
+        if isinstance(spec, str):
+            return cls(backbone=spec, memory=spec, decoder=spec)
+        if isinstance(spec, Mapping):
+            unknown = set(spec) - set(PRECISION_COMPONENTS)
+            if unknown:
+                raise ValueError(
+                    f"Unknown components {sorted(unknown)} in precision policy, "
+                    f"expected a subset of {list(PRECISION_COMPONENTS)}"
+                )
+            return cls(**spec)
+        raise TypeError(f"Invalid precision policy: {spec!r}")
+
+    def dtype(self, component):
+        return PRECISION_DTYPES[self.precisions[component]]
+
+    @property
+    def memory_storage_dtype(self):
+        return self.dtype("memory")
+
+    def autocast(self, component, device_type):
+        """Get the autocast context to run `component` on `device_type` in."""
+        if device_type not in ("cuda", "cpu"):
+            # autocast is only used on CUDA and CPU, other devices run in float32
+            return contextlib.nullcontext()
+        dtype = self.dtype(component)
+        if dtype == torch.float32:
+            return torch.autocast(device_type, enabled=False)
+        return torch.autocast(device_type, dtype=dtype)
+
+    def to_spec(self):
+        return dict(self.precisions)
+
+    def __repr__(self):
+        args = ", ".join(f"{k}={v!r}" for k, v in self.precisions.items())
+        return f"PrecisionPolicy({args})"
+
+
+def cast_floating(tree, dtype=torch.float32):
+    """Cast all floating point tensors in a nested dict/list/tuple to `dtype`."""
+    if isinstance(tree, torch.Tensor):
+        return tree.to(dtype) if tree.is_floating_point() else tree
+    if isinstance(tree, dict):
+        return {k: cast_floating(v, dtype) for k, v in tree.items()}
+    if isinstance(tree, (list, tuple)):
+        return type(tree)(cast_floating(v, dtype) for v in tree)
+    return tree
@@ -0,0 +1,164 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import contextlib
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+# the stages recorded in the tracking loop of `SAM2VideoPredictor.propagate_in_video`
+PROFILED_STAGES = (
+    "frame_load",  # loading (and decoding, with async loading) the frame to the device
+    "backbone",  # image encoder on a frame without cached features
+    "memory_attention",  # gathering the memory bank and the memory attention
+    "mask_decoder",  # SAM prompt encoder and mask decoder (incl. the SAMURAI selection)
+    "memory_encoder",  # encoding the predicted masks into new memories
+    "hole_filling",  # filling small holes in the predicted masks
+    "host_copy",  # offloading the outputs to the storage device
+    "output_resize",  # converting the masks to the requested output (e.g. video res)
+)
+
+
+class StageProfiler:
+    """
+    An opt-in profiler for the tracking loop, passed as `profiler` to
+    `SAM2VideoPredictor.propagate_in_video`. It records the wall time of each stage
+    (synchronizing the CUDA device before and after it, so that the time includes the
+    stage's kernels) and the peak CUDA memory allocated during it, as well as the
+    latency of each frame. The records can be exported as JSON lines with
+    `write_jsonl` and summarized with `summary`.
+
+    Synchronizing in every stage serializes the host and the device, so the profiled
+    run is slower than an unprofiled one; the per-stage breakdown is what's useful.
+    """
+
+    def __init__(self, device=None):
+        self.device = torch.device(device) if device is not None else None
+        self.records = []
+        self._frame_idx = None
+        self._frame_start = None
+        # the running peak memory of each open stage (for nested stages)
+        self._peak_stack = []
+
+    @property
+    def _track_memory(self):
+        return self.device is not None and self.device.type == "cuda"
+
+    def _sync(self):
+        if self._track_memory:
+            torch.cuda.synchronize(self.device)
+
+    def begin_frame(self, frame_idx):
+        self._sync()
+        self._frame_idx = frame_idx
+        self._frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if self._frame_start is None:
+            return
+        self._sync()
+        latency = time.perf_counter() - self._frame_start
+        self.records.append(
+            {
+                "type": "frame",
+                "frame_idx": self._frame_idx,
+                "latency_ms": latency * 1000,
+            }
+        )
+        self._frame_idx = None
+        self._frame_start = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Record the wall time and peak memory of the code run in this context."""
+        self._sync()
+        if self._track_memory:
+            # keep the parent stage's peak so far before resetting the peak stats
+            if self._peak_stack:
+                peak = torch.cuda.max_memory_allocated(self.device)
+                self._peak_stack[-1] = max(self._peak_stack[-1], peak)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            self._peak_stack.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sync()
+            elapsed = time.perf_counter() - start
+            peak_memory_mb = None
+            if self._track_memory:
+                peak = max(
+                    self._peak_stack.pop(), torch.cuda.max_memory_allocated(self.device)
+                )
+                if self._peak_stack:
+                    self._peak_stack[-1] = max(self._peak_stack[-1], peak)
+                peak_memory_mb = peak / 1024**2
+            self.records.append(
+                {
+                    "type": "stage",
+                    "frame_idx": self._frame_idx,
+                    "stage": name,
+                    "time_ms": elapsed * 1000,
+                    "peak_memory_mb": peak_memory_mb,
+                }
+            )
+
+    def summary(self):
+        """Aggregate the records into per-stage and per-frame statistics."""
+        stage_times = defaultdict(list)
+        stage_peaks = defaultdict(list)
+        frame_latencies = []
+        for record in self.records:
+            if record["type"] == "stage":
+                stage_times[record["stage"]].append(record["time_ms"])
+                if record["peak_memory_mb"] is not None:
+                    stage_peaks[record["stage"]].append(record["peak_memory_mb"])
+            else:
+                frame_latencies.append(record["latency_ms"])
+
+        summary = {"type": "summary", "stages": {}, "frames": None}
+        for name, times in stage_times.items():
+            summary["stages"][name] = {
+                "count": len(times),
+                "total_ms": float(np.sum(times)),
+                **_get_percentiles(times, suffix="_ms"),
+                "peak_memory_mb": max(stage_peaks[name], default=None),
+            }
+        if frame_latencies:
+            summary["frames"] = {
+                "count": len(frame_latencies),
+                "fps": 1000 * len(frame_latencies) / float(np.sum(frame_latencies)),
+                **_get_percentiles(frame_latencies, suffix="_ms"),
+            }
+        return summary
+
+    def write_jsonl(self, path, include_summary=True):
+        """Write all the records (and the summary) to `path` as JSON lines."""
+        with open(path, "w") as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+            if include_summary:
+                f.write(json.dumps(self.summary()) + "\n")
+
+    def reset(self):
+        self.records.clear()
+        self._frame_idx = None
+        self._frame_start = None
+        self._peak_stack.clear()
+
+
+def _get_percentiles(values, suffix=""):
+    values = np.asarray(values)
+    return {
+        f"mean{suffix}": float(values.mean()),
+        f"p50{suffix}": float(np.percentile(values, 50)),
+        f"p90{suffix}": float(np.percentile(values, 90)),
+        f"p99{suffix}": float(np.percentile(values, 99)),
+        f"max{suffix}": float(values.max()),
+    }
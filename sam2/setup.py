@@ -42,10 +42,12 @@ EXTRA_PACKAGES = {
         "Flask>=3.0.3",
         "Flask-Cors>=5.0.0",
         "av>=13.0.0",
+        "cbor2>=5.6.0",
         "dataclasses-json>=0.6.7",
         "eva-decord>=0.6.1",
         "gunicorn>=23.0.0",
         "imagesize>=1.4.1",
+        "msgpack>=1.0.0",
         "pycocotools>=2.0.8",
         "strawberry-graphql>=0.243.0",
     ],
@@ -61,6 +63,7 @@ EXTRA_PACKAGES = {
         "tensordict>=0.5.0",
         "opencv-python>=4.7.0",
         "submitit>=1.5.1",
+        "pytest>=8.0.0",
     ],
 }
 
@@ -0,0 +1,66 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import functools
+
+import numpy as np
+import pytest
+
+# a small synthetic video: a bright square moving right over a noisy background
+NUM_FRAMES = 8
+VIDEO_HEIGHT, VIDEO_WIDTH = 96, 128
+# the inference resolution of the test models (the smallest one the Hiera trunk and
+# the memory attention support), to keep the tests fast on CPU
+IMAGE_SIZE = 256
+
+
+def get_object_center(frame_idx):
+    """The (x, y) center of the moving square on a frame of the synthetic video."""
+    return 35 + 4 * frame_idx, 45
+
+
+@functools.lru_cache(maxsize=None)
+def _build_predictor(config_file, hydra_overrides_extra=()):
+    import torch
+    from sam2.build_sam import build_sam2_video_predictor
+
+    # the models have random weights, so they're seeded to be the same in all runs
+    torch.manual_seed(0)
+    return build_sam2_video_predictor(
+        config_file,
+        ckpt_path=None,
+        device="cpu",
+        image_size=IMAGE_SIZE,
+        hydra_overrides_extra=list(hydra_overrides_extra),
+    )
+
+
+@pytest.fixture(scope="session")
+def predictor():
+    """A SAM 2.1 tiny video predictor with random weights on CPU."""
+    return _build_predictor("configs/sam2.1/sam2.1_hiera_t.yaml")
+
+
+@pytest.fixture(scope="session")
+def samurai_predictor():
+    """A SAMURAI tiny video predictor with random weights on CPU."""
+    return _build_predictor("configs/samurai/sam2.1_hiera_t.yaml")
+
+
+@pytest.fixture(scope="session")
+def video_dir(tmp_path_factory):
+    """A directory of JPEG frames of the synthetic video."""
+    from PIL import Image
+
+    video_dir = tmp_path_factory.mktemp("video")
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 64, size=(VIDEO_HEIGHT, VIDEO_WIDTH, 3))
+    for frame_idx in range(NUM_FRAMES):
+        frame = background.astype(np.uint8)
+        x, y = get_object_center(frame_idx)
+        frame[y - 15 : y + 15, x - 15 : x + 15] = (220, 60, 60)
+        Image.fromarray(frame).save(video_dir / f"{frame_idx:05d}.jpg", quality=95)
+    return str(video_dir)
@@ -0,0 +1,61 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from sam2.utils.amg import mask_to_rle_pytorch, rle_to_mask
+
+
+def _mask_to_rle_per_mask(tensor):
+    """The previous implementation of `mask_to_rle_pytorch`, encoding each mask."""
+    b, h, w = tensor.shape
+    tensor = tensor.permute(0, 2, 1).flatten(1)
+    diff = tensor[:, 1:] ^ tensor[:, :-1]
+    change_indices = diff.nonzero()
+    out = []
+    for i in range(b):
+        cur_idxs = change_indices[change_indices[:, 0] == i, 1]
+        cur_idxs = torch.cat(
+            [
+                torch.tensor([0], dtype=cur_idxs.dtype, device=cur_idxs.device),
+                cur_idxs + 1,
+                torch.tensor([h * w], dtype=cur_idxs.dtype, device=cur_idxs.device),
+            ]
+        )
+        btw_idxs = cur_idxs[1:] - cur_idxs[:-1]
+        counts = [] if tensor[i, 0] == 0 else [0]
+        counts.extend(btw_idxs.detach().cpu().tolist())
+        out.append({"size": [h, w], "counts": counts})
+    return out
+
+
+@pytest.mark.parametrize("shape", [(6, 24, 32), (3, 1, 17), (2, 1, 1)])
+def test_mask_to_rle_matches_per_mask_encoding(shape):
+    generator = torch.Generator().manual_seed(0)
+    masks = torch.rand(shape, generator=generator) > 0.5
+    # masks without any change, starting with either value
+    masks[0] = False
+    masks[-1] = True
+
+    rles = mask_to_rle_pytorch(masks)
+
+    assert rles == _mask_to_rle_per_mask(masks)
+    for rle, mask in zip(rles, masks):
+        assert (rle_to_mask(rle) == mask.numpy()).all()
+
+
+def test_mask_to_rle_of_blobs():
+    masks = torch.zeros(3, 40, 30, dtype=torch.bool)
+    masks[0, 5:20, 3:9] = True
+    masks[1, 30:, 25:] = True
+    masks[2, :, :2] = True
+    assert mask_to_rle_pytorch(masks) == _mask_to_rle_per_mask(masks)
+
+
+def test_mask_to_rle_without_masks():
+    assert mask_to_rle_pytorch(torch.zeros(0, 24, 32, dtype=torch.bool)) == []
@@ -0,0 +1,90 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from conftest import IMAGE_SIZE
+from sam2 import build_sam
+from sam2.build_sam import build_sam2_video_predictor
+
+CONFIG_FILE = "configs/sam2.1/sam2.1_hiera_t.yaml"
+
+
+def _build(ckpt_path, fast_init):
+    return build_sam2_video_predictor(
+        CONFIG_FILE,
+        ckpt_path=ckpt_path,
+        device="cpu",
+        image_size=IMAGE_SIZE,
+        fast_init=fast_init,
+    )
+
+
+def _get_tensors(module):
+    """All the tensors of a module: parameters, buffers and tensor attributes."""
+    tensors = dict(module.named_parameters())
+    tensors.update(module.named_buffers())
+    for name, submodule in module.named_modules():
+        for attr, value in vars(submodule).items():
+            if isinstance(value, torch.Tensor):
+                tensors[f"{name}.{attr}"] = value
+    return tensors
+
+
+def test_fast_init_matches_regular_init(predictor, tmp_path):
+    ckpt_path = tmp_path / "model.pt"
+    torch.save({"model": predictor.state_dict()}, ckpt_path)
+
+    expected = _get_tensors(_build(ckpt_path, fast_init=False))
+    actual = _get_tensors(_build(ckpt_path, fast_init=True))
+
+    assert actual.keys() == expected.keys()
+    for name, tensor in actual.items():
+        assert not tensor.is_meta, name
+        torch.testing.assert_close(tensor, expected[name], msg=name)
+
+
+def test_fast_init_does_not_affect_other_threads(predictor, tmp_path, monkeypatch):
+    ckpt_path = tmp_path / "model.pt"
+    torch.save({"model": predictor.state_dict()}, ckpt_path)
+
+    # another thread creates a module while the model is instantiated
+    instantiating, other_module_created = threading.Event(), threading.Event()
+    other_modules = []
+
+    def _create_other_module():
+        assert instantiating.wait(timeout=60)
+        other_modules.append(torch.nn.Linear(4, 4))
+        other_module_created.set()
+
+    instantiate = build_sam.instantiate
+
+    def _instantiate(*args, **kwargs):
+        instantiating.set()
+        assert other_module_created.wait(timeout=60)
+        return instantiate(*args, **kwargs)
+
+    monkeypatch.setattr(build_sam, "instantiate", _instantiate)
+    thread = threading.Thread(target=_create_other_module)
+    thread.start()
+    _build(ckpt_path, fast_init=True)
+    thread.join()
+
+    assert not other_modules[0].weight.is_meta
+
+
+def test_fast_init_rejects_incomplete_checkpoint(predictor, tmp_path):
+    state_dict = predictor.state_dict()
+    state_dict.pop("maskmem_tpos_enc")
+    ckpt_path = tmp_path / "model.pt"
+    torch.save({"model": state_dict}, ckpt_path)
+
+    with pytest.raises(RuntimeError):
+        _build(ckpt_path, fast_init=True)
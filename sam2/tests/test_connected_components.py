@@ -0,0 +1,130 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from sam2.utils.misc import _get_connected_components_kernel, get_connected_components
+
+# two masks with their known labeling (with 8-connectivity), the components being
+# numbered in raster order from 1
+MASKS = [
+    [
+        [1, 1, 0, 0, 0, 1],
+        [0, 1, 0, 0, 0, 1],
+        [0, 0, 1, 0, 0, 0],
+        [0, 0, 0, 0, 1, 1],
+        [1, 0, 0, 0, 1, 0],
+    ],
+    [
+        [0, 0, 0, 0, 0, 0],
+        [0, 1, 1, 1, 0, 0],
+        [0, 1, 0, 1, 0, 1],
+        [0, 1, 1, 1, 0, 0],
+        [0, 0, 0, 0, 0, 0],
+    ],
+]
+EXPECTED_LABELS = [
+    [
+        [1, 1, 0, 0, 0, 2],
+        [0, 1, 0, 0, 0, 2],
+        [0, 0, 1, 0, 0, 0],
+        [0, 0, 0, 0, 3, 3],
+        [4, 0, 0, 0, 3, 0],
+    ],
+    [
+        [0, 0, 0, 0, 0, 0],
+        [0, 1, 1, 1, 0, 0],
+        [0, 1, 0, 1, 0, 2],
+        [0, 1, 1, 1, 0, 0],
+        [0, 0, 0, 0, 0, 0],
+    ],
+]
+EXPECTED_COUNTS = [
+    [
+        [4, 4, 0, 0, 0, 2],
+        [0, 4, 0, 0, 0, 2],
+        [0, 0, 4, 0, 0, 0],
+        [0, 0, 0, 0, 3, 3],
+        [1, 0, 0, 0, 3, 0],
+    ],
+    [
+        [0, 0, 0, 0, 0, 0],
+        [0, 8, 8, 8, 0, 0],
+        [0, 8, 0, 8, 0, 1],
+        [0, 8, 8, 8, 0, 0],
+        [0, 0, 0, 0, 0, 0],
+    ],
+]
+
+
+@pytest.fixture(params=["cv2", "scipy", "cuda"])
+def device(request, monkeypatch):
+    """The device of the masks, with the backend labeling them selected."""
+    if request.param == "cuda":
+        if not torch.cuda.is_available() or _get_connected_components_kernel() is None:
+            pytest.skip("the CUDA extension is not available")
+        return "cuda"
+    pytest.importorskip(request.param)
+    if request.param == "scipy":
+        # make `import cv2` fail to fall back to SciPy
+        monkeypatch.setitem(sys.modules, "cv2", None)
+    return "cpu"
+
+
+def _assert_same_components(labels, expected_labels):
+    """Check that both labelings have the same components, whatever their numbers."""
+    assert ((labels > 0) == (expected_labels > 0)).all()
+    foreground = expected_labels > 0
+    pairs = set(zip(labels[foreground].tolist(), expected_labels[foreground].tolist()))
+    # the labels of both labelings match one to one
+    assert len({label for label, _ in pairs}) == len(pairs)
+    assert len({label for _, label in pairs}) == len(pairs)
+
+
+def test_connected_components_of_batched_masks(device):
+    mask = torch.tensor(MASKS, dtype=torch.bool, device=device)[:, None]
+    labels, counts = get_connected_components(mask)
+
+    assert labels.shape == counts.shape == mask.shape
+    assert labels.device == counts.device == mask.device
+    expected_labels = torch.tensor(EXPECTED_LABELS)[:, None]
+    for i in range(len(MASKS)):
+        _assert_same_components(labels[i].cpu(), expected_labels[i])
+    assert counts.cpu().tolist() == torch.tensor(EXPECTED_COUNTS)[:, None].tolist()
+
+
+def test_connected_components_of_empty_masks(device):
+    mask = torch.zeros(3, 1, 16, 24, dtype=torch.bool, device=device)
+    labels, counts = get_connected_components(mask)
+
+    assert labels.shape == counts.shape == mask.shape
+    assert not labels.any() and not counts.any()
+
+
+def test_connected_components_without_masks(device):
+    if device == "cuda":
+        pytest.skip("the CUDA extension expects at least one mask")
+    mask = torch.zeros(0, 1, 16, 24, dtype=torch.bool, device=device)
+    labels, counts = get_connected_components(mask)
+
+    assert labels.shape == counts.shape == mask.shape
+
+
+def test_cpu_connected_components_match_cuda_extension():
+    if not torch.cuda.is_available() or _get_connected_components_kernel() is None:
+        pytest.skip("the CUDA extension is not available")
+    generator = torch.Generator().manual_seed(0)
+    mask = torch.rand(4, 1, 64, 48, generator=generator) > 0.6
+    cpu_labels, cpu_counts = get_connected_components(mask)
+    cuda_labels, cuda_counts = get_connected_components(mask.cuda())
+
+    assert cuda_counts.cpu().tolist() == cpu_counts.tolist()
+    for i in range(mask.size(0)):
+        _assert_same_components(cuda_labels[i].cpu(), cpu_labels[i])
@@ -0,0 +1,54 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from conftest import get_object_center
+
+# prompts of 3 objects on frame 0: the moving square and two background points
+OBJECT_POINTS = {1: get_object_center(0), 2: (100, 20), 3: (20, 80)}
+
+
+def _track_objects(predictor, video_dir, **kwargs):
+    inference_state = predictor.init_state(video_dir)
+    for obj_id, point in OBJECT_POINTS.items():
+        predictor.add_new_points_or_box(
+            inference_state, frame_idx=0, obj_id=obj_id, points=[point], labels=[1]
+        )
+    return {
+        frame_idx: masks.clone()
+        for frame_idx, _, masks in predictor.propagate_in_video(
+            inference_state, output_mode="low_res_masks", **kwargs
+        )
+    }
+
+
+def test_object_chunks_skip_high_res_masks_like_a_single_batch(
+    predictor, video_dir, monkeypatch
+):
+    expected = _track_objects(predictor, video_dir, absence_patience=0)
+
+    skip_flags = []
+    track_step = predictor.track_step
+
+    def _track_step(*args, **kwargs):
+        skip_flags.append(kwargs.get("skip_high_res_if_absent", False))
+        return track_step(*args, **kwargs)
+
+    monkeypatch.setattr(predictor, "track_step", _track_step)
+    # a budget below one object splits the objects into chunks of one object
+    monkeypatch.setattr(predictor, "object_batch_memory_budget_mb", 1e-6)
+    actual = _track_objects(predictor, video_dir, absence_patience=0)
+
+    # with `absence_patience=0`, all the tracked frames may skip the high-res masks
+    assert any(skip_flags)
+    assert expected.keys() == actual.keys()
+    for frame_idx in expected:
+        torch.testing.assert_close(
+            actual[frame_idx], expected[frame_idx], atol=1e-3, rtol=1e-3
+        )
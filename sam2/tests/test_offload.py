@@ -0,0 +1,65 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from conftest import get_object_center
+
+
+class _RecordingOffloader:
+    """Stands in for `AsyncStateOffloader` to record the released outputs."""
+
+    def __init__(self):
+        self.released = []
+
+    def release(self, out):
+        self.released.append(out)
+
+    def synchronize(self):
+        pass
+
+
+def test_preflight_releases_non_cond_output_replaced_by_cond_output(
+    predictor, video_dir, monkeypatch
+):
+    state = predictor.init_state(video_dir)
+    predictor.add_new_points_or_box(
+        state, frame_idx=0, obj_id=1, points=[get_object_center(0)], labels=[1]
+    )
+    for _ in predictor.propagate_in_video(state, max_frame_num_to_track=3):
+        pass
+    replaced_out = state["output_dict"]["non_cond_frame_outputs"][2]
+
+    # a correction click on a tracked frame turns it into a conditioning frame
+    monkeypatch.setattr(predictor, "add_all_frames_to_correct_as_cond", True)
+    predictor.add_new_points_or_box(
+        state, frame_idx=2, obj_id=1, points=[get_object_center(2)], labels=[1]
+    )
+    offloader = _RecordingOffloader()
+    state["state_offloader"] = offloader
+    predictor.propagate_in_video_preflight(state)
+
+    assert 2 in state["output_dict"]["cond_frame_outputs"]
+    assert 2 not in state["output_dict"]["non_cond_frame_outputs"]
+    assert any(out is replaced_out for out in offloader.released)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+def test_pinned_buffers_are_reused_after_release():
+    from sam2.utils.offload import AsyncStateOffloader
+
+    offloader = AsyncStateOffloader("cuda")
+    tensor = torch.randn(2, 64, 16, 16, device="cuda")
+    out = {"maskmem_features": offloader.offload(tensor), "pred_masks": None}
+    offloader.synchronize()
+    assert torch.equal(out["maskmem_features"], tensor.cpu())
+    offloader.release(out)
+    assert len(offloader._offloaded) == 0
+    # the released buffer is handed out again for a tensor of the same size
+    buffer, _ = offloader.pool.acquire(tensor.shape, tensor.dtype)
+    assert buffer.data_ptr() == out["maskmem_features"].data_ptr()
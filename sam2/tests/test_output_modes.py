@@ -0,0 +1,75 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import torch.nn.functional as F
+
+from conftest import get_object_center
+from sam2.utils.misc import upsampled_masks_to_boxes
+
+
+def _get_interpolated_boxes(masks, size):
+    """The boxes of the masks upsampled with `F.interpolate`."""
+    upsampled = F.interpolate(
+        masks[:, None], size=size, mode="bilinear", align_corners=False
+    )[:, 0]
+    boxes = torch.zeros(masks.size(0), 4, dtype=torch.long)
+    has_box = torch.zeros(masks.size(0), dtype=torch.bool)
+    for obj_idx, mask in enumerate(upsampled > 0):
+        ys, xs = torch.nonzero(mask, as_tuple=True)
+        if ys.numel() > 0:
+            boxes[obj_idx] = torch.stack([xs.min(), ys.min(), xs.max(), ys.max()])
+            has_box[obj_idx] = True
+    return boxes, has_box
+
+
+@pytest.mark.parametrize("size", [(64, 64), (96, 128), (131, 77), (20, 30)])
+def test_upsampled_masks_to_boxes_match_interpolated_masks(size):
+    generator = torch.Generator().manual_seed(0)
+    masks = torch.full((6, 32, 32), -1.0)
+    # random blobs of different sizes
+    masks[0, 10:14, 3:20] = torch.rand(4, 17, generator=generator) + 0.1
+    masks[1, 0:2, 0:3] = 2.0
+    masks[2, 30:, 25:] = 0.5
+    masks[3] = torch.randn(32, 32, generator=generator)
+    masks[4, 16, 16] = 1.0
+    # masks[5] is empty
+
+    boxes, has_box = upsampled_masks_to_boxes(masks, size)
+    expected_boxes, expected_has_box = _get_interpolated_boxes(masks, size)
+
+    assert has_box.tolist() == expected_has_box.tolist() == [True] * 5 + [False]
+    assert boxes.tolist() == expected_boxes.tolist()
+
+
+def test_upsampled_masks_to_boxes_without_masks():
+    boxes, has_box = upsampled_masks_to_boxes(torch.zeros(0, 32, 32), (64, 64))
+    assert boxes.shape == (0, 4) and has_box.shape == (0,)
+
+
+def test_boxes_output_matches_video_res_masks(predictor, video_dir):
+    inference_state = predictor.init_state(video_dir)
+    predictor.add_new_points_or_box(
+        inference_state,
+        frame_idx=0,
+        obj_id=1,
+        points=[get_object_center(0)],
+        labels=[1],
+    )
+    video_res_masks = {
+        frame_idx: masks.clone()
+        for frame_idx, _, masks in predictor.propagate_in_video(inference_state)
+    }
+    for frame_idx, _, outputs in predictor.propagate_in_video(
+        inference_state, output_mode="boxes"
+    ):
+        mask = video_res_masks[frame_idx][0, 0] > 0
+        ys, xs = torch.nonzero(mask, as_tuple=True)
+        expected = [xs.min(), ys.min(), xs.max(), ys.max()] if ys.numel() else [0] * 4
+        assert outputs[0, :4].tolist() == [float(v) for v in expected]
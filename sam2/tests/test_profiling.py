@@ -0,0 +1,56 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import itertools
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from conftest import get_object_center, NUM_FRAMES
+from sam2.utils.profiling import StageProfiler
+
+
+def _start_session(predictor, video_dir):
+    inference_state = predictor.init_state(video_dir)
+    predictor.add_new_points_or_box(
+        inference_state,
+        frame_idx=0,
+        obj_id=1,
+        points=[get_object_center(0)],
+        labels=[1],
+    )
+    return inference_state
+
+
+def _count_stage(profiler, stage):
+    return sum(
+        record["type"] == "stage" and record["stage"] == stage
+        for record in profiler.records
+    )
+
+
+def test_interleaved_propagations_record_in_their_own_profilers(predictor, video_dir):
+    profiler_a, profiler_b = StageProfiler(), StageProfiler()
+    propagation_a = predictor.propagate_in_video(
+        _start_session(predictor, video_dir), profiler=profiler_a
+    )
+    # the second propagation ends first, while the first one is still running
+    propagation_b = predictor.propagate_in_video(
+        _start_session(predictor, video_dir),
+        max_frame_num_to_track=2,
+        profiler=profiler_b,
+    )
+    propagation_c = predictor.propagate_in_video(_start_session(predictor, video_dir))
+    for _ in itertools.zip_longest(propagation_a, propagation_b, propagation_c):
+        pass
+
+    # frame 0 has the click, so the model tracks all the other frames
+    assert _count_stage(profiler_a, "memory_attention") == NUM_FRAMES - 1
+    assert _count_stage(profiler_b, "memory_attention") == 2
+    for profiler, num_frames in [(profiler_a, NUM_FRAMES), (profiler_b, 3)]:
+        frames = [r for r in profiler.records if r["type"] == "frame"]
+        assert [r["frame_idx"] for r in frames] == list(range(num_frames))
@@ -0,0 +1,62 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from conftest import get_object_center
+
+# the session manager of the demo backend, which spills sessions with `save_state`
+from inference.session_manager import SessionManager
+
+# the clicks of two sessions: the moving square and a background point
+SESSION_POINTS = {"a": get_object_center(0), "b": (100, 20)}
+
+
+def _start_session(predictor, video_dir, point):
+    inference_state = predictor.init_state(video_dir)
+    predictor.add_new_points_or_box(
+        inference_state, frame_idx=0, obj_id=1, points=[point], labels=[1]
+    )
+    return inference_state
+
+
+def _propagate(predictor, inference_state, **kwargs):
+    return {
+        frame_idx: masks.clone()
+        for frame_idx, _, masks in predictor.propagate_in_video(
+            inference_state, **kwargs
+        )
+    }
+
+
+def test_sessions_keep_their_own_kalman_filter(samurai_predictor, video_dir):
+    predictor = samurai_predictor
+    # each session tracked alone, in two parts
+    expected = {}
+    for session_id, point in SESSION_POINTS.items():
+        inference_state = _start_session(predictor, video_dir, point)
+        _propagate(predictor, inference_state, max_frame_num_to_track=3)
+        expected[session_id] = _propagate(predictor, inference_state, start_frame_idx=4)
+
+    # both sessions tracked in turns, with session "a" spilled in between
+    sessions = SessionManager(predictor, ttl_seconds=3600, spill_mode="host")
+    for session_id, point in SESSION_POINTS.items():
+        inference_state = _start_session(predictor, video_dir, point)
+        sessions.add(session_id, inference_state, offload_video_to_cpu=False)
+        _propagate(predictor, inference_state, max_frame_num_to_track=3)
+    sessions._evict("a", sessions.get("a"))
+    assert sessions.get("a")["state"] is None
+    actual = {
+        "b": _propagate(predictor, sessions.get_state("b"), start_frame_idx=4),
+        "a": _propagate(predictor, sessions.get_state("a"), start_frame_idx=4),
+    }
+
+    for session_id in SESSION_POINTS:
+        assert actual[session_id].keys() == expected[session_id].keys()
+        for frame_idx, masks in expected[session_id].items():
+            torch.testing.assert_close(actual[session_id][frame_idx], masks)
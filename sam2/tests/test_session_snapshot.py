@@ -0,0 +1,86 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import shutil
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import sam2.sam2_video_predictor as sam2_video_predictor
+from conftest import get_object_center, NUM_FRAMES
+
+
+def _propagate(predictor, inference_state, **kwargs):
+    return {
+        frame_idx: masks.clone()
+        for frame_idx, _, masks in predictor.propagate_in_video(
+            inference_state, **kwargs
+        )
+    }
+
+
+def _start_tracking(predictor, video_dir):
+    """Track two objects over the first 4 frames of the video."""
+    inference_state = predictor.init_state(video_dir)
+    predictor.add_new_points_or_box(
+        inference_state,
+        frame_idx=0,
+        obj_id=1,
+        points=[get_object_center(0)],
+        labels=[1],
+    )
+    predictor.add_new_points_or_box(
+        inference_state, frame_idx=0, obj_id=2, points=[[100, 20]], labels=[1]
+    )
+    _propagate(predictor, inference_state, max_frame_num_to_track=3)
+    return inference_state
+
+
+def test_load_state_resumes_tracking_with_same_masks(predictor, video_dir, tmp_path):
+    inference_state = _start_tracking(predictor, video_dir)
+    snapshot_path = tmp_path / "session.pt"
+    predictor.save_state(inference_state, snapshot_path)
+    expected = _propagate(predictor, inference_state, start_frame_idx=4)
+
+    restored_state = predictor.load_state(snapshot_path, video_path=video_dir)
+    # the image features are only computed when tracking resumes
+    assert restored_state["cached_features"] == {}
+    actual = _propagate(predictor, restored_state, start_frame_idx=4)
+
+    assert expected.keys() == actual.keys() == set(range(4, NUM_FRAMES))
+    for frame_idx in expected:
+        torch.testing.assert_close(actual[frame_idx], expected[frame_idx])
+
+
+def test_video_hash_is_computed_once(predictor, video_dir, tmp_path, monkeypatch):
+    inference_state = _start_tracking(predictor, video_dir)
+    predictor.save_state(inference_state, tmp_path / "first.pt")
+    restored_state = predictor.load_state(tmp_path / "first.pt", video_path=video_dir)
+    assert restored_state["video_hash"] == inference_state["video_hash"]
+
+    def _fail(video_path):
+        raise AssertionError("the video was hashed again")
+
+    monkeypatch.setattr(sam2_video_predictor, "get_video_content_hash", _fail)
+    predictor.save_state(inference_state, tmp_path / "second.pt")
+    predictor.save_state(restored_state, tmp_path / "third.pt")
+
+
+def test_load_state_rejects_another_video(predictor, video_dir, tmp_path):
+    inference_state = _start_tracking(predictor, video_dir)
+    predictor.save_state(inference_state, tmp_path / "session.pt")
+    # the same frames in reverse order
+    other_video_dir = tmp_path / "other_video"
+    other_video_dir.mkdir()
+    for frame_idx in range(NUM_FRAMES):
+        shutil.copy(
+            os.path.join(video_dir, f"{NUM_FRAMES - 1 - frame_idx:05d}.jpg"),
+            other_video_dir / f"{frame_idx:05d}.jpg",
+        )
+    with pytest.raises(RuntimeError, match="doesn't match"):
+        predictor.load_state(tmp_path / "session.pt", video_path=str(other_video_dir))
@@ -0,0 +1,65 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("tensordict")
+
+from conftest import IMAGE_SIZE
+from hydra.utils import instantiate
+from sam2.build_sam import _compose_config, _get_image_size_overrides
+
+from training.loss_fns import MultiStepMultiMasksAndIous
+from training.utils.data_utils import collate_fn, Frame, Object, VideoDatapoint
+
+CONFIG_FILE = "configs/sam2.1/sam2.1_hiera_t.yaml"
+NUM_FRAMES = 3
+
+
+def _get_video():
+    """A video of a square moving right, with its mask on every frame."""
+    frames = []
+    for frame_idx in range(NUM_FRAMES):
+        mask = torch.zeros(IMAGE_SIZE, IMAGE_SIZE)
+        mask[96:160, 64 + 16 * frame_idx : 128 + 16 * frame_idx] = 1
+        image = torch.randn(3, IMAGE_SIZE, IMAGE_SIZE) * 0.1 + mask
+        objects = [Object(object_id=0, frame_index=frame_idx, segment=mask)]
+        frames.append(Frame(data=image, objects=objects))
+    return VideoDatapoint(frames=frames, video_id=0, size=(IMAGE_SIZE, IMAGE_SIZE))
+
+
+def test_validation_computes_the_losses_on_all_mask_candidates():
+    torch.manual_seed(0)
+    hydra_overrides = _get_image_size_overrides(IMAGE_SIZE) + [
+        "++model._target_=training.model.sam2.SAM2Train"
+    ]
+    model = instantiate(
+        _compose_config(CONFIG_FILE, tuple(hydra_overrides)).model, _recursive_=True
+    )
+    # validation runs the training model in eval mode
+    model.eval()
+    batch = collate_fn([_get_video()], dict_key="val")
+    loss = MultiStepMultiMasksAndIous(
+        weight_dict={"loss_mask": 20, "loss_dice": 1, "loss_iou": 1, "loss_class": 1},
+        supervise_all_iou=True,
+        iou_use_l1_loss=True,
+        pred_obj_scores=True,
+    )
+
+    with torch.no_grad():
+        outputs = model(batch)
+        losses = loss(outputs, batch.masks)
+
+    for frame_out in outputs:
+        for multimasks in frame_out["multistep_pred_multimasks_high_res"]:
+            assert multimasks.shape[-2:] == (IMAGE_SIZE, IMAGE_SIZE)
+    for name, value in losses.items():
+        assert torch.isfinite(value).all(), name
+
+
+def test_video_predictor_only_upsamples_the_selected_candidate(predictor):
+    assert not predictor.upsample_all_mask_candidates
@@ -0,0 +1,71 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import time
+
+import torch
+
+start = time.perf_counter()
+from sam2.build_sam import build_sam2_video_predictor  # noqa: E402
+
+IMPORT_TIME = time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="measure the time to build a SAM 2 video predictor, broken down "
+        "into config composition, model instantiation, checkpoint loading and moving "
+        "the model to the device"
+    )
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/samurai/sam2.1_hiera_b+.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default="./checkpoints/sam2.1_hiera_base_plus.pt",
+        help="path to the SAM 2 model checkpoint",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="device to build the predictor on",
+    )
+    parser.add_argument(
+        "--num_builds",
+        type=int,
+        default=3,
+        help="number of builds (the first one composes the config, the following "
+        "ones reuse the cached config) (default: 3)",
+    )
+    parser.add_argument(
+        "--slow_init",
+        action="store_true",
+        help="instantiate the model with random weights before loading the "
+        "checkpoint (i.e. without the meta-device fast path), for comparison",
+    )
+    args = parser.parse_args()
+
+    print(f"import sam2.build_sam: {IMPORT_TIME:.2f}s")
+    for i in range(args.num_builds):
+        predictor = build_sam2_video_predictor(
+            args.sam2_cfg,
+            args.sam2_checkpoint,
+            device=args.device,
+            fast_init=not args.slow_init,
+        )
+        times = ", ".join(f"{k} {v:.2f}s" for k, v in predictor.startup_times.items())
+        print(f"build {i + 1}: {times}")
+        del predictor
+
+
+if __name__ == "__main__":
+    main()
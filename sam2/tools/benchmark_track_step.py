@@ -0,0 +1,235 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+from sam2.build_sam import build_sam2_video_predictor
+from sam2.utils.profiling import StageProfiler
+
+
+MODEL_SIZES = {
+    "tiny": ("configs/samurai/sam2.1_hiera_t.yaml", "sam2.1_hiera_tiny.pt"),
+    "small": ("configs/samurai/sam2.1_hiera_s.yaml", "sam2.1_hiera_small.pt"),
+    "base_plus": ("configs/samurai/sam2.1_hiera_b+.yaml", "sam2.1_hiera_base_plus.pt"),
+    "large": ("configs/samurai/sam2.1_hiera_l.yaml", "sam2.1_hiera_large.pt"),
+}
+
+
+def _sync(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+@torch.inference_mode()
+def benchmark_propagation(
+    predictor,
+    video_path,
+    box,
+    num_frames,
+    num_warmup,
+    profiler=None,
+    state_offload="none",
+):
+    """
+    Return the per-frame latencies (in seconds) of `propagate_in_video`, optionally
+    recording its per-stage times in `profiler` (excluding the warmup frames).
+    `state_offload` is "none" to keep the inference state on the device, or "sync"
+    or "async" to offload it to CPU memory without or with the pinned buffers and
+    copy stream of `AsyncStateOffloader`.
+    """
+    device = predictor.device
+    state = predictor.init_state(
+        video_path,
+        offload_video_to_cpu=True,
+        offload_state_to_cpu=state_offload != "none",
+        async_offload_state=state_offload == "async",
+    )
+    predictor.add_new_points_or_box(state, frame_idx=0, obj_id=0, box=box)
+    max_frames = min(num_frames + num_warmup, state["num_frames"] - 1)
+    latencies = []
+    _sync(device)
+    start = time.perf_counter()
+    for frame_idx, _, _ in predictor.propagate_in_video(
+        state, max_frame_num_to_track=max_frames, profiler=profiler
+    ):
+        _sync(device)
+        end = time.perf_counter()
+        # frame 0 is the conditioning frame and doesn't go through the memory attention
+        if frame_idx > num_warmup:
+            latencies.append(end - start)
+        start = end
+    predictor.reset_state(state)
+    if len(latencies) == 0:
+        raise ValueError(
+            f"{video_path} has {state['num_frames']} frames, which is not enough to "
+            f"time any frame after the {num_warmup} warmup frames"
+        )
+    if profiler is not None:
+        profiler.records = [
+            record
+            for record in profiler.records
+            if record["frame_idx"] is not None and record["frame_idx"] > num_warmup
+        ]
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--video_path",
+        type=str,
+        required=True,
+        help="video to track on (an MP4 file or a directory of JPEG frames)",
+    )
+    parser.add_argument(
+        "--box",
+        type=float,
+        nargs=4,
+        default=[100, 100, 200, 200],
+        help="initial box prompt on frame 0 as x1 y1 x2 y2 (default: 100 100 200 200)",
+    )
+    parser.add_argument(
+        "--model_sizes",
+        type=str,
+        nargs="+",
+        default=list(MODEL_SIZES),
+        choices=list(MODEL_SIZES),
+        help="model sizes to benchmark (default: all SAMURAI configs)",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default="./checkpoints",
+        help="directory containing the SAM 2.1 checkpoints "
+        "(models without a checkpoint are benchmarked with random weights)",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="device to run the benchmark on",
+    )
+    parser.add_argument(
+        "--modes",
+        type=str,
+        nargs="+",
+        default=["eager", "compiled"],
+        choices=["eager", "compiled"],
+        help="whether to benchmark the eager and/or compiled track step "
+        "(default: both)",
+    )
+    parser.add_argument(
+        "--state_offload",
+        type=str,
+        default="none",
+        choices=["none", "sync", "async"],
+        help="where to keep the inference state: on the device (none), or offloaded "
+        "to CPU memory with blocking copies (sync) or through pinned buffers on a "
+        "copy stream (async) (default: none)",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="number of intra-op threads on CPU (default: all available CPUs)",
+    )
+    parser.add_argument(
+        "--num_frames",
+        type=int,
+        default=100,
+        help="number of timed frames per run (default: 100)",
+    )
+    parser.add_argument(
+        "--num_warmup",
+        type=int,
+        default=10,
+        help="number of untimed frames at the start of each run, which also covers "
+        "the compilation of the track step (default: 10)",
+    )
+    parser.add_argument(
+        "--image_size",
+        type=int,
+        default=None,
+        help="inference resolution, e.g. 512 or 768 (default: the config's 1024)",
+    )
+    parser.add_argument(
+        "--profile_dir",
+        type=str,
+        default=None,
+        help="if set, record the per-stage times and peak memory of each run (with a "
+        "device synchronization around each stage) and write them to "
+        "<profile_dir>/<model_size>_<mode>.jsonl",
+    )
+    args = parser.parse_args()
+    if args.num_frames < 1:
+        parser.error("--num_frames must be at least 1")
+    if args.num_warmup < 0:
+        parser.error("--num_warmup must be non-negative")
+
+    device = torch.device(args.device)
+    for model_size in args.model_sizes:
+        config_file, checkpoint_name = MODEL_SIZES[model_size]
+        ckpt_path = os.path.join(args.checkpoint_dir, checkpoint_name)
+        if not os.path.exists(ckpt_path):
+            print(f"{ckpt_path} not found, using random weights for {model_size}")
+            ckpt_path = None
+        for mode in args.modes:
+            compile_track_step = mode == "compiled"
+            predictor = build_sam2_video_predictor(
+                config_file=config_file,
+                ckpt_path=ckpt_path,
+                device=device,
+                hydra_overrides_extra=[
+                    f"++model.compile_track_step={str(compile_track_step).lower()}"
+                ],
+                num_threads=args.num_threads,
+                image_size=args.image_size,
+            )
+            profiler = None
+            if args.profile_dir is not None:
+                profiler = StageProfiler(device)
+            latencies = benchmark_propagation(
+                predictor,
+                args.video_path,
+                box=args.box,
+                num_frames=args.num_frames,
+                num_warmup=args.num_warmup,
+                profiler=profiler,
+                state_offload=args.state_offload,
+            )
+            print(
+                f"{model_size:>9s} {mode:>8s} ({device.type}, "
+                f"{predictor.image_size}px, state offload {args.state_offload}): "
+                f"mean {latencies.mean() * 1000:.1f} ms/frame, "
+                f"p50 {np.percentile(latencies, 50) * 1000:.1f} ms, "
+                f"p90 {np.percentile(latencies, 90) * 1000:.1f} ms "
+                f"({1 / latencies.mean():.1f} fps over {len(latencies)} frames)"
+            )
+            if profiler is not None:
+                os.makedirs(args.profile_dir, exist_ok=True)
+                profile_path = os.path.join(
+                    args.profile_dir, f"{model_size}_{mode}.jsonl"
+                )
+                profiler.write_jsonl(profile_path)
+                for stage, stats in profiler.summary()["stages"].items():
+                    peak = stats["peak_memory_mb"]
+                    print(
+                        f"    {stage:>16s}: mean {stats['mean_ms']:.2f} ms, "
+                        f"p90 {stats['p90_ms']:.2f} ms"
+                        + (f", peak {peak:.0f} MB" if peak is not None else "")
+                    )
+                print(f"    per-stage records written to {profile_path}")
+            del predictor
+            if device.type == "cuda":
+                torch.cuda.empty_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from sam2.build_sam import build_sam2_video_predictor
+
+
+@torch.inference_mode()
+def run_predictor(predictor, video_path, box, max_frames=None):
+    """Track `box` (given on frame 0) and return the per-frame mask logits and scores."""
+    state = predictor.init_state(video_path, offload_video_to_cpu=True)
+    predictor.add_new_points_or_box(state, frame_idx=0, obj_id=0, box=box)
+    outputs = {}
+    for frame_idx, _, video_res_masks in predictor.propagate_in_video(
+        state, max_frame_num_to_track=max_frames
+    ):
+        obj_output_dict = state["output_dict_per_obj"][0]
+        out = obj_output_dict["non_cond_frame_outputs"].get(frame_idx)
+        if out is None:
+            out = obj_output_dict["cond_frame_outputs"][frame_idx]
+        outputs[frame_idx] = {
+            "mask_logits": video_res_masks[0, 0].float().cpu(),
+            "object_score_logits": out["object_score_logits"].float().item(),
+        }
+    predictor.reset_state(state)
+    return outputs
+
+
+def compare_outputs(reference, candidate):
+    """Summarize the per-frame differences between two `run_predictor` results."""
+    mask_ious, logit_diffs, score_diffs = [], [], []
+    for frame_idx, ref_out in reference.items():
+        cand_out = candidate[frame_idx]
+        ref_mask = ref_out["mask_logits"] > 0
+        cand_mask = cand_out["mask_logits"] > 0
+        union = (ref_mask | cand_mask).sum().item()
+        inter = (ref_mask & cand_mask).sum().item()
+        # two empty masks count as a perfect match
+        mask_ious.append(inter / union if union > 0 else 1.0)
+        diff = (ref_out["mask_logits"] - cand_out["mask_logits"]).abs()
+        logit_diffs.append(diff.mean().item())
+        score_diffs.append(
+            abs(ref_out["object_score_logits"] - cand_out["object_score_logits"])
+        )
+    mask_ious = np.array(mask_ious)
+    return {
+        "num_frames": len(mask_ious),
+        "mean_mask_iou": float(mask_ious.mean()),
+        "min_mask_iou": float(mask_ious.min()),
+        "mean_abs_logit_diff": float(np.mean(logit_diffs)),
+        "max_abs_object_score_diff": float(np.max(score_diffs)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="compare the predictions of a SAM 2 video predictor variant "
+        "against the float32 reference on the same video"
+    )
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="configs/samurai/sam2.1_hiera_b+.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default="./checkpoints/sam2.1_hiera_base_plus.pt",
+        help="path to the SAM 2 model checkpoint",
+    )
+    parser.add_argument(
+        "--video_paths",
+        type=str,
+        nargs="+",
+        required=True,
+        help="videos to compare on (MP4 files or directories of JPEG frames)",
+    )
+    parser.add_argument(
+        "--box",
+        type=float,
+        nargs=4,
+        required=True,
+        help="initial box prompt on frame 0 as x1 y1 x2 y2",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="device to run the predictors on",
+    )
+    parser.add_argument(
+        "--max_frames",
+        type=int,
+        default=None,
+        help="maximum number of frames to track in each video (default: all)",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        default=None,
+        help='precision of the candidate predictor, either "fp32", "bf16" or "fp16" '
+        'for all components, or per component as e.g. "backbone=bf16,memory=bf16,decoder=fp32" '
+        "(default: fp32 with --quantize_int8 and bf16 otherwise)",
+    )
+    parser.add_argument(
+        "--quantize_int8",
+        action="store_true",
+        help="whether to apply int8 dynamic quantization to the candidate's memory "
+        "attention and mask decoder transformer (CPU only)",
+    )
+    parser.add_argument(
+        "--image_size",
+        type=int,
+        default=None,
+        help="inference resolution, e.g. 512 or 768 (default: the config's 1024)",
+    )
+    args = parser.parse_args()
+
+    precision = args.precision
+    if precision is None:
+        precision = "fp32" if args.quantize_int8 else "bf16"
+    if "=" in precision:
+        precision = dict(item.split("=") for item in precision.split(","))
+    reference = build_sam2_video_predictor(
+        args.sam2_cfg, args.sam2_checkpoint, device=args.device, precision="fp32"
+    )
+    candidate = build_sam2_video_predictor(
+        args.sam2_cfg,
+        args.sam2_checkpoint,
+        device=args.device,
+        precision=precision,
+        quantize_int8=args.quantize_int8,
+        image_size=args.image_size,
+    )
+    print(f"reference: {reference.precision_policy} at {reference.image_size}px")
+    print(
+        f"candidate: {candidate.precision_policy} at {candidate.image_size}px"
+        + (" with int8 dynamic quantization" if args.quantize_int8 else "")
+    )
+    for video_path in args.video_paths:
+        outputs, fps = [], []
+        for predictor in [reference, candidate]:
+            start = time.perf_counter()
+            outputs.append(
+                run_predictor(predictor, video_path, args.box, args.max_frames)
+            )
+            fps.append(len(outputs[-1]) / (time.perf_counter() - start))
+        stats = compare_outputs(*outputs)
+        print(
+            f"{video_path}: {stats['num_frames']} frames, "
+            f"mask IoU mean {stats['mean_mask_iou']:.4f} / min {stats['min_mask_iou']:.4f}, "
+            f"mean |logit diff| {stats['mean_abs_logit_diff']:.4f}, "
+            f"max |object score diff| {stats['max_abs_object_score_diff']:.4f}, "
+            f"fps {fps[0]:.2f} -> {fps[1]:.2f} ({fps[1] / fps[0]:.2f}x, "
+            "including video loading)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -34,7 +34,8 @@ def prepare_frames_or_path(video_path):
         raise ValueError("Invalid video_path format. Should be .mp4 or a directory of frames.")
 
 # Process one video + initial box, writing frame-by-frame tracking to CSV writer
-def process_tracking(predictor, video_path, start_frame, initial_bbox, writer):
+def process_tracking(predictor, video_path, start_frame, initial_bbox, writer, keyframe_interval=1,
+                     absence_patience=None):
     frames_or_path = prepare_frames_or_path(video_path)
     # Initialize tracker state
     state = predictor.init_state(frames_or_path, offload_video_to_cpu=True)
@@ -66,20 +67,22 @@ def process_tracking(predictor, video_path, start_frame, initial_bbox, writer):
     # Propagate the object mask throughout the video
     # We don't use start_frame_idx because it can cause KeyError in SAMURAI mode
     # when looking for previous frames that don't exist in the tracking history
-    for frame_idx, object_ids, masks in predictor.propagate_in_video(state):
+    # With keyframe_interval > 1, the frames between model runs are filled with the
+    # Kalman filter's box prediction (as box-shaped masks)
+    # With absence_patience set, frames where the target has been gone for that many frames
+    # only run a cheap re-detection until it reappears
+    # Only the boxes are used, so the predictor computes them directly from its low-res
+    # masks instead of upsampling full-resolution masks on every frame
+    for frame_idx, object_ids, boxes in predictor.propagate_in_video(
+        state, keyframe_interval=keyframe_interval, absence_patience=absence_patience,
+        output_mode="boxes"
+    ):
         # Only process and output frames from the start_frame onwards
         if frame_idx >= start_frame:
-            for obj_id, mask in zip(object_ids, masks):
-                # Convert mask to binary and compute bounding rectangle
-                mask_np = mask[0].cpu().numpy()
-                mask_bin = mask_np > 0.0
-                non_zero = np.argwhere(mask_bin)
-                if non_zero.size == 0:
-                    bbox = [0, 0, 0, 0]
-                else:
-                    y_min, x_min = non_zero.min(axis=0).tolist()
-                    y_max, x_max = non_zero.max(axis=0).tolist()
-                    bbox = [x_min, y_min, x_max - x_min, y_max - y_min]
+            for obj_id, box in zip(object_ids, boxes):
+                # Box as (x_min, y_min, x_max, y_max) in pixels, all zeros if the mask is empty
+                x_min, y_min, x_max, y_max = (int(v) for v in box[:4].tolist())
+                bbox = [x_min, y_min, x_max - x_min, y_max - y_min]
                 
                 # Calculate centroid
                 centroid_x = bbox[0] + bbox[2] / 2  # x + width/2
@@ -88,8 +91,7 @@ def process_tracking(predictor, video_path, start_frame, initial_bbox, writer):
                 # Store tracking result for this frame
                 tracking_results[frame_idx] = {
                     'bbox': bbox,
-                    'centroid': (centroid_x, centroid_y),
-                    'mask': mask_np
+                    'centroid': (centroid_x, centroid_y)
                 }
                 
                 # Write output row: video_path, frame, object_id, x, y, width, height, centroid_x, centroid_y
@@ -135,14 +137,21 @@ def process_tracking(predictor, video_path, start_frame, initial_bbox, writer):
     # Clean up state for this video
     del state
     gc.collect()
-    torch.cuda.empty_cache()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
 # Main entrypoint
 def main(args):
     
     # Determine SAM2 config and build predictor once
     model_cfg = determine_model_cfg(args.model_path)
-    predictor = build_sam2_video_predictor(model_cfg, args.model_path, device=args.device)
+    predictor = build_sam2_video_predictor(
+        model_cfg,
+        args.model_path,
+        device=args.device,
+        num_threads=args.num_threads,
+        image_size=args.image_size,
+    )
 
     # Open output CSV for writing tracking results
     output_csv = "tracking_results.csv"
@@ -160,7 +169,9 @@ def main(args):
                 w = float(row['width']); h = float(row['height'])
                 # Convert to SAM2 box format: (x1, y1, x2, y2)
                 initial_bbox = (int(x), int(y), int(x + w), int(y + h))
-                process_tracking(predictor, video_path, start_frame, initial_bbox, writer)
+                process_tracking(predictor, video_path, start_frame, initial_bbox, writer,
+                                 keyframe_interval=args.keyframe_interval,
+                                 absence_patience=args.absence_patience)
 
     # Final cleanup
     del predictor
@@ -171,6 +182,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Batch video tracking from boxes.csv using SAM2")
     parser.add_argument("--model_path", default="sam2/checkpoints/sam2.1_hiera_base_plus.pt",
                         help="Path to the SAM2 model checkpoint.")
-    parser.add_argument("--device", default="cuda:0", help="Compute device for inference.")
+    parser.add_argument("--device", default="cuda:0" if torch.cuda.is_available() else "cpu",
+                        help="Compute device for inference (defaults to CPU if CUDA is unavailable).")
+    parser.add_argument("--num_threads", type=int, default=None,
+                        help="Number of CPU threads for inference on CPU (default: all available CPUs).")
+    parser.add_argument("--keyframe_interval", type=int, default=1,
+                        help="Run the model on every k-th frame and fill the frames in between "
+                             "from the Kalman filter (useful for slow, smooth targets).")
+    parser.add_argument("--absence_patience", type=int, default=None,
+                        help="Number of frames without the target after which tracking switches "
+                             "to a cheap re-detection until it reappears (default: disabled).")
+    parser.add_argument("--image_size", type=int, default=None,
+                        help="Inference resolution, e.g. 512 or 768 for faster tracking (default: 1024).")
     args = parser.parse_args()
     main(args)
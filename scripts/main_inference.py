@@ -33,6 +33,8 @@ with open(testing_set, 'r') as f:
 
 exp_name = "samurai"
 model_name = "base_plus"
+# compute precision of the model components ("fp32", "bf16" or "fp16")
+precision = "fp16"
 
 checkpoint = f"sam2/checkpoints/sam2.1_hiera_{model_name}.pt"
 if model_name == "base_plus":
@@ -64,7 +66,8 @@ for vid, video in enumerate(test_videos):
 
     height, width = cv2.imread(osp.join(frame_folder, "00000001.jpg")).shape[:2]
 
-    predictor = build_sam2_video_predictor(model_cfg, checkpoint, device="cuda:0")
+    # the predictor runs each component under autocast in the given precision
+    predictor = build_sam2_video_predictor(model_cfg, checkpoint, device="cuda:0", precision=precision)
 
     predictions = []
 
@@ -73,7 +76,7 @@ for vid, video in enumerate(test_videos):
         out = cv2.VideoWriter(osp.join(vis_folder, f'{video_basename}.mp4'), fourcc, 30, (width, height))
 
     # Start processing frames
-    with torch.inference_mode(), torch.autocast("cuda", dtype=torch.float16):
+    with torch.inference_mode():
         state = predictor.init_state(frame_folder, offload_video_to_cpu=True, offload_state_to_cpu=True, async_loading_frames=True)
 
         prompts = load_lasot_gt(osp.join(video_folder, cat_name, video.strip(), "groundtruth.txt"))
@@ -81,14 +84,19 @@ for vid, video in enumerate(test_videos):
         bbox, track_label = prompts[0]
         frame_idx, object_ids, masks = predictor.add_new_points_or_box(state, box=bbox, frame_idx=0, obj_id=0)
 
-        for frame_idx, object_ids, masks in predictor.propagate_in_video(state):
+        # the masks are only needed for the visualization, otherwise only the boxes are computed
+        output_mode = "binary_masks" if save_to_video else "boxes"
+        for frame_idx, object_ids, masks in predictor.propagate_in_video(state, output_mode=output_mode):
             mask_to_vis = {}
             bbox_to_vis = {}
 
             assert len(masks) == 1 and len(object_ids) == 1, "Only one object is supported right now"
             for obj_id, mask in zip(object_ids, masks):
+                if output_mode == "boxes":
+                    x_min, y_min, x_max, y_max = (int(v) for v in mask[:4].tolist())
+                    bbox_to_vis[obj_id] = [x_min, y_min, x_max-x_min, y_max-y_min]
+                    continue
                 mask = mask[0].cpu().numpy()
-                mask = mask > 0.0
                 non_zero_indices = np.argwhere(mask)
                 if len(non_zero_indices) == 0:
                     bbox = [0, 0, 0, 0]
@@ -56,7 +56,7 @@ def split_list(video_list, num_chunks):
     chunk_size = len(video_list) // num_chunks
     return [video_list[i:i+chunk_size] for i in range(0, len(video_list), chunk_size)]
 
-def inference_chunk(dataset_path, tracker_name, model_name, chunk_videos, result_folder):
+def inference_chunk(dataset_path, tracker_name, model_name, chunk_videos, result_folder, precision="fp16"):
     exp_name = "test"
 
     model_ckpt, model_cfg = get_ckpt_and_cfg(tracker_name, model_name)
@@ -72,12 +72,13 @@ def inference_chunk(dataset_path, tracker_name, model_name, chunk_videos, result
 
         logger.info(f"Running video [{vid+1}/{len(chunk_videos)}]: {video} with {num_frames} frames ({height}x{width})")
 
-        predictor = build_sam2_video_predictor(model_cfg, model_ckpt, device="cuda:0")
+        # the predictor runs each component under autocast in the given precision
+        predictor = build_sam2_video_predictor(model_cfg, model_ckpt, device="cuda:0", precision=precision)
 
         predictions = []
 
         # Start processing frames
-        with torch.inference_mode(), torch.autocast("cuda", dtype=torch.float16):
+        with torch.inference_mode():
             state = predictor.init_state(frame_folder, offload_video_to_cpu=True, offload_state_to_cpu=True)
 
             prompts = load_gt(osp.join(dataset_path, cat_name, video.strip(), "groundtruth.txt"))
@@ -85,23 +86,15 @@ def inference_chunk(dataset_path, tracker_name, model_name, chunk_videos, result
             bbox, track_label = prompts[0]
             frame_idx, object_ids, masks = predictor.add_new_points_or_box(state, box=bbox, frame_idx=0, obj_id=0)
 
-            for frame_idx, object_ids, masks in predictor.propagate_in_video(state):
-                mask_to_vis = {}
+            # only the boxes are needed, so the masks are never upsampled to the frame resolution
+            for frame_idx, object_ids, boxes in predictor.propagate_in_video(state, output_mode="boxes"):
                 bbox_to_vis = {}
 
-                assert len(masks) == 1 and len(object_ids) == 1, "Only one object is supported right now"
-                for obj_id, mask in zip(object_ids, masks):
-                    mask = mask[0].cpu().numpy()
-                    mask = mask > 0.0
-                    non_zero_indices = np.argwhere(mask)
-                    if len(non_zero_indices) == 0:
-                        bbox = [0, 0, 0, 0]
-                    else:
-                        y_min, x_min = non_zero_indices.min(axis=0).tolist()
-                        y_max, x_max = non_zero_indices.max(axis=0).tolist()
-                        bbox = [x_min, y_min, x_max-x_min, y_max-y_min]
+                assert len(boxes) == 1 and len(object_ids) == 1, "Only one object is supported right now"
+                for obj_id, box in zip(object_ids, boxes):
+                    x_min, y_min, x_max, y_max = (int(v) for v in box[:4].tolist())
+                    bbox = [x_min, y_min, x_max-x_min, y_max-y_min]
                     bbox_to_vis[obj_id] = bbox
-                    mask_to_vis[obj_id] = mask
 
                 predictions.append(bbox_to_vis)        
             
@@ -126,6 +119,8 @@ def main():
     parser.add_argument("--num_chunks", type=int, default=1)
     parser.add_argument("--exp_name", type=str, default="test")
     parser.add_argument("--root_result_folder", type=str, default="results")
+    parser.add_argument("--precision", type=str, default="fp16", choices=["fp32", "bf16", "fp16"],
+                        help="Compute precision of the model components.")
     args = parser.parse_args()
 
     test_videos = load_test_video_list("data/LaSOT-ext/testing_set.txt")
@@ -137,7 +132,7 @@ def main():
 
     exp_result_folder = osp.join(args.root_result_folder, args.tracker_name, f"{args.exp_name}_{args.model_name}")
 
-    inference_chunk(args.dataset_path, args.tracker_name, args.model_name, chunk_videos, exp_result_folder)
+    inference_chunk(args.dataset_path, args.tracker_name, args.model_name, chunk_videos, exp_result_folder, precision=args.precision)
 
 if __name__ == "__main__":
     main()